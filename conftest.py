@@ -0,0 +1,13 @@
+import pytest
+
+
+@pytest.fixture(scope='session', autouse=True)
+def isolated_cache():
+    """Кэш тестов pytest — во временном файле, а настройки — из
+    TEST_SETTINGS, как у `manage.py test` (core/testing.py)."""
+    from django.test import override_settings
+
+    from core.testing import TEST_SETTINGS, isolated_cache
+
+    with isolated_cache(), override_settings(**TEST_SETTINGS):
+        yield
@@ -0,0 +1,98 @@
+from django.db import connection
+from django.test import Client, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from posts.models import Comment, Follow, Group, Post, User
+
+POSTS_COUNT = 13
+INDEX_URL = reverse('api:index')
+
+
+class ApiTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(username='author')
+        cls.reader = User.objects.create_user(username='reader')
+        cls.group = Group.objects.create(title='Группа', slug='group')
+        Follow.objects.create(user=cls.reader, author=cls.author)
+        cls.posts = [
+            Post.objects.create(text=f'Пост {i}', author=cls.author,
+                                group=cls.group)
+            for i in range(POSTS_COUNT)
+        ]
+        Comment.objects.create(post=cls.posts[-1], author=cls.reader,
+                               text='Комментарий')
+
+    def setUp(self):
+        self.client = Client()
+        self.client.force_login(self.reader)
+
+    def test_feeds_are_paginated(self):
+        """Ленты API отдаются курсорными страницами подряд."""
+        urls = (
+            INDEX_URL,
+            reverse('api:group_posts', args=[self.group.slug]),
+            reverse('api:profile', args=[self.author.username]),
+            reverse('api:follow_index'),
+        )
+        expected = [post.id for post in reversed(self.posts)]
+        for url in urls:
+            with self.subTest(url=url):
+                first = self.client.get(url).json()
+                second = self.client.get(url, {'after': first['next']}).json()
+                self.assertEqual(
+                    [row['id'] for row in first['results']
+                     + second['results']], expected)
+                self.assertIsNone(second['next'])
+                self.assertEqual(first['results'][0]['author'], 'author')
+                self.assertEqual(first['results'][0]['group'], 'group')
+
+    def test_field_projection(self):
+        """?fields= оставляет в ответе только нужные поля."""
+        response = self.client.get(
+            INDEX_URL, {'fields': 'id,comment_count,is_following'})
+        row = response.json()['results'][0]
+        self.assertEqual(row, {'id': self.posts[-1].id, 'comment_count': 1,
+                               'is_following': True})
+        response = self.client.get(INDEX_URL, {'fields': 'id,password'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_batch_lookup(self):
+        """?ids= отдаёт посты в порядке запроса одним запросом."""
+        ids = [self.posts[3].id, self.posts[1].id, 10 ** 6]
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(
+                INDEX_URL, {'ids': ','.join(map(str, ids)), 'fields': 'id'})
+        self.assertEqual(response.json()['results'],
+                         [{'id': ids[0]}, {'id': ids[1]}])
+        post_queries = [query for query in queries.captured_queries
+                        if 'posts_post' in query['sql']]
+        self.assertEqual(len(post_queries), 1)
+        too_many = ','.join(map(str, range(101)))
+        self.assertEqual(
+            self.client.get(INDEX_URL, {'ids': too_many}).status_code, 400)
+
+    def test_batch_lookup_rejects_out_of_range_ids(self):
+        """id, не помещающиеся в 64-битное поле, дают 400, а не 500."""
+        for ids in ('0', '-1', str(2 ** 63), f'1,{10 ** 30}'):
+            with self.subTest(ids=ids):
+                response = self.client.get(INDEX_URL, {'ids': ids})
+                self.assertEqual(response.status_code, 400)
+
+    def test_post_detail_and_comments(self):
+        """Пост и его комментарии; несуществующий пост — 404."""
+        post = self.posts[-1]
+        data = self.client.get(
+            reverse('api:post_detail', args=[post.id])).json()
+        self.assertEqual(data['text'], post.text)
+        comments = self.client.get(
+            reverse('api:post_comments', args=[post.id])).json()
+        self.assertEqual(comments['results'][0]['author'], 'reader')
+        response = self.client.get(reverse('api:post_detail', args=[0]))
+        self.assertEqual(response.status_code, 404)
+
+    def test_follow_requires_login(self):
+        """Лента подписок гостю недоступна."""
+        response = Client().get(reverse('api:follow_index'))
+        self.assertEqual(response.status_code, 401)
@@ -0,0 +1,267 @@
+from functools import partial
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import JsonResponse
+from django.views.decorators.http import require_GET
+
+from posts import feeds, shards
+from posts.models import Comment, Follow, Group, Inbox, Post, User
+from posts.utils import ID, cursor_paginate
+
+# Поля поста в ответе и пути к ним для .values()
+FIELDS = {
+    'id': 'id',
+    'text': 'text',
+    'pub_date': 'pub_date',
+    'updated': 'updated',
+    'author': 'author__username',
+    'group': 'group__slug',
+    'image': 'image',
+    'image_width': 'image_width',
+    'image_height': 'image_height',
+    'thumbnail': 'thumbnail',
+    'comment_count': 'comment_count',
+    'is_following': 'is_following',
+}
+DEFAULT_FIELDS = ('id', 'text', 'pub_date', 'author', 'group', 'image')
+COMMENT_FIELDS = {
+    'id': 'id',
+    'text': 'text',
+    'pub_date': 'pub_date',
+    'author': 'author__username',
+}
+# В шардах нет пользователей и групп: вместо соединений — id, а имена
+# дочитывает `attach` из основной базы
+SHARD_FIELDS = {
+    'author': 'author_id',
+    'group': 'group_id',
+}
+MAX_IDS = 100
+
+
+class ApiError(Exception):
+    def __init__(self, detail, status=400):
+        super().__init__(detail)
+        self.detail = detail
+        self.status = status
+
+
+def json_response(data, status=200):
+    return JsonResponse(data, status=status, encoder=DjangoJSONEncoder,
+                        json_dumps_params={'ensure_ascii': False})
+
+
+def api_view(view):
+    """GET-представление API: ошибки ApiError отдаются JSON-ом."""
+    @require_GET
+    def wrapper(request, *args, **kwargs):
+        try:
+            return json_response(view(request, *args, **kwargs))
+        except ApiError as error:
+            return json_response({'detail': error.detail}, error.status)
+    wrapper.__name__ = view.__name__
+    wrapper.__doc__ = view.__doc__
+    return wrapper
+
+
+def requested_fields(request):
+    """Поля из ?fields=a,b,c; без параметра — DEFAULT_FIELDS."""
+    names = request.GET.get('fields')
+    if not names:
+        return DEFAULT_FIELDS
+    names = tuple(dict.fromkeys(name.strip() for name in names.split(',')
+                                if name.strip()))
+    unknown = [name for name in names if name not in FIELDS]
+    if unknown:
+        raise ApiError(f'Неизвестные поля: {", ".join(unknown)}.')
+    return names
+
+
+def media_url(name):
+    return settings.MEDIA_URL + name if name else None
+
+
+def project(queryset, request, names, prefix='', authors=None):
+    """Строки .values() с нужными полями поста.
+
+    Подзапрос `is_following` добавляется, только если его запросили.
+    Возвращает queryset и функцию, превращающую строку в словарь
+    ответа. С шардами — `project_shards`, а `prefix` не нужен: ленты
+    читаются из самих постов.
+    """
+    if shards.enabled():
+        return project_shards(queryset, request, names, authors)
+    extra = {name: expression for name, expression
+             in feeds.annotations(request.user, prefix).items()
+             if name in names}
+    paths = {name: (name if name in extra else prefix + FIELDS[name])
+             for name in names}
+    # id и pub_date нужны курсору, даже если их не запросили
+    queryset = queryset.annotate(**extra).values(
+        *dict.fromkeys(['id', 'pub_date', *paths.values()]))
+
+    def serialize(row):
+        data = {name: row[path] for name, path in paths.items()}
+        if 'image' in data:
+            data['image'] = media_url(data['image'])
+        return data
+
+    return queryset, serialize
+
+
+def project_shards(queryset, request, names, authors=None):
+    """`project` для постов в шардах: слияние шардов (`shards.Merged`),
+    а `authors` ограничивает его шардами этих авторов."""
+    columns = [SHARD_FIELDS.get(name, FIELDS[name]) for name in names
+               if name not in feeds.EXTRAS]
+    queryset = queryset.values(
+        *dict.fromkeys(['id', 'pub_date', 'author_id', *columns]))
+    if authors is None:
+        querysets = shards.spread(queryset)
+    else:
+        querysets = shards.by_author(queryset, authors)
+
+    def serialize(row):
+        data = {name: row[name] for name in names}
+        if 'image' in data:
+            data['image'] = media_url(data['image'])
+        return data
+
+    return (shards.Merged(querysets, partial(attach, user=request.user,
+                                             names=names)),
+            serialize)
+
+
+def attach(rows, user, names):
+    """Авторы, группы и `is_following` строк из шардов — из основной
+    базы, по запросу на страницу."""
+    if 'author' in names:
+        usernames = dict(User.objects.filter(
+            pk__in={row['author_id'] for row in rows})
+            .values_list('pk', 'username'))
+    if 'group' in names:
+        slugs = dict(Group.objects.filter(
+            pk__in={row['group_id'] for row in rows})
+            .values_list('pk', 'slug'))
+    following = set()
+    if 'is_following' in names and user.is_authenticated and rows:
+        following = set(Follow.objects.filter(
+            user=user, author_id__in={row['author_id'] for row in rows})
+            .values_list('author_id', flat=True))
+    for row in rows:
+        if 'author' in names:
+            row['author'] = usernames.get(row['author_id'])
+        if 'group' in names:
+            row['group'] = slugs.get(row['group_id'])
+        if 'is_following' in names:
+            row['is_following'] = row['author_id'] in following
+
+
+def page(queryset, request, serialize,
+         per_page=settings.NUMBER_OF_POSTS):
+    page_obj = cursor_paginate(queryset, request, per_page)
+    return {
+        'results': [serialize(row) for row in page_obj],
+        'next': page_obj.paginator.next_cursor,
+        'previous': page_obj.paginator.previous_cursor,
+    }
+
+
+def posts_page(queryset, request, authors=None):
+    queryset, serialize = project(queryset, request,
+                                  requested_fields(request), authors=authors)
+    return page(queryset, request, serialize)
+
+
+def id_list(request):
+    try:
+        ids = [int(pk) for pk in request.GET['ids'].split(',') if pk]
+    except ValueError:
+        raise ApiError('ids — список чисел через запятую.')
+    if not all(pk in ID for pk in ids):
+        raise ApiError('id вне допустимого диапазона.')
+    if len(ids) > MAX_IDS:
+        raise ApiError(f'Не больше {MAX_IDS} id за раз.')
+    return list(dict.fromkeys(ids))
+
+
+@api_view
+def index(request):
+    """Лента всех постов; с ?ids= — посты по списку id одним запросом."""
+    if 'ids' not in request.GET:
+        return posts_page(Post.objects.all(), request)
+    ids = id_list(request)
+    queryset, serialize = project(Post.objects.filter(pk__in=ids),
+                                  request, requested_fields(request))
+    rows = {row['id']: row for row in queryset[:len(ids)]}
+    return {'results': [serialize(rows[pk]) for pk in ids if pk in rows]}
+
+
+@api_view
+def group_posts(request, slug):
+    group_id = (Group.objects.filter(slug=slug)
+                .values_list('pk', flat=True).first())
+    if group_id is None:
+        raise ApiError('Группа не найдена.', 404)
+    return posts_page(Post.objects.filter(group_id=group_id), request)
+
+
+@api_view
+def profile(request, username):
+    author_id = (User.objects.filter(username=username)
+                 .values_list('pk', flat=True).first())
+    if author_id is None:
+        raise ApiError('Автор не найден.', 404)
+    return posts_page(Post.objects.filter(author_id=author_id), request,
+                      authors=[author_id])
+
+
+@api_view
+def follow_index(request):
+    if not request.user.is_authenticated:
+        raise ApiError('Нужно войти.', 401)
+    if shards.enabled():
+        # Inbox ведётся только без шардов: ленту сливаем из шардов авторов
+        authors = (Follow.objects.filter(user=request.user)
+                   .values_list('author_id', flat=True))
+        return posts_page(Post.objects.all(), request, authors=authors)
+    queryset, serialize = project(
+        Inbox.objects.filter(user=request.user), request,
+        requested_fields(request), prefix='post__')
+    return page(queryset, request, serialize)
+
+
+@shards.redirect_moved
+@api_view
+def post_detail(request, post_id):
+    posts = Post.objects.using(shards.for_post(post_id)).filter(pk=post_id)
+    queryset, serialize = project(posts, request, requested_fields(request))
+    rows = list(queryset[:1])
+    if not rows:
+        raise ApiError('Пост не найден.', 404)
+    return serialize(rows[0])
+
+
+@shards.redirect_moved
+@api_view
+def post_comments(request, post_id):
+    alias = shards.for_post(post_id)
+    if not Post.objects.using(alias).filter(pk=post_id).exists():
+        raise ApiError('Пост не найден.', 404)
+    comments = Comment.objects.using(alias).filter(post_id=post_id)
+    if shards.enabled():
+        # Имена авторов — из основной базы, одним запросом на страницу
+        queryset = shards.Merged(
+            {alias: comments.values('id', 'pub_date', 'text', 'author_id')},
+            partial(attach, user=request.user, names={'author'}))
+        paths = {name: name for name in COMMENT_FIELDS}
+    else:
+        queryset = comments.values('id', 'pub_date',
+                                   *COMMENT_FIELDS.values())
+        paths = COMMENT_FIELDS
+
+    def serialize(row):
+        return {name: row[path] for name, path in paths.items()}
+
+    return page(queryset, request, serialize, settings.COMMENTS_PER_PAGE)
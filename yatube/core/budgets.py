@@ -0,0 +1,176 @@
+import os
+import re
+import sys
+import time
+from collections import Counter, namedtuple
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import connection, connections
+from django.template.base import Node
+
+Query = namedtuple('Query',
+                   'sql params many alias duration template source')
+Budget = namedtuple('Budget', 'queries duplicates time')
+# Полный текст SQL в отчёте обрезается, чтобы отчёт читался
+REPORT_SQL_LENGTH = 300
+# Списки IN (%s, %s, ...) разной длины и литералы в SQL не делают
+# запрос другим
+IN_LIST = re.compile(r'IN \((?:%s, )*%s\)')
+LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+\b")
+# Модули-обёртки вокруг запросов: источником запроса они не считаются
+WRAPPERS = ('core.budgets', 'core.timing')
+
+
+def budget(limits, check_time=False):
+    """Бюджет из словаря `limits` с ключами queries, duplicates и time.
+
+    Время SQL проверяется, только если `check_time`: иначе в бюджете
+    time=None.
+    """
+    limits = dict(limits)
+    if not check_time:
+        limits['time'] = None
+    return Budget(**limits)
+
+
+def normalize(sql):
+    """Вид запроса без значений: по нему запросы группируются."""
+    sql = IN_LIST.sub('IN (...)', ' '.join(sql.split()))
+    return LITERALS.sub('?', sql)
+
+
+def key(query):
+    return query.alias, normalize(query.sql)
+
+
+def template_line(frame):
+    """«шаблон:строка» узла шаблона, который сейчас рендерится."""
+    while frame is not None:
+        node = frame.f_locals.get('self')
+        # type(), а не isinstance(): isinstance у ленивых объектов вроде
+        # request.user сам полез бы в базу
+        if issubclass(type(node), Node) and getattr(node, 'token', None):
+            origin = getattr(node, 'origin', None)
+            name = getattr(origin, 'template_name', None) or origin
+            return f'{name}:{node.token.lineno}'
+        frame = frame.f_back
+    return None
+
+
+def source_line(frame):
+    """Ближайшая к запросу строка кода проекта, а не Django."""
+    while frame is not None:
+        path = os.path.abspath(frame.f_code.co_filename)
+        if (path.startswith(settings.BASE_DIR)
+                and 'site-packages' not in path
+                and frame.f_globals.get('__name__') not in WRAPPERS):
+            name = os.path.relpath(path, settings.BASE_DIR)
+            return f'{name}:{frame.f_lineno}'
+        frame = frame.f_back
+    return None
+
+
+def origin(query):
+    """Откуда пришёл запрос: строка шаблона и строка кода."""
+    return ', '.join(filter(None, (query.template, query.source)))
+
+
+def query_plan(query):
+    """План SELECT-запроса строками; для остальных запросов пусто."""
+    if query.many or not query.sql.lstrip().upper().startswith('SELECT'):
+        return []
+    using = connections[query.alias]
+    prefix = ('EXPLAIN QUERY PLAN' if using.vendor == 'sqlite'
+              else 'EXPLAIN')
+    with using.cursor() as cursor:
+        cursor.execute(f'{prefix} {query.sql}', query.params)
+        return [str(row[-1]) for row in cursor.fetchall()]
+
+
+class QueryRecorder:
+    """Записывает SQL-запросы вместе с тем, кто их вызвал.
+
+    Для каждого запроса запоминаются параметры, время выполнения, строка
+    шаблона (если запрос случился при рендеринге — типичный N+1) и
+    строка кода проекта, откуда он пришёл.
+    """
+
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        frame = sys._getframe(1)
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append(Query(
+                sql, params, many, context['connection'].alias,
+                time.perf_counter() - started,
+                template_line(frame), source_line(frame)))
+
+    @property
+    def time(self):
+        """Суммарное время SQL в миллисекундах."""
+        return sum(query.duration for query in self.queries) * 1000
+
+    def groups(self):
+        """Запросы, сгруппированные по базе и виду (normalize), в порядке
+        первого появления. Один и тот же запрос в разные шарды — не
+        повтор."""
+        groups = {}
+        for query in self.queries:
+            groups.setdefault(key(query), []).append(query)
+        return groups
+
+    def duplicates(self):
+        """Запросы, повторяющие уже выполненный с точностью до
+        параметров: столько лишних запросов даёт N+1."""
+        return sum(len(queries) - 1 for queries in self.groups().values())
+
+    def repeated(self, threshold):
+        """Группы `groups()`, в которых не меньше `threshold` запросов."""
+        return {group: queries
+                for group, queries in self.groups().items()
+                if len(queries) >= threshold}
+
+    def slow(self, threshold_ms):
+        """Запросы дольше `threshold_ms` миллисекунд."""
+        return [query for query in self.queries
+                if query.duration * 1000 > threshold_ms]
+
+    def violations(self, budget):
+        """Чем страница превысила бюджет; пустой список — уложилась."""
+        problems = []
+        if len(self.queries) > budget.queries:
+            problems.append(
+                f'запросов {len(self.queries)} > {budget.queries}')
+        duplicates = self.duplicates()
+        if duplicates > budget.duplicates:
+            problems.append(f'повторов {duplicates} > {budget.duplicates}')
+        if budget.time is not None and self.time > budget.time:
+            problems.append(f'время SQL {self.time:.1f} мс > '
+                            f'{budget.time} мс')
+        return problems
+
+    def report(self):
+        """Запросы по порядку: откуда пришли и сколько раз повторились."""
+        counts = Counter(map(key, self.queries))
+        lines = []
+        for number, query in enumerate(self.queries, 1):
+            where = origin(query)
+            repeated = counts[key(query)]
+            lines.append(
+                f'{number}. {query.duration * 1000:.1f} мс [{where}]'
+                + (f' ×{repeated}' if repeated > 1 else '')
+                + f'\n   {query.sql[:REPORT_SQL_LENGTH]}')
+        return '\n'.join(lines)
+
+
+@contextmanager
+def record_queries(using=connection):
+    """Контекст, в котором все запросы к базе пишутся в QueryRecorder."""
+    recorder = QueryRecorder()
+    with using.execute_wrapper(recorder):
+        yield recorder
@@ -0,0 +1,318 @@
+import os
+import pickle
+import sqlite3
+import threading
+import time
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS cache (
+        key TEXT PRIMARY KEY,
+        value BLOB NOT NULL,
+        expires REAL,
+        accessed REAL NOT NULL,
+        size INTEGER NOT NULL
+    ) WITHOUT ROWID;
+    CREATE INDEX IF NOT EXISTS cache_accessed ON cache (accessed);
+    CREATE INDEX IF NOT EXISTS cache_expires ON cache (expires);
+    CREATE TABLE IF NOT EXISTS cache_size (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        bytes INTEGER NOT NULL
+    );
+    INSERT OR IGNORE INTO cache_size VALUES (1, 0);
+    CREATE TRIGGER IF NOT EXISTS cache_insert AFTER INSERT ON cache BEGIN
+        UPDATE cache_size SET bytes = bytes + new.size;
+    END;
+    CREATE TRIGGER IF NOT EXISTS cache_delete AFTER DELETE ON cache BEGIN
+        UPDATE cache_size SET bytes = bytes - old.size;
+    END;
+    CREATE TRIGGER IF NOT EXISTS cache_update AFTER UPDATE OF size ON cache
+    BEGIN
+        UPDATE cache_size SET bytes = bytes - old.size + new.size;
+    END;
+'''
+# UPSERT, а не INSERT OR REPLACE: при REPLACE триггер удаления не
+# срабатывает, и счётчик байт разошёлся бы с таблицей
+UPSERT_SQL = '''
+    INSERT INTO cache (key, value, expires, accessed, size)
+    VALUES (?, ?, ?, ?, ?)
+    ON CONFLICT (key) DO UPDATE SET
+        value = excluded.value, expires = excluded.expires,
+        accessed = excluded.accessed, size = excluded.size
+'''
+# add() заменяет только просроченную запись
+ADD_SQL = UPSERT_SQL + '''
+    WHERE cache.expires IS NOT NULL AND cache.expires <= ?
+'''
+LIVE = '(expires IS NULL OR expires > ?)'
+# Вытеснение освобождает место с запасом, чтобы не срабатывать на
+# каждой следующей записи
+EVICT_TO = 0.9
+# Лимит параметров запроса в старых сборках SQLite
+MAX_PARAMS = 900
+INT64 = range(-2 ** 63, 2 ** 63)
+
+
+def locked(error):
+    """Ошибка блокировки SQLite: писатель держал файл дольше
+    BUSY_TIMEOUT."""
+    return (isinstance(error, sqlite3.OperationalError)
+            and 'locked' in str(error))
+
+
+def chunks(items, size=MAX_PARAMS):
+    items = list(items)
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+class SQLiteCache(BaseCache):
+    """Кэш в файле SQLite, общий для всех процессов хоста.
+
+    LocMemCache у каждого воркера свой: кэш холодный, а сброс в одном
+    воркере не доходит до остальных. Здесь все воркеры открывают один
+    файл (LOCATION) в режиме WAL: читатели не ждут писателя, а чтение
+    идёт через отображённую в память страницу (MMAP_SIZE).
+
+    Объём записей ограничен MAX_BYTES: при превышении удаляются
+    просроченные записи, а затем давно не читанные (LRU). Время
+    последнего чтения обновляется не чаще раза в TOUCH_INTERVAL секунд,
+    чтобы чтение не превращалось в запись. MAX_ENTRIES не учитывается.
+
+    Целые числа хранятся как есть, остальное — pickle. incr атомарен
+    между процессами: чтение и запись идут в транзакции BEGIN IMMEDIATE.
+
+    Если файл занят другим писателем дольше BUSY_TIMEOUT, чтение
+    считается промахом, а запись (set, set_many, add) пропускается:
+    кэш лишь ускоряет ответы. incr и удаление ошибку пробрасывают —
+    потерянный сброс оставил бы в кэше устаревшие страницы.
+    """
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self.location = location
+        self.max_bytes = options.get('MAX_BYTES', 64 * 1024 * 1024)
+        self.touch_interval = options.get('TOUCH_INTERVAL', 10)
+        self.mmap_size = options.get('MMAP_SIZE', 256 * 1024 * 1024)
+        self.busy_timeout = options.get('BUSY_TIMEOUT', 5)
+        self._local = threading.local()
+
+    @property
+    def db(self):
+        """Соединение потока; после fork открывается заново."""
+        local = self._local
+        if getattr(local, 'pid', None) != os.getpid():
+            local.db = self._connect()
+            local.pid = os.getpid()
+        return local.db
+
+    def _connect(self):
+        db = sqlite3.connect(self.location, timeout=self.busy_timeout,
+                             isolation_level=None,
+                             uri=self.location.startswith('file:'))
+        db.execute('PRAGMA journal_mode = WAL')
+        db.execute('PRAGMA synchronous = NORMAL')
+        db.execute(f'PRAGMA mmap_size = {int(self.mmap_size)}')
+        db.executescript(SCHEMA)
+        return db
+
+    def _key(self, key, version):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        return key
+
+    @staticmethod
+    def _encode(value):
+        if type(value) is int and value in INT64:
+            return value
+        return pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+
+    @staticmethod
+    def _decode(value):
+        if isinstance(value, int):
+            return value
+        return pickle.loads(value)
+
+    @staticmethod
+    def _size(key, value):
+        return len(key) + (8 if isinstance(value, int) else len(value))
+
+    def _transaction(self):
+        return Transaction(self.db)
+
+    def _touch_stale(self, rows, now):
+        """Обновляет время чтения; занятый файл — не повод ронять
+        чтение, запись откладывается до следующего раза."""
+        stale = [key for key, accessed in rows
+                 if now - accessed > self.touch_interval]
+        try:
+            for batch in chunks(stale):
+                self.db.execute(
+                    'UPDATE cache SET accessed = ? WHERE key IN ({})'.format(
+                        ', '.join('?' * len(batch))),
+                    [now, *batch])
+        except sqlite3.OperationalError as error:
+            if not locked(error):
+                raise
+
+    def _write(self, db, sql, key, value, timeout, now, *extra):
+        value = self._encode(value)
+        return db.execute(sql, [
+            key, value, self.get_backend_timeout(timeout), now,
+            self._size(key, value), *extra]).rowcount
+
+    def _evict(self, db, now):
+        """Укладывает записи в MAX_BYTES: сначала просроченные, затем
+        давно не читанные."""
+        total, = db.execute('SELECT bytes FROM cache_size').fetchone()
+        if total <= self.max_bytes:
+            return
+        db.execute('DELETE FROM cache WHERE expires <= ?', [now])
+        total, = db.execute('SELECT bytes FROM cache_size').fetchone()
+        excess = total - self.max_bytes * EVICT_TO
+        victims = []
+        for key, size in db.execute(
+                'SELECT key, size FROM cache ORDER BY accessed'):
+            if excess <= 0:
+                break
+            victims.append(key)
+            excess -= size
+        for batch in chunks(victims):
+            db.execute('DELETE FROM cache WHERE key IN ({})'.format(
+                ', '.join('?' * len(batch))), batch)
+
+    def get(self, key, default=None, version=None):
+        key = self._key(key, version)
+        now = time.time()
+        try:
+            row = self.db.execute(
+                f'SELECT value, accessed FROM cache WHERE key = ? AND {LIVE}',
+                [key, now]).fetchone()
+        except sqlite3.OperationalError as error:
+            if not locked(error):
+                raise
+            return default
+        if row is None:
+            return default
+        value, accessed = row
+        self._touch_stale([(key, accessed)], now)
+        return self._decode(value)
+
+    def get_many(self, keys, version=None):
+        keys = {self._key(key, version): key for key in keys}
+        now = time.time()
+        found, accessed = {}, []
+        try:
+            for batch in chunks(keys):
+                rows = self.db.execute(
+                    'SELECT key, value, accessed FROM cache '
+                    'WHERE key IN ({}) AND {}'.format(
+                        ', '.join('?' * len(batch)), LIVE),
+                    [*batch, now]).fetchall()
+                for key, value, last in rows:
+                    found[keys[key]] = self._decode(value)
+                    accessed.append((key, last))
+        except sqlite3.OperationalError as error:
+            if not locked(error):
+                raise
+            return {}
+        self._touch_stale(accessed, now)
+        return found
+
+    def has_key(self, key, version=None):
+        key = self._key(key, version)
+        return self.db.execute(
+            f'SELECT 1 FROM cache WHERE key = ? AND {LIVE}',
+            [key, time.time()]).fetchone() is not None
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self.set_many({key: value}, timeout, version)
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        now = time.time()
+        try:
+            with self._transaction() as db:
+                for key, value in data.items():
+                    self._write(db, UPSERT_SQL, self._key(key, version),
+                                value, timeout, now)
+                self._evict(db, now)
+        except sqlite3.OperationalError as error:
+            if not locked(error):
+                raise
+            # Как у BaseCache.set_many: ключи, которые не удалось записать
+            return list(data)
+        return []
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self._key(key, version)
+        now = time.time()
+        try:
+            with self._transaction() as db:
+                added = self._write(db, ADD_SQL, key, value, timeout, now,
+                                    now)
+                self._evict(db, now)
+        except sqlite3.OperationalError as error:
+            if not locked(error):
+                raise
+            return False
+        return bool(added)
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self._key(key, version)
+        now = time.time()
+        return bool(self.db.execute(
+            f'UPDATE cache SET expires = ? WHERE key = ? AND {LIVE}',
+            [self.get_backend_timeout(timeout), key, now]).rowcount)
+
+    def incr(self, key, delta=1, version=None):
+        key = self._key(key, version)
+        now = time.time()
+        with self._transaction() as db:
+            row = db.execute(
+                f'SELECT value FROM cache WHERE key = ? AND {LIVE}',
+                [key, now]).fetchone()
+            if row is None:
+                raise ValueError(f"Key '{key}' not found")
+            value = self._encode(self._decode(row[0]) + delta)
+            db.execute('UPDATE cache SET value = ?, size = ? WHERE key = ?',
+                       [value, self._size(key, value), key])
+        return self._decode(value)
+
+    def delete(self, key, version=None):
+        key = self._key(key, version)
+        return bool(self.db.execute('DELETE FROM cache WHERE key = ?',
+                                    [key]).rowcount)
+
+    def delete_many(self, keys, version=None):
+        keys = [self._key(key, version) for key in keys]
+        for batch in chunks(keys):
+            self.db.execute(
+                'DELETE FROM cache WHERE key IN ({})'.format(
+                    ', '.join('?' * len(batch))), batch)
+
+    def clear(self):
+        self.db.execute('DELETE FROM cache')
+
+
+class Transaction:
+    """BEGIN IMMEDIATE … COMMIT: блокировка на запись берётся сразу,
+    поэтому чтение внутри транзакции не устареет к моменту записи."""
+
+    def __init__(self, db):
+        self.db = db
+
+    def __enter__(self):
+        self.db.execute('BEGIN IMMEDIATE')
+        return self.db
+
+    def __exit__(self, exc_type, exc, traceback):
+        try:
+            if exc_type is None:
+                self.db.execute('COMMIT')
+        finally:
+            # Транзакция, оставшаяся открытой после ошибки (в том числе
+            # самого COMMIT), сломала бы следующий BEGIN
+            if self.db.in_transaction:
+                self.db.execute('ROLLBACK')
@@ -0,0 +1,76 @@
+import logging
+import random
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.db import OperationalError, connection, connections, router
+
+logger = logging.getLogger(__name__)
+
+LOCKED_MESSAGES = ('database is locked', 'database table is locked')
+
+
+def configure(sender, connection, **kwargs):
+    """Приёмник connection_created: PRAGMA из SQLITE_PRAGMAS.
+
+    journal_mode=WAL сохраняется в файле базы, остальные настройки
+    действуют на соединение, поэтому выполняются при каждом открытии;
+    при CONN_MAX_AGE соединение открывается редко.
+    """
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        for name, value in settings.SQLITE_PRAGMAS.items():
+            cursor.execute(f'PRAGMA {name} = {value}')
+
+
+def is_locked(error):
+    return any(message in str(error) for message in LOCKED_MESSAGES)
+
+
+def retry_on_lock(view):
+    """Повторяет запись, упавшую на блокировке SQLite, с паузами.
+
+    busy_timeout не спасает, когда транзакция сначала читала, а потом
+    пытается писать: SQLite сразу отвечает «database is locked», чтобы
+    не было взаимной блокировки. Такую транзакцию можно только начать
+    заново. Паузы растут вдвое, со случайной добавкой. Внутри внешней
+    транзакции повторять нельзя, там ошибка пробрасывается сразу.
+    Декоратор ставится снаружи transaction.atomic.
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        delay = settings.DB_RETRY_DELAY
+        for attempt in range(1, settings.DB_RETRY_ATTEMPTS + 1):
+            try:
+                return view(*args, **kwargs)
+            except OperationalError as error:
+                if (not is_locked(error) or connection.in_atomic_block
+                        or attempt == settings.DB_RETRY_ATTEMPTS):
+                    raise
+                logger.warning('База занята, попытка %s из %s: %s',
+                               attempt, settings.DB_RETRY_ATTEMPTS, error)
+                time.sleep(delay * (1 + random.random()))
+                delay *= 2
+    return wrapper
+
+
+def lock_for_write(model, using=None):
+    """Берёт блокировку SQLite на запись в начале транзакции.
+
+    Django открывает транзакцию как BEGIN DEFERRED, и блокировку на
+    запись SQLite берёт только на первой записи. Если перед ней
+    транзакция прочитала, например, наибольший id, другой процесс
+    может успеть вставить строку с тем же id. Пустой DELETE по таблице
+    `model` сразу берёт блокировку, как BEGIN IMMEDIATE: прочитанное
+    после него не устареет до записи, а другие писатели подождут
+    busy_timeout. Вне транзакции и в других базах ничего не делает.
+    """
+    using = using or router.db_for_write(model)
+    database = connections[using]
+    if database.vendor != 'sqlite' or not database.in_atomic_block:
+        return
+    with database.cursor() as cursor:
+        cursor.execute('DELETE FROM {} WHERE 0'.format(
+            database.ops.quote_name(model._meta.db_table)))
@@ -0,0 +1,86 @@
+import multiprocessing
+import os
+import random
+import tempfile
+import time
+from collections import Counter
+from itertools import accumulate
+
+from django.core.management.base import BaseCommand
+from django.utils.module_loading import import_string
+
+BACKENDS = (
+    ('LocMemCache', 'django.core.cache.backends.locmem.LocMemCache', None),
+    ('FileBasedCache', 'django.core.cache.backends.filebased.FileBasedCache',
+     'files'),
+    ('SQLiteCache', 'core.cache.SQLiteCache', 'cache.sqlite3'),
+)
+COUNTER = 'generation'
+
+
+def backend(path, location):
+    return import_string(path)(location or 'benchmark', {'TIMEOUT': None})
+
+
+def worker(path, location, number, options):
+    """Нагрузка одного воркера: чтение страниц с заполнением при
+    промахе, как cache_page и фрагменты шаблонов, и incr поколений."""
+    cache = backend(path, location)
+    rng = random.Random(number)
+    # Популярность ключей по закону Ципфа: немногие страницы горячие
+    weights = list(accumulate(1 / rank
+                              for rank in range(1, options['keys'] + 1)))
+    value = 'x' * options['value_size']
+    counts = Counter()
+    deadline = time.monotonic() + options['seconds']
+    while time.monotonic() < deadline:
+        if rng.random() < options['incr_share']:
+            cache.add(COUNTER, 0)
+            cache.incr(COUNTER)
+            counts['incr'] += 1
+            continue
+        key, = rng.choices(range(options['keys']), cum_weights=weights)
+        counts['get'] += 1
+        if cache.get(f'page:{key}') is None:
+            cache.set(f'page:{key}', value)
+        else:
+            counts['hit'] += 1
+    return counts
+
+
+class Command(BaseCommand):
+    help = ('Сравнивает бэкенды кэша под нагрузкой нескольких процессов, '
+            'как у воркеров gunicorn: LocMemCache, FileBasedCache и '
+            'SQLiteCache. Показывает операции в секунду, долю попаданий '
+            'и сколько увеличений общего счётчика потерялось.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=4)
+        parser.add_argument('--seconds', type=float, default=5)
+        parser.add_argument('--keys', type=int, default=5000)
+        parser.add_argument('--value-size', type=int, default=2048)
+        parser.add_argument(
+            '--incr-share', type=float, default=0.05,
+            help='Доля операций incr, от 0 до 1.',
+        )
+
+    def handle(self, *args, processes, **options):
+        context = multiprocessing.get_context('spawn')
+        with tempfile.TemporaryDirectory() as directory, \
+                context.Pool(processes) as pool:
+            for title, path, location in BACKENDS:
+                if location:
+                    location = os.path.join(directory, location)
+                counts = Counter()
+                for result in pool.starmap(
+                        worker, [(path, location, number, options)
+                                 for number in range(processes)]):
+                    counts.update(result)
+                shared = backend(path, location).get(COUNTER) or 0
+                operations = counts['get'] + counts['incr']
+                self.stdout.write(
+                    f'{title}: {operations / options["seconds"]:.0f} '
+                    f'операций/с, попаданий: '
+                    f'{counts["hit"] / max(counts["get"], 1):.1%}, '
+                    f'потеряно incr: {counts["incr"] - shared} '
+                    f'из {counts["incr"]}')
@@ -0,0 +1,130 @@
+import os
+import random
+import sqlite3
+import tempfile
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from core.db import is_locked
+
+SCHEMA = '''
+    CREATE TABLE post (id INTEGER PRIMARY KEY, text TEXT);
+    CREATE TABLE comment (
+        id INTEGER PRIMARY KEY, post_id INTEGER, text TEXT, pub_date REAL);
+    CREATE INDEX comment_post ON comment (post_id, pub_date DESC);
+'''
+POSTS = 1000
+
+
+class Command(BaseCommand):
+    help = ('Сравнивает пропускную способность SQLite с настройками по '
+            'умолчанию и с SQLITE_PRAGMAS, постоянным соединением и '
+            'повтором записи. Нагрузка похожа на ленту с комментариями: '
+            'потоки читают комментарии поста и добавляют новые в '
+            'транзакции «прочитать, потом записать», как add_comment.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=8)
+        parser.add_argument('--seconds', type=float, default=5)
+        parser.add_argument(
+            '--write-share', type=float, default=0.2,
+            help='Доля запросов на запись, от 0 до 1.',
+        )
+
+    def handle(self, *args, threads, seconds, write_share, **options):
+        with tempfile.TemporaryDirectory() as directory:
+            for title, tuned in (('по умолчанию', False),
+                                 ('SQLITE_PRAGMAS', True)):
+                path = os.path.join(directory, f'{tuned}.sqlite3')
+                self.prepare(path)
+                counts = self.run(path, tuned, threads, seconds,
+                                  write_share)
+                self.stdout.write(
+                    f'{title}: {counts["reads"] / seconds:.0f} чтений/с, '
+                    f'{counts["writes"] / seconds:.0f} записей/с, '
+                    f'ошибок блокировки: {counts["locked"]}, '
+                    f'повторов: {counts["retries"]}')
+
+    def prepare(self, path):
+        with sqlite3.connect(path) as db:
+            db.executescript(SCHEMA)
+            db.executemany('INSERT INTO post (text) VALUES (?)',
+                           [('пост',)] * POSTS)
+
+    def connect(self, path, tuned):
+        # isolation_level=None: транзакциями управляем сами, как Django
+        db = sqlite3.connect(path, isolation_level=None,
+                             check_same_thread=False)
+        if tuned:
+            for name, value in settings.SQLITE_PRAGMAS.items():
+                db.execute(f'PRAGMA {name} = {value}')
+        return db
+
+    def run(self, path, tuned, threads, seconds, write_share):
+        counts = Counter()
+        lock = threading.Lock()
+        deadline = time.monotonic() + seconds
+
+        def worker(number):
+            rng = random.Random(number)
+            local = Counter()
+            db = self.connect(path, tuned) if tuned else None
+            while time.monotonic() < deadline:
+                # Без CONN_MAX_AGE Django открывает соединение на запрос
+                request_db = db or self.connect(path, tuned)
+                post_id = rng.randint(1, POSTS)
+                try:
+                    if rng.random() < write_share:
+                        self.write(request_db, post_id, tuned, local)
+                        local['writes'] += 1
+                    else:
+                        request_db.execute(
+                            'SELECT id, text FROM comment WHERE post_id = ? '
+                            'ORDER BY pub_date DESC LIMIT 20',
+                            [post_id]).fetchall()
+                        local['reads'] += 1
+                except sqlite3.OperationalError as error:
+                    if not is_locked(error):
+                        raise
+                    local['locked'] += 1
+                finally:
+                    if db is None:
+                        request_db.close()
+            if db is not None:
+                db.close()
+            with lock:
+                counts.update(local)
+
+        workers = [threading.Thread(target=worker, args=(number,))
+                   for number in range(threads)]
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+        return counts
+
+    def write(self, db, post_id, retry, counts):
+        delay = settings.DB_RETRY_DELAY
+        attempts = settings.DB_RETRY_ATTEMPTS if retry else 1
+        for attempt in range(1, attempts + 1):
+            try:
+                db.execute('BEGIN')
+                db.execute('SELECT COUNT(*) FROM comment WHERE post_id = ?',
+                           [post_id]).fetchone()
+                db.execute('INSERT INTO comment (post_id, text, pub_date) '
+                           'VALUES (?, ?, ?)',
+                           [post_id, 'комментарий', time.time()])
+                db.execute('COMMIT')
+                return
+            except sqlite3.OperationalError as error:
+                if db.in_transaction:
+                    db.execute('ROLLBACK')
+                if not is_locked(error) or attempt == attempts:
+                    raise
+                counts['retries'] += 1
+                time.sleep(delay * (1 + random.random()))
+                delay *= 2
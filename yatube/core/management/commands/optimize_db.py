@@ -0,0 +1,43 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+
+class Command(BaseCommand):
+    help = ('Обслуживание базы: PRAGMA optimize, при --analyze полный '
+            'ANALYZE, при --checkpoint сброс WAL в файл базы. Запускать по '
+            'расписанию, например cron: раз в час optimize_db, ночью '
+            'optimize_db --analyze --checkpoint.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default='default')
+        parser.add_argument(
+            '--analyze', action='store_true',
+            help='Пересобрать статистику всех таблиц и индексов.',
+        )
+        parser.add_argument(
+            '--checkpoint', action='store_true',
+            help='Перенести WAL в базу и обрезать его (только SQLite).',
+        )
+
+    def handle(self, *args, database, analyze, checkpoint, **options):
+        connection = connections[database]
+        sqlite = connection.vendor == 'sqlite'
+        statements = []
+        if analyze:
+            statements.append('ANALYZE')
+        if sqlite:
+            # optimize пересчитывает статистику только там, где она
+            # устарела, поэтому дёшев и годится для частого запуска
+            statements.append('PRAGMA optimize')
+            if checkpoint:
+                statements.append('PRAGMA wal_checkpoint(TRUNCATE)')
+        with connection.cursor() as cursor:
+            for sql in statements:
+                started = time.monotonic()
+                cursor.execute(sql)
+                if cursor.description:
+                    cursor.fetchall()
+                self.stdout.write(
+                    f'{sql}: {time.monotonic() - started:.2f} с')
@@ -0,0 +1,53 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS
+
+from core.routers import copy_database, mark_synced
+
+
+class Command(BaseCommand):
+    help = ('Копирует основную SQLite-базу в реплики DATABASE_REPLICAS: '
+            'замена репликации для локальной проверки роутера. С '
+            '--interval повторяет копирование, имитируя отставание '
+            'реплики. Время каждой копии запоминается в кэше: по нему '
+            'страницы решают, можно ли кэшировать прочитанное из реплики.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--interval', type=float, default=0,
+            help='Пауза между копиями в секундах; 0 — скопировать один раз.',
+        )
+        parser.add_argument(
+            '--replica', action='append', dest='replicas', default=[],
+            help='Псевдоним реплики; по умолчанию все из DATABASE_REPLICAS.',
+        )
+
+    def handle(self, *args, interval, replicas, **options):
+        replicas = replicas or settings.DATABASE_REPLICAS
+        if not replicas:
+            raise CommandError('Реплики не заданы: укажите --replica или '
+                               'DATABASE_REPLICAS.')
+        source = settings.DATABASES[DEFAULT_DB_ALIAS]
+        targets = []
+        for alias in replicas:
+            target = settings.DATABASES.get(alias)
+            if target is None:
+                raise CommandError(f'Нет базы {alias} в DATABASES.')
+            if 'sqlite3' not in target['ENGINE']:
+                raise CommandError(f'{alias}: копировать можно только '
+                                   f'SQLite.')
+            targets.append((alias, target['NAME']))
+        while True:
+            for alias, name in targets:
+                # Копия видит всё, что закоммичено до начала копирования
+                synced = time.time()
+                started = time.monotonic()
+                copy_database(source['NAME'], name)
+                mark_synced(alias, synced)
+                self.stdout.write(
+                    f'{alias}: {time.monotonic() - started:.2f} с')
+            if not interval:
+                break
+            time.sleep(interval)
@@ -0,0 +1,140 @@
+import json
+import logging
+import random
+from collections import Counter
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+from . import routers, timing
+from .budgets import QueryRecorder, origin, query_plan
+
+logger = logging.getLogger('core.timing')
+queries_logger = logging.getLogger('core.queries')
+slow_logger = logging.getLogger('core.slow_queries')
+
+
+class TimingMiddleware:
+    """Разбивка времени запроса: SQL, кэш, шаблоны, миниатюры.
+
+    В выборку попадает доля запросов REQUEST_TIMING_SAMPLE_RATE. Для
+    них показатели пишутся строкой JSON в лог core.timing, а сотрудникам
+    (is_staff) и при DEBUG ещё и отдаются в заголовке Server-Timing
+    (видны во вкладке Network браузера): посторонним число запросов и
+    время кэша знать незачем. Время шаблонов включает SQL и кэш,
+    вызванные при рендеринге.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        timing.instrument({type(caches[alias]) for alias in settings.CACHES})
+
+    def __call__(self, request):
+        if random.random() >= settings.REQUEST_TIMING_SAMPLE_RATE:
+            return self.get_response(request)
+        with timing.collect() as measured, ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(
+                    connection.execute_wrapper(timing.record_query))
+            response = self.get_response(request)
+        if self.exposed(request):
+            response['Server-Timing'] = measured.server_timing()
+        logger.info(json.dumps({
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            **measured.metrics(),
+        }))
+        return response
+
+    @staticmethod
+    def exposed(request):
+        """Можно ли показать разбивку времени в ответе."""
+        if settings.DEBUG:
+            return True
+        user = getattr(request, 'user', None)
+        return user is not None and user.is_staff
+
+
+class QueryInspectorMiddleware:
+    """Ищет N+1 и медленные запросы; для отладки и стенда.
+
+    Работает при DEBUG или QUERY_INSPECTOR. SQL запроса группируется по
+    виду (без значений параметров); виды, повторённые не меньше
+    QUERY_REPEAT_THRESHOLD раз, пишутся в лог core.queries вместе со
+    строками шаблонов и кода, откуда пришли повторы. Запросы дольше
+    SLOW_QUERY_MS пишутся в лог core.slow_queries с планом выполнения.
+    """
+
+    def __init__(self, get_response):
+        if not (settings.DEBUG or settings.QUERY_INSPECTOR):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        recorder = QueryRecorder()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(recorder))
+            response = self.get_response(request)
+        self.report(request, recorder)
+        return response
+
+    def report(self, request, recorder):
+        where = f'{request.method} {request.path}'
+        repeated = recorder.repeated(settings.QUERY_REPEAT_THRESHOLD)
+        for (_, statement), queries in repeated.items():
+            origins = Counter(origin(query) for query in queries)
+            places = '\n'.join(
+                f'  {count}× {place}'
+                for place, count in origins.most_common())
+            queries_logger.warning(
+                '%s: запрос повторён %s раз\n  %s\n%s', where,
+                len(queries), statement, places)
+        for query in recorder.slow(settings.SLOW_QUERY_MS):
+            plan = '\n'.join(f'  {line}' for line in query_plan(query))
+            slow_logger.warning(
+                '%s: %.1f мс [%s]\n  %s\n  params: %r\n%s', where,
+                query.duration * 1000, origin(query), query.sql,
+                query.params, plan)
+
+
+class ReplicaMiddleware:
+    """Читать свои записи: после записи пользователь несколько секунд
+    читает из основной базы, пока реплики её не догонят.
+
+    Запрос, который пишет (не GET/HEAD/OPTIONS или представление с
+    @primary), целиком идёт в основную базу и ставит cookie
+    REPLICA_PIN_COOKIE на REPLICA_PIN_SECONDS; пока cookie жива, все
+    запросы пользователя, включая редирект после записи, тоже читают из
+    основной базы. Остальные запросы читают из одной реплики, выбранной
+    на весь запрос.
+    """
+    SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request.writes = request.method not in self.SAFE_METHODS
+        replicas = settings.DATABASE_REPLICAS
+        if request.writes or settings.REPLICA_PIN_COOKIE in request.COOKIES:
+            with routers.pinned():
+                response = self.get_response(request)
+        elif replicas:
+            with routers.replica(random.choice(replicas)):
+                response = self.get_response(request)
+        else:
+            response = self.get_response(request)
+        if request.writes:
+            response.set_cookie(settings.REPLICA_PIN_COOKIE, '1',
+                                max_age=settings.REPLICA_PIN_SECONDS,
+                                httponly=True)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if getattr(view_func, 'use_primary', False):
+            request.writes = True
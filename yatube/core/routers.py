@@ -0,0 +1,119 @@
+import random
+import sqlite3
+import threading
+from contextlib import contextmanager
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections
+
+_state = threading.local()
+
+
+def synced_key(alias):
+    return f'replica:synced:{alias}'
+
+
+def is_pinned():
+    return getattr(_state, 'pinned', 0) > 0
+
+
+@contextmanager
+def pinned():
+    """Внутри блока все чтения идут в основную базу."""
+    _state.pinned = getattr(_state, 'pinned', 0) + 1
+    try:
+        yield
+    finally:
+        _state.pinned -= 1
+
+
+@contextmanager
+def replica(alias):
+    """Внутри блока чтения без закрепления идут в реплику `alias`.
+
+    ReplicaMiddleware выбирает одну реплику на весь запрос: иначе ETag
+    и страница могли бы прийти из реплик, отстающих по-разному.
+    """
+    previous = getattr(_state, 'replica', None)
+    _state.replica = alias
+    try:
+        yield
+    finally:
+        _state.replica = previous
+
+
+def current_replica():
+    """Реплика, из которой сейчас идёт чтение; None — из основной базы."""
+    replicas = settings.DATABASE_REPLICAS
+    if (not replicas or is_pinned()
+            or connections[DEFAULT_DB_ALIAS].in_atomic_block):
+        return None
+    chosen = getattr(_state, 'replica', None)
+    return chosen if chosen in replicas else random.choice(replicas)
+
+
+def mark_synced(alias, timestamp):
+    """Запоминает, что реплика `alias` видит все записи, закоммиченные
+    до `timestamp` (time.time())."""
+    cache.set(synced_key(alias), timestamp, None)
+
+
+def synced_at(alias):
+    """С какого времени реплика может не видеть записей; None, если
+    это неизвестно."""
+    return cache.get(synced_key(alias))
+
+
+def primary(view):
+    """Отмечает представление, которое пишет в базу: оно целиком
+    работает с основной базой, а пользователь после него какое-то время
+    читает только из неё (ReplicaMiddleware).
+
+    Нужно для представлений, которые пишут по GET, как подписка;
+    POST-запросы закрепляются за основной базой и так.
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        with pinned():
+            return view(*args, **kwargs)
+    wrapper.use_primary = True
+    return wrapper
+
+
+class PrimaryReplicaRouter:
+    """Запись — в основную базу, чтение — в реплику из
+    DATABASE_REPLICAS: выбранную на запрос (`replica`) или случайную.
+
+    Чтение остаётся в основной базе, если запрос закреплён за ней
+    (pinned) или идёт внутри транзакции: реплика ещё не видит того, что
+    транзакция записала. Без реплик роутер ни во что не вмешивается.
+    """
+
+    def db_for_read(self, model, **hints):
+        return current_replica() or DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Реплика — копия основной базы, объекты из них можно связывать
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db not in settings.DATABASE_REPLICAS
+
+
+def copy_database(source, target):
+    """Согласованный снимок SQLite-файла `source` в файл `target`.
+
+    Замена настоящей репликации для локальной проверки: backup API
+    копирует базу постранично и не мешает писателям.
+    """
+    origin, replica = sqlite3.connect(source), sqlite3.connect(target)
+    try:
+        origin.backup(replica)
+    finally:
+        origin.close()
+        replica.close()
@@ -0,0 +1,48 @@
+import copy
+import os
+import tempfile
+
+from django.conf import settings
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+
+# Настройки на всё время тестов: сэмплированные строки JSON из
+# core.timing засоряли бы вывод; тесты замера включают его сами
+TEST_SETTINGS = {'REQUEST_TIMING_SAMPLE_RATE': 0}
+
+
+class isolated_cache(override_settings):
+    """override_settings, переносящий кэш в свой временный файл.
+
+    Записи прошлых запусков и параллельно идущих тестов не должны
+    попадать в ответы; файл удаляется вместе с отменой переопределения.
+    """
+
+    def enable(self):
+        self.directory = tempfile.TemporaryDirectory(prefix='yatube-cache-')
+        caches = copy.deepcopy(settings.CACHES)
+        caches['default']['LOCATION'] = os.path.join(self.directory.name,
+                                                     'cache.sqlite3')
+        self.options = {'CACHES': caches}
+        super().enable()
+
+    def disable(self):
+        super().disable()
+        self.directory.cleanup()
+
+
+class TestRunner(DiscoverRunner):
+    """`manage.py test` с кэшем во временном файле (`isolated_cache`) и
+    настройками TEST_SETTINGS."""
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self.overrides = [isolated_cache(), override_settings(**TEST_SETTINGS)]
+        for override in self.overrides:
+            override.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        for override in reversed(self.overrides):
+            override.disable()
+        super().teardown_test_environment(**kwargs)
@@ -0,0 +1,152 @@
+import os
+from io import StringIO
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db.models import Count
+from django.template import Context, Template
+from django.test import Client, TestCase
+from django.urls import reverse
+
+import about.urls
+import posts.urls
+import users.urls
+from posts.models import Post, User
+
+from ..budgets import (Budget, Query, QueryRecorder, budget,
+                       record_queries)
+
+URL_MODULES = (posts.urls, users.urls, about.urls)
+# Страницы, которые пишут в базу: они проверяются запросом POST с этими
+# данными, как их отправляет форма, а не GET
+WRITES = {
+    'posts:post_create': {'text': 'Новый пост'},
+    'posts:post_edit': {'text': 'Исправленный пост'},
+    'posts:add_comment': {'text': 'Новый комментарий'},
+    'posts:profile_follow': {},
+    'posts:profile_unfollow': {},
+    'users:logout': {},
+}
+# Данные для бюджетов: параметры seed_yatube
+DATA = {'users': 40, 'groups': 5, 'posts': 400, 'comments': 400,
+        'follows': 5, 'seed': 1}
+# Время SQL зависит от машины, поэтому его проверка включается явно:
+# QUERY_BUDGET_CHECK_TIME=1 в окружении (CI на известном железе)
+CHECK_TIME = os.environ.get('QUERY_BUDGET_CHECK_TIME') == '1'
+# Бюджеты запросов страниц по имени URL: сколько запросов, сколько из
+# них повторов одного SQL и сколько миллисекунд SQL допустимо на
+# данных DATA при холодном кэше
+BUDGETS = {
+    'posts:index': {'queries': 3, 'duplicates': 0, 'time': 50},
+    'posts:group_list': {'queries': 5, 'duplicates': 0, 'time': 50},
+    'posts:profile': {'queries': 6, 'duplicates': 0, 'time': 50},
+    'posts:search': {'queries': 3, 'duplicates': 0, 'time': 50},
+    'posts:post_detail': {'queries': 5, 'duplicates': 0, 'time': 50},
+    'posts:post_comments': {'queries': 2, 'duplicates': 0, 'time': 50},
+    'posts:add_comment': {'queries': 8, 'duplicates': 0, 'time': 50},
+    'posts:post_create': {'queries': 9, 'duplicates': 0, 'time': 50},
+    'posts:post_edit': {'queries': 8, 'duplicates': 0, 'time': 50},
+    'posts:follow_index': {'queries': 3, 'duplicates': 0, 'time': 50},
+    'posts:profile_follow': {'queries': 6, 'duplicates': 0, 'time': 50},
+    'posts:profile_unfollow': {'queries': 9, 'duplicates': 0, 'time': 50},
+    'users:signup': {'queries': 2, 'duplicates': 0, 'time': 50},
+    'users:password_reset_form': {'queries': 0, 'duplicates': 0, 'time': 50},
+    'users:password_change': {'queries': 2, 'duplicates': 0, 'time': 50},
+    'users:logout': {'queries': 4, 'duplicates': 0, 'time': 50},
+    'users:login': {'queries': 2, 'duplicates': 0, 'time': 50},
+    'about:author': {'queries': 2, 'duplicates': 0, 'time': 50},
+    'about:tech': {'queries': 2, 'duplicates': 0, 'time': 50},
+}
+
+
+class QueryBudgetTests(TestCase):
+    """Страницы укладываются в бюджеты запросов из BUDGETS.
+
+    Данные генерирует seed_yatube с параметрами DATA, кэш
+    перед каждой страницей очищается: бюджет считается для холодного
+    запроса. При превышении тест выводит все запросы страницы со
+    строкой шаблона и кода, откуда они пришли. Страницы из WRITES
+    запрашиваются POST: бюджет считается для самой записи. Замер
+    времени (TimingMiddleware) в тестах выключен (core/testing.py): он
+    случаен и сам читает пользователя.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        call_command('seed_yatube', stdout=StringIO(), image_share=0,
+                     **DATA)
+        cls.user = User.objects.get(username='user0')
+        cls.author = User.objects.get(username='user1')
+        cls.post = (Post.objects.filter(author=cls.user)
+                    .annotate(comment_total=Count('comments'))
+                    .order_by('-comment_total').first())
+
+    def arguments(self):
+        return {'slug': 'group-0', 'username': self.author.username,
+                'post_id': self.post.pk}
+
+    def urls(self):
+        arguments = self.arguments()
+        for module in URL_MODULES:
+            for pattern in module.urlpatterns:
+                name = f'{module.app_name}:{pattern.name}'
+                kwargs = {key: arguments[key]
+                          for key in pattern.pattern.converters}
+                yield name, reverse(name, kwargs=kwargs)
+
+    def test_every_url_has_budget(self):
+        for name, _ in self.urls():
+            with self.subTest(name=name):
+                self.assertIn(name, BUDGETS)
+
+    def test_budgets(self):
+        for name, url in self.urls():
+            with self.subTest(name=name):
+                cache.clear()
+                client = Client()
+                client.force_login(self.user)
+                with record_queries() as recorder:
+                    if name in WRITES:
+                        response = client.post(url, WRITES[name])
+                    else:
+                        response = client.get(url)
+                self.assertLess(response.status_code, 400)
+                problems = recorder.violations(
+                    budget(BUDGETS[name], CHECK_TIME))
+                if problems:
+                    self.fail(f'{name} ({url}): {", ".join(problems)}\n'
+                              f'{recorder.report()}')
+
+
+class QueryRecorderTests(TestCase):
+    def test_report_points_to_template_line(self):
+        """N+1 в шаблоне виден в отчёте вместе со строкой шаблона."""
+        author = User.objects.create_user(username='author')
+        Post.objects.bulk_create(Post(text=f'Пост {i}', author=author)
+                                 for i in range(3))
+        template = Template('{% for post in posts %}\n'
+                            '{{ post.author.username }}{% endfor %}')
+        with record_queries() as recorder:
+            template.render(Context({'posts': Post.objects.all()}))
+        self.assertEqual(len(recorder.queries), 4)
+        self.assertEqual(recorder.duplicates(), 2)
+        self.assertEqual(recorder.queries[-1].template,
+                         '<unknown source>:2')
+        self.assertIn('core/tests/test_budgets.py', recorder.queries[0]
+                      .source)
+        problems = recorder.violations(Budget(queries=3, duplicates=0,
+                                              time=1000))
+        self.assertEqual(len(problems), 2)
+        self.assertIn('<unknown source>:2', recorder.report())
+        self.assertIn('×3', recorder.report())
+
+    def test_time_checked_on_request(self):
+        """Время SQL проверяется, только если это включено явно: на
+        медленной машине CI оно иначе падало бы без причины."""
+        limits = {'queries': 1, 'duplicates': 0, 'time': 1}
+        recorder = QueryRecorder()
+        recorder.queries.append(Query('SELECT 1', (), False, 'default',
+                                      0.5, None, None))
+        self.assertEqual(recorder.violations(budget(limits)), [])
+        self.assertEqual(
+            len(recorder.violations(budget(limits, check_time=True))), 1)
@@ -0,0 +1,143 @@
+import multiprocessing
+import os
+import sqlite3
+import tempfile
+import time
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from ..cache import SQLiteCache
+
+
+def increment(location, times):
+    cache = SQLiteCache(location, {})
+    for _ in range(times):
+        cache.incr('counter')
+
+
+class SQLiteCacheTests(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.location = os.path.join(directory.name, 'cache.sqlite3')
+        self.cache = self.backend()
+
+    def backend(self, **options):
+        return SQLiteCache(self.location, {'OPTIONS': options})
+
+    def test_set_get(self):
+        values = {'int': 7, 'big': 2 ** 70, 'text': 'пост',
+                  'dict': {'ids': [1, 2]}, 'none': None}
+        self.cache.set_many(values)
+        for key, value in values.items():
+            with self.subTest(key=key):
+                self.assertEqual(self.cache.get(key, 'нет'), value)
+        self.assertEqual(self.cache.get_many(['int', 'text', 'missing']),
+                         {'int': 7, 'text': 'пост'})
+        self.assertEqual(self.cache.get('missing', 'нет'), 'нет')
+
+    def test_shared_between_connections(self):
+        """Запись одного процесса видна другому: кэш лежит в файле."""
+        self.cache.set('key', 'value')
+        self.assertEqual(self.backend().get('key'), 'value')
+
+    def test_expiry(self):
+        self.cache.set('short', 1, timeout=0.05)
+        self.cache.set('forever', 1, timeout=None)
+        self.assertTrue(self.cache.has_key('short'))
+        time.sleep(0.1)
+        self.assertIsNone(self.cache.get('short'))
+        self.assertFalse(self.cache.has_key('short'))
+        self.assertEqual(self.cache.get('forever'), 1)
+        self.cache.set('forever', 1, timeout=0)
+        self.assertIsNone(self.cache.get('forever'))
+
+    def test_add(self):
+        """add не трогает живую запись, но заменяет просроченную."""
+        self.assertTrue(self.cache.add('key', 1))
+        self.assertFalse(self.cache.add('key', 2))
+        self.assertEqual(self.cache.get('key'), 1)
+        self.cache.set('stale', 1, timeout=0.05)
+        time.sleep(0.1)
+        self.assertTrue(self.cache.add('stale', 2))
+        self.assertEqual(self.cache.get('stale'), 2)
+
+    def test_incr_delete(self):
+        self.cache.set('counter', 1)
+        self.assertEqual(self.cache.incr('counter', 5), 6)
+        self.assertEqual(self.cache.decr('counter'), 5)
+        with self.assertRaises(ValueError):
+            self.cache.incr('missing')
+        self.assertTrue(self.cache.delete('counter'))
+        self.assertFalse(self.cache.delete('counter'))
+        self.cache.set_many({'a': 1, 'b': 2})
+        self.cache.delete_many(['a', 'b'])
+        self.assertEqual(self.cache.get_many(['a', 'b']), {})
+        self.cache.set('a', 1)
+        self.cache.clear()
+        self.assertIsNone(self.cache.get('a'))
+
+    def test_incr_atomic_across_processes(self):
+        """Поколения кэша (posts/caching.py) растут через incr из всех
+        воркеров сразу: ни одно увеличение не должно потеряться."""
+        self.cache.set('counter', 0)
+        context = multiprocessing.get_context('spawn')
+        workers = [context.Process(target=increment,
+                                   args=(self.location, 50))
+                   for _ in range(4)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        self.assertEqual(self.cache.get('counter'), 200)
+
+    def test_lru_eviction(self):
+        """Сверх MAX_BYTES вытесняются давно не читанные записи."""
+        cache = self.backend(MAX_BYTES=20_000, TOUCH_INTERVAL=0)
+        value = 'x' * 1000
+        cache.set('hot', value)
+        for number in range(40):
+            cache.set(f'cold{number}', value)
+            cache.get('hot')
+        size, = cache.db.execute('SELECT bytes FROM cache_size').fetchone()
+        self.assertLessEqual(size, 20_000)
+        total, = cache.db.execute('SELECT sum(size) FROM cache').fetchone()
+        self.assertEqual(size, total)
+        self.assertEqual(cache.get('hot'), value)
+        self.assertIsNone(cache.get('cold0'))
+        self.assertEqual(cache.get('cold39'), value)
+
+    def test_locked_file(self):
+        """Пока файл занят другим писателем, чтение отдаёт записи без
+        обновления времени чтения, запись пропускается, а incr падает."""
+        cache = self.backend(BUSY_TIMEOUT=0.05, TOUCH_INTERVAL=0)
+        cache.set_many({'a': 1, 'counter': 1})
+        writer = sqlite3.connect(self.location, isolation_level=None)
+        self.addCleanup(writer.close)
+        writer.execute('BEGIN IMMEDIATE')
+        self.assertEqual(cache.get('a'), 1)
+        self.assertEqual(cache.get_many(['a', 'counter']),
+                         {'a': 1, 'counter': 1})
+        self.assertIsNone(cache.set('b', 2))
+        self.assertEqual(cache.set_many({'b': 2, 'c': 3}), ['b', 'c'])
+        self.assertFalse(cache.add('b', 2))
+        with self.assertRaises(sqlite3.OperationalError):
+            cache.incr('counter')
+        writer.execute('COMMIT')
+        self.assertFalse(cache.db.in_transaction)
+        self.assertIsNone(cache.get('b'))
+        cache.set('b', 2)
+        self.assertEqual(cache.incr('counter'), 2)
+
+    def test_locked_read_is_miss(self):
+        db = mock.Mock()
+        db.execute.side_effect = sqlite3.OperationalError(
+            'database is locked')
+        with mock.patch.object(SQLiteCache, 'db', db):
+            self.assertEqual(self.cache.get('a', 'нет'), 'нет')
+            self.assertEqual(self.cache.get_many(['a']), {})
+        db.execute.side_effect = sqlite3.OperationalError('no such table')
+        with mock.patch.object(SQLiteCache, 'db', db), \
+                self.assertRaises(sqlite3.OperationalError):
+            self.cache.get('a')
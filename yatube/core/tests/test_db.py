@@ -0,0 +1,62 @@
+from io import StringIO
+
+from django.core.management import call_command
+from django.db import OperationalError, connection
+from django.test import (SimpleTestCase, TestCase, TransactionTestCase,
+                         override_settings)
+
+from ..db import retry_on_lock
+
+
+class SqliteProfileTests(TestCase):
+    def pragma(self, name):
+        with connection.cursor() as cursor:
+            cursor.execute(f'PRAGMA {name}')
+            return cursor.fetchone()[0]
+
+    def test_pragmas_applied(self):
+        """Новое соединение получает настройки из SQLITE_PRAGMAS."""
+        self.assertEqual(self.pragma('cache_size'), -64000)
+        self.assertEqual(self.pragma('busy_timeout'), 5000)
+        self.assertEqual(self.pragma('temp_store'), 2)
+
+
+class OptimizeDbTests(TransactionTestCase):
+    def test_optimize_db(self):
+        out = StringIO()
+        call_command('optimize_db', '--analyze', '--checkpoint', stdout=out)
+        for statement in ('ANALYZE', 'PRAGMA optimize', 'wal_checkpoint'):
+            self.assertIn(statement, out.getvalue())
+
+
+@override_settings(DB_RETRY_ATTEMPTS=3, DB_RETRY_DELAY=0)
+class RetryOnLockTests(SimpleTestCase):
+    def flaky_view(self, failures, message='database is locked'):
+        calls = []
+
+        @retry_on_lock
+        def view():
+            calls.append(1)
+            if len(calls) <= failures:
+                raise OperationalError(message)
+            return 'ok'
+        return view, calls
+
+    def test_retries_until_success(self):
+        view, calls = self.flaky_view(failures=2)
+        with self.assertLogs('core.db', 'WARNING'):
+            self.assertEqual(view(), 'ok')
+        self.assertEqual(len(calls), 3)
+
+    def test_gives_up(self):
+        view, calls = self.flaky_view(failures=3)
+        with self.assertLogs('core.db', 'WARNING'), \
+                self.assertRaises(OperationalError):
+            view()
+        self.assertEqual(len(calls), 3)
+
+    def test_other_errors_not_retried(self):
+        view, calls = self.flaky_view(failures=1, message='no such table')
+        with self.assertRaises(OperationalError):
+            view()
+        self.assertEqual(len(calls), 1)
@@ -0,0 +1,62 @@
+from django.http import HttpResponse
+from django.template import Context, Template
+from django.test import TestCase, override_settings
+from django.urls import path
+
+from posts.models import Comment, Post, User
+
+from ..budgets import normalize
+
+COMMENTS = Template('{% for comment in comments %}\n'
+                    '{{ comment.author.username }}\n{% endfor %}')
+
+
+def comments(request):
+    return HttpResponse(COMMENTS.render(
+        Context({'comments': Comment.objects.all()})))
+
+
+urlpatterns = [path('comments/', comments)]
+
+
+@override_settings(ROOT_URLCONF=__name__, QUERY_INSPECTOR=True)
+class QueryInspectorTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        post = Post.objects.create(
+            text='Пост', author=User.objects.create_user(username='author'))
+        for number in range(4):
+            Comment.objects.create(
+                post=post, text='Ответ',
+                author=User.objects.create_user(username=f'reader{number}'))
+
+    def test_repeated_queries(self):
+        """Повторы одного запроса собираются вместе со строкой шаблона."""
+        with self.assertLogs('core.queries', 'WARNING') as logs:
+            self.client.get('/comments/')
+        self.assertEqual(len(logs.records), 1)
+        message = logs.records[0].getMessage()
+        self.assertIn('запрос повторён 4 раз', message)
+        self.assertIn('"auth_user"', message)
+        self.assertIn('4× <unknown source>:2', message)
+
+    @override_settings(SLOW_QUERY_MS=-1, QUERY_REPEAT_THRESHOLD=100)
+    def test_slow_queries_with_plan(self):
+        """Медленные запросы пишутся с планом выполнения."""
+        with self.assertLogs('core.slow_queries', 'WARNING') as logs:
+            self.client.get('/comments/')
+        message = logs.records[0].getMessage()
+        self.assertIn('GET /comments/', message)
+        self.assertIn('SCAN', message)
+
+    @override_settings(QUERY_INSPECTOR=False)
+    def test_disabled(self):
+        with self.assertRaises(AssertionError):
+            with self.assertLogs('core.queries', 'WARNING'):
+                self.client.get('/comments/')
+
+    def test_normalize(self):
+        self.assertEqual(
+            normalize("SELECT a  FROM t WHERE id IN (%s, %s) AND b = 'x'"
+                      ' LIMIT 21'),
+            'SELECT a FROM t WHERE id IN (...) AND b = ? LIMIT ?')
@@ -0,0 +1,144 @@
+import os
+import sqlite3
+import tempfile
+
+from django.conf import settings
+from django.db import transaction
+from django.http import HttpResponse
+from django.test import (RequestFactory, SimpleTestCase, TestCase,
+                         override_settings)
+from django.urls import reverse
+
+from posts.models import Comment, Post, User
+
+from ..middleware import ReplicaMiddleware
+from ..routers import PrimaryReplicaRouter, copy_database, pinned, primary
+
+router = PrimaryReplicaRouter()
+
+
+@override_settings(DATABASE_REPLICAS=['replica'])
+class RouterTests(SimpleTestCase):
+    # Без транзакции TestCase: внутри неё чтение всегда идёт в основную
+    databases = {'default'}
+
+    def test_reads_go_to_replica(self):
+        self.assertEqual(router.db_for_read(Post), 'replica')
+        self.assertEqual(router.db_for_write(Post), 'default')
+
+    def test_primary_when_pinned_or_in_transaction(self):
+        with pinned():
+            self.assertEqual(router.db_for_read(Post), 'default')
+        with transaction.atomic():
+            self.assertEqual(router.db_for_read(Post), 'default')
+        self.assertEqual(router.db_for_read(Post), 'replica')
+
+    @override_settings(DATABASE_REPLICAS=[])
+    def test_no_replicas(self):
+        self.assertEqual(router.db_for_read(Post), 'default')
+
+    def test_no_migrations_on_replica(self):
+        self.assertFalse(router.allow_migrate('replica', 'posts'))
+        self.assertTrue(router.allow_migrate('default', 'posts'))
+
+
+@override_settings(DATABASE_REPLICAS=['replica'])
+class ReplicaMiddlewareTests(SimpleTestCase):
+    databases = {'default'}
+
+    def setUp(self):
+        self.factory = RequestFactory()
+        self.reads_from = None
+
+    def view(self, request):
+        self.reads_from = router.db_for_read(Post)
+        return HttpResponse()
+
+    def run_request(self, request, view=None):
+        view = view or self.view
+        middleware = ReplicaMiddleware(None)
+
+        def get_response(request):
+            middleware.process_view(request, view, (), {})
+            return view(request)
+        middleware.get_response = get_response
+        return middleware(request)
+
+    def test_post_pins_to_primary(self):
+        """Запись читает из основной базы и ставит cookie закрепления."""
+        response = self.run_request(self.factory.post('/'))
+        self.assertEqual(self.reads_from, 'default')
+        cookie = response.cookies[settings.REPLICA_PIN_COOKIE]
+        self.assertEqual(cookie['max-age'], settings.REPLICA_PIN_SECONDS)
+
+    def test_pinned_after_write(self):
+        """Пока cookie жива, чтение идёт из основной базы."""
+        request = self.factory.get('/')
+        request.COOKIES[settings.REPLICA_PIN_COOKIE] = '1'
+        response = self.run_request(request)
+        self.assertEqual(self.reads_from, 'default')
+        self.assertNotIn(settings.REPLICA_PIN_COOKIE, response.cookies)
+
+    def test_plain_read_uses_replica(self):
+        response = self.run_request(self.factory.get('/'))
+        self.assertEqual(self.reads_from, 'replica')
+        self.assertNotIn(settings.REPLICA_PIN_COOKIE, response.cookies)
+
+    @override_settings(DATABASE_REPLICAS=['replica', 'replica_2'])
+    def test_one_replica_per_request(self):
+        """Все чтения запроса идут в одну реплику."""
+        def view(request):
+            self.reads_from = {router.db_for_read(Post) for _ in range(20)}
+            return HttpResponse()
+        self.run_request(self.factory.get('/'), view)
+        self.assertEqual(len(self.reads_from), 1)
+
+    def test_primary_view_by_get(self):
+        """GET-представление с @primary пишет и тоже закрепляет."""
+        response = self.run_request(self.factory.get('/'),
+                                    primary(self.view))
+        self.assertEqual(self.reads_from, 'default')
+        self.assertIn(settings.REPLICA_PIN_COOKIE, response.cookies)
+
+
+@override_settings(DATABASE_REPLICAS=['replica'])
+class WriteViewsTests(TestCase):
+    databases = {'default'}
+
+    def test_write_views_pin(self):
+        """Подписка (GET) и комментарий ставят cookie закрепления."""
+        author = User.objects.create_user(username='author')
+        reader = User.objects.create_user(username='reader')
+        post = Post.objects.create(text='Пост', author=author)
+        self.client.force_login(reader)
+        for method, url, data in (
+            ('get', reverse('posts:profile_follow',
+                            args=[author.username]), None),
+            ('post', reverse('posts:add_comment', args=[post.pk]),
+             {'text': 'Ответ'}),
+        ):
+            with self.subTest(url=url):
+                self.client.cookies.pop(settings.REPLICA_PIN_COOKIE, None)
+                response = getattr(self.client, method)(url, data)
+                self.assertIn(settings.REPLICA_PIN_COOKIE, response.cookies)
+        self.assertTrue(Comment.objects.filter(post=post).exists())
+
+
+class CopyDatabaseTests(TestCase):
+    def test_copy(self):
+        """Копия видит данные основной базы на момент копирования."""
+        with tempfile.TemporaryDirectory() as directory:
+            source = os.path.join(directory, 'primary.sqlite3')
+            target = os.path.join(directory, 'replica.sqlite3')
+            db = sqlite3.connect(source)
+            db.execute('CREATE TABLE item (name TEXT)')
+            db.execute("INSERT INTO item VALUES ('первый')")
+            db.commit()
+            copy_database(source, target)
+            db.execute("INSERT INTO item VALUES ('второй')")
+            db.commit()
+            db.close()
+            replica = sqlite3.connect(target)
+            self.assertEqual(replica.execute('SELECT name FROM item')
+                             .fetchall(), [('первый',)])
+            replica.close()
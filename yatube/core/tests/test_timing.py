@@ -0,0 +1,87 @@
+import json
+
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from posts.models import Post, User
+
+from .. import timing
+
+INDEX_URL = reverse('posts:index')
+
+
+@override_settings(REQUEST_TIMING_SAMPLE_RATE=1)
+class TimingMiddlewareTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(username='author')
+        cls.staff = User.objects.create_user(username='staff',
+                                             is_staff=True)
+        Post.objects.create(text='Пост', author=cls.author)
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.staff)
+
+    def metrics(self, url):
+        with self.assertLogs('core.timing', 'INFO') as logs:
+            response = self.client.get(url)
+        return response, json.loads(logs.records[-1].getMessage())
+
+    def test_server_timing_header(self):
+        """Заголовок перечисляет SQL, кэш, шаблоны и общее время."""
+        response, metrics = self.metrics(INDEX_URL)
+        header = response['Server-Timing']
+        for name in ('db', 'cache', 'template', 'thumbnails', 'total'):
+            self.assertIn(f'{name};dur=', header)
+        self.assertIn(f'{metrics["db_queries"]} queries', header)
+        self.assertGreater(metrics['db_queries'], 0)
+        self.assertGreater(metrics['template_ms'], 0)
+        self.assertEqual(metrics['path'], INDEX_URL)
+        self.assertEqual(metrics['status'], 200)
+
+    def test_cache_hits(self):
+        """Повторный запрос берёт ленту из кэша: доля попаданий растёт."""
+        _, cold = self.metrics(INDEX_URL)
+        _, warm = self.metrics(INDEX_URL)
+        self.assertGreater(cold['cache_sets'], 0)
+        self.assertGreater(warm['cache_hits'], cold['cache_hits'])
+        self.assertLess(warm['db_queries'], cold['db_queries'])
+        self.assertGreater(warm['cache_hit_ratio'], 0)
+
+    def test_header_only_for_staff(self):
+        """Посторонним разбивка времени не отдаётся, но в лог пишется."""
+        for user in (None, self.author):
+            with self.subTest(user=user):
+                self.client.logout()
+                if user:
+                    self.client.force_login(user)
+                response, metrics = self.metrics(INDEX_URL)
+                self.assertFalse(response.has_header('Server-Timing'))
+                self.assertEqual(metrics['status'], 200)
+        with override_settings(DEBUG=True):
+            response, _ = self.metrics(INDEX_URL)
+        self.assertTrue(response.has_header('Server-Timing'))
+
+    @override_settings(REQUEST_TIMING_SAMPLE_RATE=0)
+    def test_sampling(self):
+        """Запросы вне выборки не замеряются."""
+        response = self.client.get(INDEX_URL)
+        self.assertFalse(response.has_header('Server-Timing'))
+
+
+class MeasureTests(TestCase):
+    def test_nested_blocks_counted_once(self):
+        with timing.collect() as measured:
+            with timing.measure('thumbnails'):
+                with timing.measure('thumbnails'):
+                    pass
+        self.assertEqual(measured.counts['thumbnails'], 1)
+        self.assertIsNone(timing.current())
+
+    def test_outside_request(self):
+        """Вне замеряемого запроса measure ничего не делает."""
+        with timing.measure('thumbnails'):
+            pass
+        self.assertIsNone(timing.current())
@@ -0,0 +1,168 @@
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from functools import wraps
+
+from django.template.base import Template
+
+_local = threading.local()
+MISSING = object()
+# Методы бэкендов кэша, которые считаются обращениями к кэшу
+CACHE_READS = ('get', 'get_many')
+CACHE_WRITES = ('set', 'add', 'set_many')
+
+
+class Timing:
+    """Время и счётчики одного запроса: SQL, кэш, шаблоны, миниатюры."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.durations = Counter()
+        self.counts = Counter()
+        # Глубина вложенных замеров по видам: вложенное не считаем дважды
+        self.depth = Counter()
+
+    def add(self, name, seconds, count=1):
+        self.durations[name] += seconds
+        self.counts[name] += count
+
+    @property
+    def total(self):
+        return time.perf_counter() - self.started
+
+    @property
+    def hit_ratio(self):
+        gets = self.counts['cache_get']
+        return self.counts['cache_hit'] / gets if gets else None
+
+    def metrics(self):
+        """Показатели запроса: миллисекунды и счётчики."""
+        return {
+            'total_ms': round(self.total * 1000, 1),
+            'db_ms': round(self.durations['db'] * 1000, 1),
+            'db_queries': self.counts['db'],
+            'cache_ms': round(self.durations['cache'] * 1000, 1),
+            'cache_gets': self.counts['cache_get'],
+            'cache_hits': self.counts['cache_hit'],
+            'cache_sets': self.counts['cache_set'],
+            'cache_hit_ratio': (None if self.hit_ratio is None
+                                else round(self.hit_ratio, 3)),
+            'template_ms': round(self.durations['template'] * 1000, 1),
+            'thumbnails_ms': round(self.durations['thumbnails'] * 1000, 1),
+            'thumbnails': self.counts['thumbnails'],
+        }
+
+    def server_timing(self):
+        """Значение заголовка Server-Timing."""
+        metrics = self.metrics()
+        cache = f'{metrics["cache_hits"]}/{metrics["cache_gets"]} hits, ' \
+                f'{metrics["cache_sets"]} sets'
+        entries = [
+            ('db', metrics['db_ms'], f'{metrics["db_queries"]} queries'),
+            ('cache', metrics['cache_ms'], cache),
+            ('template', metrics['template_ms'], None),
+            ('thumbnails', metrics['thumbnails_ms'],
+             f'{metrics["thumbnails"]} rendered'),
+            ('total', metrics['total_ms'], None),
+        ]
+        return ', '.join(
+            f'{name};dur={duration}' + (f';desc="{desc}"' if desc else '')
+            for name, duration, desc in entries)
+
+
+def current():
+    """Замер текущего запроса или None, если запрос не попал в выборку."""
+    return getattr(_local, 'timing', None)
+
+
+@contextmanager
+def collect():
+    """Контекст, в котором замеры этого потока пишутся в новый Timing."""
+    previous = current()
+    _local.timing = timing = Timing()
+    try:
+        yield timing
+    finally:
+        _local.timing = previous
+
+
+@contextmanager
+def measure(name):
+    """Засекает время блока под именем `name`.
+
+    Вне замеряемого запроса (например, в пуле миниатюр) ничего не
+    делает; вложенные блоки одного вида учитываются один раз.
+    """
+    timing = current()
+    if timing is None or timing.depth[name]:
+        yield
+        return
+    timing.depth[name] += 1
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timing.depth[name] -= 1
+        timing.add(name, time.perf_counter() - started)
+
+
+def record_query(execute, sql, params, many, context):
+    """execute_wrapper соединения: время и число SQL-запросов."""
+    with measure('db'):
+        return execute(sql, params, many, context)
+
+
+def _measured_render(render):
+    @wraps(render)
+    def wrapper(self, context):
+        with measure('template'):
+            return render(self, context)
+    wrapper.timed = True
+    return wrapper
+
+
+def _measured_cache(method, name):
+    @wraps(method)
+    def wrapper(self, *args, **kwargs):
+        timing = current()
+        if timing is None or timing.depth['cache']:
+            return method(self, *args, **kwargs)
+        if name == 'get':
+            key, *rest = args
+            default = rest[0] if rest else kwargs.pop('default', None)
+            with measure('cache'):
+                value = method(self, key, MISSING, *rest[1:], **kwargs)
+            timing.counts['cache_get'] += 1
+            if value is MISSING:
+                return default
+            timing.counts['cache_hit'] += 1
+            return value
+        with measure('cache'):
+            result = method(self, *args, **kwargs)
+        if name == 'get_many':
+            timing.counts['cache_get'] += len(args[0])
+            timing.counts['cache_hit'] += len(result)
+        elif name == 'set_many':
+            timing.counts['cache_set'] += len(args[0])
+        else:
+            timing.counts['cache_set'] += 1
+        return result
+    wrapper.timed = True
+    return wrapper
+
+
+def instrument(cache_classes):
+    """Подключает замеры к рендерингу шаблонов и к бэкендам кэша.
+
+    У Django нет сигналов о рендеринге и обращениях к кэшу, поэтому
+    методы оборачиваются один раз при старте; вне замеряемого запроса
+    обёртка сразу вызывает исходный метод.
+    """
+    if not getattr(Template._render, 'timed', False):
+        Template._render = _measured_render(Template._render)
+    for cache_class in cache_classes:
+        for name in CACHE_READS + CACHE_WRITES:
+            method = getattr(cache_class, name)
+            if not getattr(method, 'timed', False):
+                setattr(cache_class, name, _measured_cache(method, name))
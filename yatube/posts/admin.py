@@ -1,9 +1,81 @@
 from django.contrib import admin
+from django.core.exceptions import PermissionDenied, ValidationError
+from django.core.files.storage import default_storage
+from django.http import HttpResponseBadRequest, StreamingHttpResponse
+from django.shortcuts import get_object_or_404
+from django.urls import path
 
-from .models import Comment, Follow, Group, Post
+from . import export, shards
+from .models import Comment, Follow, Group, Post, User
+from .search import matching
+from .utils import EstimatedCountPaginator
 
 
-class PostAdmin(admin.ModelAdmin):
+class ShardListFilter(admin.SimpleListFilter):
+    """Из какого шарда показывать список; по умолчанию — из первого.
+
+    Слить шарды в один список админка не может: список постов и
+    комментариев листается по одному шарду.
+    """
+    title = 'шард'
+    parameter_name = 'shard'
+
+    def lookups(self, request, model_admin):
+        return [(alias, alias) for alias in shards.aliases()]
+
+    def value(self):
+        value = super().value()
+        return value if value in shards.aliases() else shards.aliases()[0]
+
+    def choices(self, changelist):
+        for lookup, title in self.lookup_choices:
+            yield {
+                'selected': self.value() == lookup,
+                'query_string': changelist.get_query_string(
+                    {self.parameter_name: lookup}),
+                'display': title,
+            }
+
+    def queryset(self, request, queryset):
+        return queryset.using(self.value())
+
+
+class ShardedAdmin(admin.ModelAdmin):
+    """Админка постов и комментариев, которые могут лежать в шардах.
+
+    С шардами список показывает один шард (ShardListFilter), авторы и
+    группы дочитываются из основной базы через prefetch_related, а
+    объект ищется в шарде, который назначает его id.
+    """
+
+    def get_list_filter(self, request):
+        list_filter = super().get_list_filter(request)
+        if shards.enabled():
+            return (ShardListFilter, *list_filter)
+        return list_filter
+
+    def get_list_select_related(self, request):
+        if shards.enabled():
+            return ()
+        return super().get_list_select_related(request)
+
+    def get_queryset(self, request):
+        queryset = super().get_queryset(request)
+        if shards.enabled():
+            queryset = queryset.prefetch_related(*self.list_select_related)
+        return queryset
+
+    def get_object(self, request, object_id, from_field=None):
+        if not shards.enabled() or from_field is not None:
+            return super().get_object(request, object_id, from_field)
+        try:
+            return (self.get_queryset(request)
+                    .using(shards.for_post(object_id)).get(pk=object_id))
+        except (self.model.DoesNotExist, ValidationError, ValueError):
+            return None
+
+
+class PostAdmin(ShardedAdmin):
     list_display = (
         'pk',
         'text',
@@ -11,26 +83,114 @@ class PostAdmin(admin.ModelAdmin):
         'author',
         'group')
     list_editable = ('group',)
+    list_select_related = ('author', 'group')
     search_fields = ('text',)
     list_filter = ('pub_date',)
+    date_hierarchy = 'pub_date'
+    raw_id_fields = ('author',)
     empty_value_display = '-пусто-'
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    def get_search_results(self, request, queryset, search_term):
+        """Ищет по полнотекстовому индексу, а не через LIKE."""
+        if not search_term:
+            return queryset, False
+        return matching(queryset, search_term), False
+
+    def formfield_for_foreignkey(self, db_field, request, **kwargs):
+        """Список групп для list_editable выбирается один раз на страницу.
+
+        Без этого каждая строка списка постов строит свой `<select>`
+        отдельным запросом.
+        """
+        field = super().formfield_for_foreignkey(db_field, request, **kwargs)
+        if db_field.name == 'group' and field is not None:
+            # Через iter(): иначе list() спросит len() — лишний COUNT
+            field.choices = list(iter(field.choices))
+        return field
+
+    def get_urls(self):
+        return [
+            path('export/', self.admin_site.admin_view(self.export_view),
+                 name='posts_export'),
+            *super().get_urls(),
+        ]
+
+    def check_export_permission(self, request, tables):
+        """admin_view проверяет только is_staff: выгрузка таблицы требует
+        ещё и права на просмотр её модели."""
+        for table in tables:
+            model, _ = export.TABLES[table]
+            model_admin = self.admin_site._registry.get(model)
+            if (model_admin is None
+                    or not model_admin.has_view_permission(request)):
+                raise PermissionDenied
+
+    def export_view(self, request):
+        """Потоковая выгрузка для персонала.
+
+        `?table=posts|comments|follows&format=ndjson|csv` — таблица
+        целиком, `?user=<username>` — zip с данными и картинками одного
+        пользователя. Нужно право просмотра каждой выгружаемой модели.
+        """
+        username = request.GET.get('user')
+        if username:
+            self.check_export_permission(request, export.TABLES)
+            user = get_object_or_404(User, username=username)
+            response = StreamingHttpResponse(
+                export.user_archive(user, default_storage),
+                content_type='application/zip')
+            filename = f'{user.username}.zip'
+        else:
+            table = request.GET.get('table', 'posts')
+            output_format = request.GET.get('format', 'ndjson')
+            if (table not in export.TABLES
+                    or output_format not in export.FORMATS):
+                return HttpResponseBadRequest(
+                    'Неизвестная таблица или формат.')
+            self.check_export_permission(request, [table])
+            response = StreamingHttpResponse(
+                export.lines(table, output_format),
+                content_type=export.CONTENT_TYPES[output_format])
+            filename = f'{table}.{output_format}'
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return response
 
 
 class GroupAdmin(admin.ModelAdmin):
     list_display = ('title', 'description')
 
 
-class CommentAdmin(admin.ModelAdmin):
+class CommentAdmin(ShardedAdmin):
     list_display = ('pk', 'text',
                     'author', 'post')
+    list_select_related = ('author', 'post')
     search_fields = ('text',)
-    list_filter = ('post',)
+    date_hierarchy = 'pub_date'
+    raw_id_fields = ('author', 'post')
     empty_value_display = '-пусто-'
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    # Поле поста проверяет id по основной базе: с шардами пост
+    # комментария не меняется, а новые комментарии пишутся на сайте
+    def get_readonly_fields(self, request, obj=None):
+        if shards.enabled():
+            return ('post', *super().get_readonly_fields(request, obj))
+        return super().get_readonly_fields(request, obj)
+
+    def has_add_permission(self, request):
+        return not shards.enabled() and super().has_add_permission(request)
 
 
 class FollowAdmin(admin.ModelAdmin):
     list_display = ('pk', 'user', 'author')
-    search_fields = ('author',)
+    list_select_related = ('user', 'author')
+    search_fields = ('author__username', 'user__username')
+    raw_id_fields = ('user', 'author')
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
 
 
 admin.site.register(Post, PostAdmin)
@@ -0,0 +1,138 @@
+import hashlib
+import time
+
+from django.core.cache import cache
+from django.db import transaction
+
+from core import routers
+
+PAGE_PARAMS = ('page', 'after', 'before')
+# Сколько секунд лента может показывать устаревшее число комментариев:
+# комментарий не сбрасывает ленты, а ключ ленты сменяется раз в
+# FEED_REFRESH секунд. Столько же живёт кэш страницы ленты в шаблонах
+FEED_REFRESH = 300
+
+
+def generation_key(scope):
+    return f'posts:generation:{scope}'
+
+
+def written_key(scope):
+    return f'posts:written:{scope}'
+
+
+def initial_generation():
+    """Начальное значение счётчика.
+
+    Берётся из времени, а не с нуля: после вытеснения счётчика из кэша
+    новые ключи страниц не совпадут со старыми закэшированными.
+    """
+    return time.time_ns() // 1000
+
+
+def bump(*scopes):
+    """Сдвигает поколения областей: их закэшированные страницы устаревают.
+
+    Поколение сдвигается сразу и ещё раз после коммита: страница,
+    прочитанная между сдвигом и коммитом, записи ещё не видит. После
+    коммита запоминается и время записи — по нему `replica_fresh`
+    решает, догнала ли реплика.
+    """
+    _increment(scopes)
+
+    def committed():
+        cache.set_many(dict.fromkeys(map(written_key, scopes), time.time()),
+                       None)
+        _increment(scopes)
+    transaction.on_commit(committed)
+
+
+def _increment(scopes):
+    for scope in scopes:
+        key = generation_key(scope)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.add(key, initial_generation(), None)
+
+
+def replica_fresh(*scopes):
+    """Видит ли база, из которой читает запрос, последние записи
+    областей `scopes`.
+
+    Основная база видит всё. Реплика — если её последняя копия
+    (routers.mark_synced) началась после последней записи в каждую
+    область; когда копия была, неизвестно, реплика считается отставшей.
+    """
+    alias = routers.current_replica()
+    if alias is None:
+        return True
+    synced = routers.synced_at(alias)
+    if synced is None:
+        return False
+    written = cache.get_many([written_key(scope) for scope in scopes])
+    return all(timestamp < synced for timestamp in written.values())
+
+
+def generations(*scopes):
+    """Текущие поколения областей в порядке перечисления."""
+    keys = [generation_key(scope) for scope in scopes]
+    values = cache.get_many(keys)
+    for key in keys:
+        if key not in values:
+            cache.add(key, initial_generation(), None)
+            values[key] = cache.get(key)
+    return [values[key] for key in keys]
+
+
+def feed_key(request, view, *scopes):
+    """Ключ закэшированной ленты: представление, страница, аудитория и
+    поколения всех областей, от которых зависит её содержимое.
+
+    Пользователю лента кэшируется своя: в ней видно, на кого он
+    подписан, и она устаревает вместе с его подписками. Раз в
+    FEED_REFRESH секунд ключ сменяется и без записей: так в ленту, в
+    том числе в ETag, попадает новое число комментариев.
+
+    None, если запрос читает из реплики, которая ещё не видит последних
+    записей этих областей: такую страницу нельзя ни кэшировать под
+    новым ключом, ни отдавать с ETag.
+    """
+    if request.user.is_authenticated:
+        audience = f'user-{request.user.pk}'
+        scopes += (f'following:{request.user.pk}',)
+    else:
+        audience = 'anonymous'
+    if not replica_fresh(*scopes):
+        return None
+    page = [f'{name}={request.GET[name]}' for name in PAGE_PARAMS
+            if name in request.GET]
+    return ':'.join([view, audience, *page,
+                     *map(str, generations(*scopes)),
+                     str(int(time.time() // FEED_REFRESH))])
+
+
+def etag(key, *parts):
+    """Валидатор для условного GET из ключа страницы и прочих частей;
+    без ключа (feed_key вернул None) ETag не выдаётся."""
+    if key is None:
+        return None
+    return hashlib.md5(':'.join(map(str, (key, *parts))).encode()).hexdigest()
+
+
+def post_changed(post, group_ids, follower_ids):
+    """Устаревают страница поста и ленты, в которых пост был или должен
+    появиться."""
+    bump('index', f'post:{post.pk}', f'author:{post.author_id}',
+         *(f'group:{group_id}' for group_id in group_ids if group_id),
+         *(f'inbox:{user_id}' for user_id in follower_ids))
+
+
+def comments_changed(post_id):
+    """Устаревает только страница поста: в лентах число комментариев
+    входит в ключ фрагмента поста и обновится со сменой ключа ленты."""
+    bump(f'post:{post_id}')
+
+
+def follow_changed(follow):
+    bump(f'inbox:{follow.user_id}', f'following:{follow.user_id}')
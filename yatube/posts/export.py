@@ -0,0 +1,128 @@
+import csv
+import json
+import zipfile
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+
+from . import shards
+from .models import Comment, Follow, Post
+
+# Что выгружается: модель и колонки в порядке вывода
+TABLES = {
+    'posts': (Post, ('id', 'text', 'pub_date', 'updated', 'author_id',
+                     'group_id', 'image')),
+    'comments': (Comment, ('id', 'post_id', 'author_id', 'text',
+                           'pub_date')),
+    'follows': (Follow, ('id', 'user_id', 'author_id')),
+}
+FORMATS = ('ndjson', 'csv')
+CONTENT_TYPES = {'ndjson': 'application/x-ndjson', 'csv': 'text/csv'}
+FILE_CHUNK_SIZE = 64 * 1024
+
+
+def rows(table, chunk_size=None, **filters):
+    """Строки таблицы словарями, порциями по первичному ключу.
+
+    Каждая порция — отдельный запрос `id > последний`, который читается
+    через `iterator()`: в памяти не больше одной порции, а глубокие
+    порции стоят столько же, сколько первая. Посты и комментарии
+    выгружаются шард за шардом.
+    """
+    model, fields = TABLES[table]
+    chunk_size = chunk_size or settings.EXPORT_CHUNK_SIZE
+    databases = shards.aliases() if model in shards.SHARDED else [None]
+    for alias in databases:
+        queryset = (model.objects.using(alias).filter(**filters)
+                    .order_by('pk').values(*fields))
+        last_id = 0
+        while True:
+            count = 0
+            chunk = queryset.filter(pk__gt=last_id)[:chunk_size]
+            for row in chunk.iterator(chunk_size=chunk_size):
+                count += 1
+                last_id = row['id']
+                yield row
+            if count < chunk_size:
+                break
+
+
+def ndjson(rows, fields):
+    for row in rows:
+        yield json.dumps(row, cls=DjangoJSONEncoder,
+                         ensure_ascii=False) + '\n'
+
+
+class Echo:
+    """Файл для csv.writer, который сразу отдаёт записанную строку."""
+
+    def write(self, value):
+        return value
+
+
+def csv_lines(rows, fields):
+    writer = csv.writer(Echo())
+    yield writer.writerow(fields)
+    for row in rows:
+        yield writer.writerow([row[field] for field in fields])
+
+
+def lines(table, output_format, chunk_size=None, **filters):
+    """Выгрузка таблицы построчно в формате `output_format`."""
+    serialize = ndjson if output_format == 'ndjson' else csv_lines
+    return serialize(rows(table, chunk_size, **filters), TABLES[table][1])
+
+
+class ZipStream:
+    """Приёмник для ZipFile без seek: записанное забирается через pop().
+
+    ZipFile пишет в такой поток с дескрипторами данных после каждого
+    файла, поэтому архив можно отдавать по мере сборки.
+    """
+
+    def __init__(self):
+        self.parts = []
+
+    def write(self, data):
+        self.parts.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def pop(self):
+        data = b''.join(self.parts)
+        self.parts = []
+        return data
+
+    def drain(self):
+        """Отдаёт накопленное, если оно есть."""
+        data = self.pop()
+        if data:
+            yield data
+
+
+def user_archive(user, storage):
+    """Zip с постами, комментариями и подписками пользователя и
+    картинками его постов; отдаётся кусками по мере сборки."""
+    stream = ZipStream()
+    with zipfile.ZipFile(stream, 'w', zipfile.ZIP_DEFLATED) as archive:
+        for table, filters in (('posts', {'author': user}),
+                               ('comments', {'author': user}),
+                               ('follows', {'user': user})):
+            with archive.open(f'{table}.ndjson', 'w') as member:
+                for line in lines(table, 'ndjson', **filters):
+                    member.write(line.encode())
+                    yield from stream.drain()
+        images = (Post.objects.using(shards.for_author(user.pk))
+                  .filter(author=user).exclude(image='')
+                  .order_by('pk').values_list('image', flat=True))
+        for name in images.iterator():
+            if not storage.exists(name):
+                continue
+            with storage.open(name) as source, archive.open(
+                    f'images/{name}', 'w') as member:
+                for data in iter(lambda: source.read(FILE_CHUNK_SIZE), b''):
+                    member.write(data)
+                    yield from stream.drain()
+    yield from stream.drain()
@@ -0,0 +1,88 @@
+from functools import partial
+
+from django.db.models import (BooleanField, Exists, OuterRef, Value,
+                              prefetch_related_objects)
+
+from . import shards
+from .models import Follow
+
+# Поля поста, которые выводят шаблоны лент
+POST_FIELDS = (
+    'text', 'pub_date', 'updated', 'comment_count',
+    'image', 'thumbnail', 'srcset', 'srcset_webp',
+    'author', 'author__username', 'author__first_name', 'author__last_name',
+    'group', 'group__slug', 'group__title',
+)
+EXTRAS = ('is_following',)
+
+
+def annotations(user, prefix=''):
+    """Выражение `is_following` для строк ленты."""
+    if user.is_authenticated:
+        is_following = Exists(Follow.objects.filter(
+            user=user, author=OuterRef(f'{prefix}author')))
+    else:
+        is_following = Value(False, output_field=BooleanField())
+    return {'is_following': is_following}
+
+
+def build(queryset, user, prefix='', fields=()):
+    """Готовит queryset ленты: один запрос на страницу, сколько бы в ней
+    ни было постов.
+
+    К каждой строке добавляется `is_following` (подписан ли зритель на
+    автора; число комментариев хранит сам пост), связанные автор и
+    группа читаются тем же запросом, а из постов выбираются только
+    нужные шаблону колонки. `prefix` — путь до поста, если строки
+    ленты не посты, а, например, записи Inbox; `fields` —
+    дополнительные колонки самих строк.
+    """
+    return (
+        queryset
+        .select_related(f'{prefix}author', f'{prefix}group')
+        .only(*fields, *(prefix + field for field in POST_FIELDS))
+        .annotate(**annotations(user, prefix))
+    )
+
+
+def build_posts(queryset, user, authors=None):
+    """Лента постов `queryset` для `build`, а если посты разложены по
+    шардам — слияние лент шардов (`shards.Merged`).
+
+    В шард уходит запрос без соединений, а авторов, группы и подписки
+    зрителя `attach` дочитывает из основной базы для всей страницы
+    разом. `authors` ограничивает
+    выборку шардами этих авторов: лента профиля обходится одним шардом.
+    """
+    if not shards.enabled():
+        return build(queryset, user)
+    if authors is None:
+        querysets = shards.spread(queryset)
+    else:
+        querysets = shards.by_author(queryset, authors)
+    fields = [field for field in POST_FIELDS if '__' not in field]
+    return shards.Merged(
+        {alias: queryset.only(*fields)
+         for alias, queryset in querysets.items()},
+        partial(attach, user=user))
+
+
+def attach(posts, user):
+    """Авторы, группы и `is_following` постов из шардов."""
+    prefetch_related_objects(posts, 'author', 'group')
+    following = set()
+    if user.is_authenticated and posts:
+        following = set(
+            Follow.objects.filter(
+                user=user, author_id__in={post.author_id for post in posts})
+            .values_list('author_id', flat=True))
+    for post in posts:
+        post.is_following = post.author_id in following
+
+
+def unwrap(entry):
+    """Пост записи Inbox вместе с посчитанными для записи полями."""
+    post = entry.post
+    for name in EXTRAS:
+        setattr(post, name, getattr(entry, name))
+    return post
@@ -1,6 +1,9 @@
+from django import forms
+from django.core.files.uploadedfile import UploadedFile
 from django.forms import ModelForm
 
-from .models import Post, Comment
+from . import images
+from .models import Comment, Group, Post
 
 
 class PostForm(ModelForm):
@@ -14,8 +17,31 @@ class PostForm(ModelForm):
                  'group': 'Выберите группу',
                  'image': 'Добавьте картинку'}
 
+    def clean_image(self):
+        """Новую картинку проверяет и пересжимает до сохранения."""
+        image = self.cleaned_data['image']
+        if isinstance(image, UploadedFile):
+            image, self.image_size = images.process(image)
+        elif not image:
+            self.image_size = (None, None)
+        return image
+
+    def save(self, commit=True):
+        if hasattr(self, 'image_size'):
+            (self.instance.image_width,
+             self.instance.image_height) = self.image_size
+        return super().save(commit)
+
 
 class CommentForm(ModelForm):
     class Meta:
         model = Comment
         fields = ('text',)
+
+
+class SearchForm(forms.Form):
+    q = forms.CharField(label='Что искать', max_length=200, required=False)
+    group = forms.ModelChoiceField(
+        Group.objects.only('slug', 'title'), to_field_name='slug',
+        label='Группа', empty_label='Все группы', required=False)
+    author = forms.CharField(label='Автор', max_length=150, required=False)
@@ -0,0 +1,136 @@
+import warnings
+from tempfile import SpooledTemporaryFile
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.files import File
+from PIL import Image, ImageOps, ImageSequence
+
+ORIENTATION = 0x0112
+# Форматы, которые Pillow читает, но не пишет, и их ближайшая замена
+SAVE_FORMATS = {'MPO': 'JPEG'}
+# Форматы, которые Pillow умеет декодировать сразу в уменьшенном
+# масштабе (`draft`); остальные декодируются целиком
+DRAFT_FORMATS = {'JPEG', 'MPO'}
+# Ключи image.info, нужные для отрисовки; остальное (EXIF, XMP, ICC,
+# текстовые блоки PNG, комментарии GIF) — метаданные и не сохраняется
+RENDER_INFO = ('transparency', 'duration', 'loop', 'background')
+SAVE_OPTIONS = {
+    'JPEG': {'optimize': True, 'progressive': True},
+    'PNG': {'optimize': True},
+}
+
+
+def too_large(limit):
+    return ValidationError(
+        'Картинка больше %(limit)s Мп.',
+        params={'limit': f'{limit / 10 ** 6:g}'},
+        code='too_many_pixels',
+    )
+
+
+def pixel_limit(image_format):
+    """Предел пикселей для формата картинки.
+
+    PNG, GIF, WebP и прочие декодируются в полный размер, поэтому для
+    них действует меньший POST_IMAGE_MAX_DECODED_PIXELS.
+    """
+    if image_format in DRAFT_FORMATS:
+        return settings.POST_IMAGE_MAX_PIXELS
+    return min(settings.POST_IMAGE_MAX_PIXELS,
+               settings.POST_IMAGE_MAX_DECODED_PIXELS)
+
+
+def open_header(upload):
+    """Открывает картинку, прочитав только заголовок, и проверяет размеры.
+
+    Pillow открывает файл лениво: до `load()` пиксели не декодируются,
+    поэтому слишком большой файл или «бомба» отбрасывается раньше, чем
+    займёт память.
+    """
+    if upload.size > settings.POST_IMAGE_MAX_UPLOAD_SIZE:
+        raise ValidationError(
+            'Файл больше %(limit)s МБ.',
+            params={'limit': settings.POST_IMAGE_MAX_UPLOAD_SIZE >> 20},
+            code='file_too_large',
+        )
+    upload.seek(0)
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter('error', Image.DecompressionBombWarning)
+            image = Image.open(upload)
+    except (Image.DecompressionBombWarning, Image.DecompressionBombError):
+        raise too_large(settings.POST_IMAGE_MAX_PIXELS)
+    except OSError:
+        raise ValidationError('Не удалось прочитать картинку.',
+                              code='invalid_image')
+    limit = pixel_limit(image.format)
+    if image.width * image.height > limit:
+        raise too_large(limit)
+    return image
+
+
+def strip(image):
+    """Убирает из картинки метаданные, которые Pillow записал бы при
+    сохранении из `image.info`."""
+    image.info = {key: value for key, value in image.info.items()
+                  if key in RENDER_INFO}
+    return image
+
+
+def frames(image, max_side):
+    """Кадры анимации, уменьшенные до `max_side`, и их длительности."""
+    result, durations = [], []
+    for frame in ImageSequence.Iterator(image):
+        durations.append(frame.info.get('duration', 0))
+        frame = frame.copy()
+        frame.thumbnail((max_side, max_side))
+        result.append(strip(frame))
+    return result, durations
+
+
+def process(upload):
+    """Поворачивает картинку по EXIF, ужимает до POST_IMAGE_MAX_SIDE и
+    пересжимает без метаданных.
+
+    Возвращает файл с прежним именем и размеры картинки. JPEG
+    декодируется сразу в уменьшенном масштабе (`draft`); остальные
+    форматы декодируются целиком, поэтому их размер ограничен строже
+    (`pixel_limit`). Результат
+    пишется во временный файл, который уходит на диск, если не
+    помещается в FILE_UPLOAD_MAX_MEMORY_SIZE. Анимация пересжимается
+    по кадрам; все её кадры вместе ограничены POST_IMAGE_MAX_PIXELS.
+    """
+    image = open_header(upload)
+    animated = (getattr(image, 'is_animated', False)
+                and image.format != 'MPO')
+    if (animated and image.n_frames * image.width * image.height
+            > settings.POST_IMAGE_MAX_PIXELS):
+        raise too_large(settings.POST_IMAGE_MAX_PIXELS)
+    max_side = settings.POST_IMAGE_MAX_SIDE
+    image_format = SAVE_FORMATS.get(image.format, image.format)
+    options = {'quality': settings.POST_IMAGE_QUALITY,
+               # Пустой EXIF: иначе Pillow перенёс бы исходный
+               'exif': b'',
+               **SAVE_OPTIONS.get(image_format, {})}
+    try:
+        output = SpooledTemporaryFile(
+            max_size=settings.FILE_UPLOAD_MAX_MEMORY_SIZE)
+        if animated:
+            loop = ({'loop': image.info['loop']}
+                    if 'loop' in image.info else {})
+            (image, *rest), durations = frames(image, max_side)
+            image.save(output, image_format, save_all=True,
+                       append_images=rest, duration=durations, **loop,
+                       **options)
+        else:
+            image.draft(None, (max_side, max_side))
+            if image.getexif().get(ORIENTATION, 1) != 1:
+                image = ImageOps.exif_transpose(image)
+            image.thumbnail((max_side, max_side))
+            strip(image).save(output, image_format, **options)
+    except (KeyError, OSError, ValueError):
+        raise ValidationError('Не удалось обработать картинку.',
+                              code='invalid_image')
+    output.seek(0)
+    return File(output, name=upload.name), image.size
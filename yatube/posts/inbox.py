@@ -0,0 +1,141 @@
+from django.conf import settings
+from django.db import connection
+
+from . import shards
+from .models import Follow, Inbox, Post, User
+
+# Первая лишняя запись ленты каждого пользователя: OFFSET по индексу
+# (user, pub_date) в обратном порядке, без сортировки и без чтения
+# лент, которые не переполнены сверх того, что в них есть
+OVERFLOW_SQL = '''
+    SELECT user_id, pub_date, id FROM {inbox} WHERE id IN (
+        SELECT (
+            SELECT id FROM {inbox}
+            WHERE user_id = users.id
+            ORDER BY pub_date DESC, id DESC LIMIT 1 OFFSET %s
+        ) FROM {users_table} AS users WHERE users.id IN ({users})
+    )
+'''
+# Лишняя запись и всё, что старше неё, — диапазон того же индекса
+TRIM_SQL = '''
+    DELETE FROM {inbox} WHERE user_id = %s AND (pub_date, id) <= (%s, %s)
+'''
+# Последние посты каждого автора отбираются ещё до соединения с
+# подписками, а соединение идёт от подписок пачки пользователей (CROSS
+# JOIN фиксирует порядок для SQLite): иначе на каждый пост плодовитого
+# автора перебирались бы все пользователи пачки
+REBUILD_SQL = '''
+    INSERT INTO {inbox} (user_id, post_id, pub_date)
+    SELECT user_id, post_id, pub_date FROM (
+        SELECT follow.user_id, recent.id AS post_id, recent.pub_date,
+               ROW_NUMBER() OVER (
+                   PARTITION BY follow.user_id
+                   ORDER BY recent.pub_date DESC, recent.id DESC
+               ) AS position
+        FROM {follow} AS follow
+        CROSS JOIN (
+            SELECT id, author_id, pub_date FROM (
+                SELECT id, author_id, pub_date, ROW_NUMBER() OVER (
+                    PARTITION BY author_id ORDER BY pub_date DESC, id DESC
+                ) AS position
+                FROM {post} WHERE author_id IN (
+                    SELECT author_id FROM {follow} WHERE user_id IN ({users})
+                )
+            ) AS ranked WHERE position <= %s
+        ) AS recent
+        WHERE follow.user_id IN ({users})
+            AND recent.author_id = follow.author_id
+    ) AS feed WHERE position <= %s
+'''
+
+
+def trim(user_ids, size=settings.INBOX_SIZE):
+    """Оставляет в ленте каждого пользователя не больше `size` записей.
+
+    Для каждой ленты ищется запись под номером `size + 1`, а удаляются
+    только ленты, где она есть: после публикации поста это лишь те
+    подписчики, чья лента уже была полной, по одной записи.
+    """
+    user_ids = list(user_ids)
+    inbox = Inbox._meta.db_table
+    for start in range(0, len(user_ids), settings.INBOX_BATCH_SIZE):
+        batch = user_ids[start:start + settings.INBOX_BATCH_SIZE]
+        sql = OVERFLOW_SQL.format(inbox=inbox,
+                                  users_table=User._meta.db_table,
+                                  users=', '.join(['%s'] * len(batch)))
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [size, *batch])
+            overflow = cursor.fetchall()
+            if overflow:
+                cursor.executemany(TRIM_SQL.format(inbox=inbox), overflow)
+
+
+def followers(author_id):
+    return list(Follow.objects.filter(author_id=author_id)
+                .values_list('user_id', flat=True))
+
+
+def fan_out(post):
+    """Раскладывает новый пост по лентам подписчиков автора.
+
+    Возвращает id подписчиков, чьи ленты изменились. С шардами Inbox
+    не ведётся: ленту подписок собирает слияние шардов.
+    """
+    followers_ids = followers(post.author_id)
+    if shards.enabled():
+        return followers_ids
+    Inbox.objects.bulk_create(
+        (Inbox(user_id=user_id, post=post, pub_date=post.pub_date)
+         for user_id in followers_ids),
+        batch_size=settings.INBOX_BATCH_SIZE,
+        ignore_conflicts=True,
+    )
+    trim(followers_ids)
+    return followers_ids
+
+
+def backfill(user_id, author_id):
+    """Добавляет в ленту подписчика последние посты автора."""
+    if shards.enabled():
+        return
+    posts = (Post.objects.filter(author_id=author_id)
+             .order_by('-pub_date', '-id')
+             .values_list('id', 'pub_date')[:settings.INBOX_SIZE])
+    Inbox.objects.bulk_create(
+        (Inbox(user_id=user_id, post_id=post_id, pub_date=pub_date)
+         for post_id, pub_date in posts),
+        batch_size=settings.INBOX_BATCH_SIZE,
+        ignore_conflicts=True,
+    )
+    trim([user_id])
+
+
+def prune(user_id, author_id):
+    """Убирает из ленты подписчика посты автора, от которого он отписался."""
+    Inbox.objects.filter(user_id=user_id,
+                         post__author_id=author_id).delete()
+
+
+def rebuild(user_id):
+    """Собирает ленту пользователя заново по его подпискам."""
+    rebuild_many([user_id])
+
+
+def rebuild_many(user_ids, size=settings.INBOX_SIZE):
+    """Собирает заново ленты нескольких пользователей.
+
+    Ленты пишутся одним INSERT ... SELECT на пачку пользователей, без
+    объектов Inbox в Python: так пересборка после массовой загрузки
+    упирается в базу, а не в ORM. С шардами Inbox не ведётся.
+    """
+    if shards.enabled():
+        return
+    user_ids = list(user_ids)
+    for start in range(0, len(user_ids), settings.INBOX_BATCH_SIZE):
+        batch = user_ids[start:start + settings.INBOX_BATCH_SIZE]
+        Inbox.objects.filter(user_id__in=batch).delete()
+        sql = REBUILD_SQL.format(
+            inbox=Inbox._meta.db_table, follow=Follow._meta.db_table,
+            post=Post._meta.db_table, users=', '.join(['%s'] * len(batch)))
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [*batch, size, *batch, size])
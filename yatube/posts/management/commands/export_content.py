@@ -0,0 +1,59 @@
+import sys
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+
+from posts import export
+from posts.models import User
+
+
+class Command(BaseCommand):
+    help = ('Выгружает посты, комментарии или подписки в NDJSON или CSV '
+            'потоком, не загружая таблицу в память.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('table', nargs='?', choices=export.TABLES,
+                            help='Что выгружать.')
+        parser.add_argument('--format', dest='output_format',
+                            choices=export.FORMATS, default='ndjson')
+        parser.add_argument(
+            '--chunk-size', type=int, default=None,
+            help='Сколько строк читать из базы за один запрос.',
+        )
+        parser.add_argument(
+            '--user', dest='username',
+            help='Собрать zip со всеми данными и картинками пользователя.',
+        )
+        parser.add_argument(
+            '--output', '-o',
+            help='Файл для выгрузки; по умолчанию stdout.',
+        )
+
+    def handle(self, *args, table, output_format, chunk_size, username,
+               output, **options):
+        if username:
+            self.write_archive(username, output)
+            return
+        if table is None:
+            raise CommandError('Укажите таблицу или --user.')
+        lines = export.lines(table, output_format, chunk_size)
+        if output:
+            with open(output, 'w', encoding='utf-8', newline='') as target:
+                target.writelines(lines)
+        else:
+            for line in lines:
+                self.stdout.write(line, ending='')
+
+    def write_archive(self, username, output):
+        user = User.objects.filter(username=username).first()
+        if user is None:
+            raise CommandError(f'Пользователь {username} не найден.')
+        if output is None and sys.stdout.isatty():
+            raise CommandError('Архив пишется в файл: укажите --output.')
+        target = open(output, 'wb') if output else sys.stdout.buffer
+        try:
+            for data in export.user_archive(user, default_storage):
+                target.write(data)
+        finally:
+            if output:
+                target.close()
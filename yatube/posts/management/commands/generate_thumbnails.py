@@ -0,0 +1,46 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+
+from posts import shards, thumbnails
+from posts.models import Post
+
+
+class Command(BaseCommand):
+    help = 'Строит миниатюры картинок постов в несколько потоков.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers', type=int, default=4,
+            help='Сколько миниатюр строить одновременно.',
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=200,
+            help='Сколько постов выбирать из базы за раз.',
+        )
+        parser.add_argument(
+            '--force', action='store_true',
+            help='Перестроить и уже готовые миниатюры.',
+        )
+
+    def handle(self, *args, workers, batch_size, force, **options):
+        posts = Post.objects.exclude(image='').order_by('pk')
+        if not force:
+            posts = posts.filter(thumbnail='')
+        built, failed = 0, 0
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            # С шардами посты лежат в нескольких базах: обходим каждую
+            for alias in shards.aliases():
+                ids = posts.using(alias).values_list('pk', flat=True)
+                last_id = 0
+                while True:
+                    batch = list(ids.filter(pk__gt=last_id)[:batch_size])
+                    if not batch:
+                        break
+                    for url in pool.map(thumbnails.run, batch):
+                        if url:
+                            built += 1
+                        else:
+                            failed += 1
+                    last_id = batch[-1]
+        self.stdout.write(f'Построено миниатюр: {built}, пропущено: {failed}')
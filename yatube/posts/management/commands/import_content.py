@@ -0,0 +1,70 @@
+import json
+import sys
+import time
+from itertools import islice
+
+from django.core.management.base import BaseCommand, CommandError
+
+from posts import search, shards
+from posts.importer import SHARDS_UNSUPPORTED, Importer
+
+
+class Command(BaseCommand):
+    help = ('Загружает посты, комментарии и подписки из NDJSON пачками '
+            'через bulk_create.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Файл NDJSON или «-» для stdin.')
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Сколько строк вставлять одним INSERT.',
+        )
+        parser.add_argument(
+            '--chunk-size', type=int, default=20000,
+            help='Сколько записей загружать в одной транзакции.',
+        )
+
+    def handle(self, *args, path, batch_size, chunk_size, **options):
+        if shards.enabled():
+            raise CommandError(SHARDS_UNSUPPORTED)
+        source = (sys.stdin if path == '-'
+                  else open(path, encoding='utf-8'))
+        started = time.monotonic()
+        importer = Importer(batch_size)
+        try:
+            records = (self.parse(number, line)
+                       for number, line in enumerate(source, 1)
+                       if line.strip())
+            with search.deferred_index():
+                while True:
+                    chunk = list(islice(records, chunk_size))
+                    if not chunk:
+                        break
+                    importer.load(chunk)
+        finally:
+            if source is not sys.stdin:
+                source.close()
+        loaded = time.monotonic() - started
+        importer.rebuild()
+        elapsed = time.monotonic() - started
+        counts = importer.counts
+        rows = counts['posts'] + counts['comments'] + counts['follows']
+        self.stdout.write(
+            f'Постов: {counts["posts"]}, комментариев: {counts["comments"]}, '
+            f'подписок: {counts["follows"]}, новых пользователей: '
+            f'{counts["users"]}, групп: {counts["groups"]}, '
+            f'пропущено: {counts["skipped"]}.')
+        self.stdout.write(
+            f'Загрузка: {loaded:.1f} с ({rows / max(loaded, 1e-6):.0f} '
+            f'строк/с), с пересборкой: {elapsed:.1f} с, '
+            f'лент пересобрано: {counts["inboxes"]}.')
+        if counts['images']:
+            self.stdout.write(
+                f'Постов с картинками: {counts["images"]}. Миниатюры для '
+                f'них строит команда generate_thumbnails.')
+
+    def parse(self, number, line):
+        try:
+            return json.loads(line)
+        except ValueError as error:
+            raise CommandError(f'Строка {number}: {error}')
@@ -0,0 +1,154 @@
+from operator import attrgetter
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.db.models import Max
+
+from posts import caching, shards
+from posts.importer import batches, bulk_insert, imported_dates
+from posts.models import Comment, Follow, Inbox, MovedPost, Post
+
+
+def delete_rows(alias, model, column, values):
+    """DELETE без ORM: queryset.delete() разослал бы сигналы, и
+    счётчики авторов уменьшились бы, хотя посты только переехали."""
+    connection = connections[alias]
+    quote = connection.ops.quote_name
+    with connection.cursor() as cursor:
+        for batch in batches(values):
+            cursor.execute(
+                'DELETE FROM {} WHERE {} IN ({})'.format(
+                    quote(model._meta.db_table), quote(column),
+                    ', '.join(['%s'] * len(batch))),
+                batch)
+
+
+def renumber(model, target, rows, key, in_place, above=0):
+    """Выдаёт новые id строкам, чей id не в бакете `key(строки)` или
+    уже занят в `target`; новые id больше `above`. Возвращает словарь
+    старый id → новый."""
+    taken = set()
+    if not in_place:
+        for batch in batches([row.pk for row in rows]):
+            taken.update(model._base_manager.using(target)
+                         .filter(pk__in=batch).values_list('pk', flat=True))
+    misfits = [row for row in rows
+               if row.pk in taken or not shards.in_bucket(row.pk, key(row))]
+    # Новые id не должны совпасть с id, которые переезжают как есть
+    moving = {row.pk for row in misfits}
+    kept = max((row.pk for row in rows if row.pk not in moving), default=0)
+    ids = shards.allocate(model, target,
+                          [shards.bucket(key(row)) for row in misfits],
+                          above=max(kept, above))
+    mapping = {}
+    for row, pk in zip(misfits, ids):
+        mapping[row.pk] = row.pk = pk
+    return mapping
+
+
+def record_moves(mapping):
+    """Запоминает старые id постов (MovedPost), чтобы старые адреса
+    вели на новые. Пост, переезжавший и раньше, ведёт сразу на новый."""
+    earlier = []
+    for batch in batches(list(mapping)):
+        earlier.extend(MovedPost.objects.filter(new_id__in=batch))
+    for move in earlier:
+        move.new_id = mapping[move.new_id]
+    MovedPost.objects.bulk_update(earlier, ['new_id'], batch_size=500)
+    MovedPost.objects.bulk_create(
+        [MovedPost(old_id=old_id, new_id=new_id)
+         for old_id, new_id in mapping.items()], batch_size=500)
+
+
+class Command(BaseCommand):
+    help = ('Раскладывает посты с их комментариями по шардам, которые им '
+            'назначает POST_SHARDS: после включения шардирования или '
+            'изменения списка шардов. Пост, чей id не несёт бакет автора '
+            '(создан до шардирования), получает новый id, а старые адреса '
+            'поста ведут на новый.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--source', action='append', dest='sources', default=[],
+            help='Из какой базы забирать посты; по умолчанию основная и '
+                 'все из POST_SHARDS. Укажите выведенный из POST_SHARDS '
+                 'шард, чтобы опустошить его.',
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=500,
+            help='Сколько постов переносить в одной транзакции.',
+        )
+
+    def handle(self, *args, sources, batch_size, **options):
+        sources = sources or [DEFAULT_DB_ALIAS, *settings.POST_SHARDS]
+        for alias in sources:
+            if alias not in settings.DATABASES:
+                raise CommandError(f'Нет базы {alias} в DATABASES.')
+        # Новые id больше всех прежних: старый id переехавшего поста не
+        # достанется другому посту, и адрес по нему не сменит смысл
+        self.above = max(
+            [shards.moved_above()]
+            + [Post._base_manager.using(alias).aggregate(top=Max('pk'))['top']
+               or 0 for alias in dict.fromkeys(
+                   [DEFAULT_DB_ALIAS, *settings.POST_SHARDS, *sources])])
+        with imported_dates(Post, Comment):
+            for source in dict.fromkeys(sources):
+                posts, comments = self.drain(source, batch_size)
+                self.stdout.write(f'{source}: перенесено постов: {posts}, '
+                                  f'комментариев: {comments}')
+
+    def drain(self, source, batch_size):
+        queryset = Post._base_manager.using(source).order_by('pk')
+        last_id, moved_posts, moved_comments = 0, 0, 0
+        while True:
+            batch = list(queryset.filter(pk__gt=last_id)[:batch_size])
+            if not batch:
+                return moved_posts, moved_comments
+            last_id = batch[-1].pk
+            misplaced = {}
+            for post in batch:
+                target = (shards.for_author(post.author_id)
+                          or DEFAULT_DB_ALIAS)
+                if (target != source
+                        or not shards.in_bucket(post.pk, post.author_id)):
+                    misplaced.setdefault(target, []).append(post)
+            for target, posts in misplaced.items():
+                moved_posts += len(posts)
+                moved_comments += self.move(source, target, posts,
+                                            batch_size)
+
+    def move(self, source, target, posts, batch_size):
+        """Переносит посты и их комментарии одной транзакцией в каждой
+        из баз. Возвращает число перенесённых комментариев."""
+        old_ids = [post.pk for post in posts]
+        scopes = {'index', *(f'post:{pk}' for pk in old_ids)}
+        scopes.update(f'author:{post.author_id}' for post in posts)
+        scopes.update(f'group:{post.group_id}' for post in posts
+                      if post.group_id)
+        comments = list(Comment._base_manager.using(source)
+                        .filter(post_id__in=old_ids).order_by('pk'))
+        in_place = source == target
+        with transaction.atomic(using=DEFAULT_DB_ALIAS), \
+                transaction.atomic(using=source), \
+                transaction.atomic(using=target):
+            new_ids = renumber(Post, target, posts,
+                               attrgetter('author_id'), in_place,
+                               self.above)
+            record_moves(new_ids)
+            for comment in comments:
+                comment.post_id = new_ids.get(comment.post_id,
+                                              comment.post_id)
+            renumber(Comment, target, comments, attrgetter('post_id'),
+                     in_place)
+            for model, column in ((Inbox, 'post_id'), (Comment, 'post_id'),
+                                  (Post, 'id')):
+                delete_rows(source, model, column, old_ids)
+            bulk_insert(Post, posts, batch_size, using=target)
+            bulk_insert(Comment, comments, batch_size, using=target)
+        # Старые адреса постов и ленты с ними устарели
+        followers = (Follow.objects
+                     .filter(author_id__in={post.author_id for post in posts})
+                     .values_list('user_id', flat=True).distinct())
+        caching.bump(*scopes, *(f'inbox:{user_id}' for user_id in followers))
+        return len(comments)
@@ -0,0 +1,87 @@
+import time
+from itertools import chain, islice
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+
+from posts import search, shards
+from posts.importer import SHARDS_UNSUPPORTED, Importer
+from posts.seeding import Seeder
+
+
+class Command(BaseCommand):
+    help = ('Заполняет базу синтетическими пользователями, группами, '
+            'постами, комментариями и подписками. При одном и том же '
+            '--seed данные получаются одинаковыми.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--groups', type=int, default=50)
+        parser.add_argument('--posts', type=int, default=10000)
+        parser.add_argument('--comments', type=int, default=20000)
+        parser.add_argument(
+            '--follows', type=float, default=20,
+            help='Сколько в среднем авторов читает пользователь.',
+        )
+        parser.add_argument(
+            '--image-share', type=float, default=0.2,
+            help='Доля постов с картинкой, от 0 до 1.',
+        )
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Сколько строк вставлять одним INSERT.',
+        )
+        parser.add_argument(
+            '--chunk-size', type=int, default=20000,
+            help='Сколько записей загружать в одной транзакции.',
+        )
+
+    def handle(self, *args, users, groups, posts, comments, follows,
+               image_share, seed, batch_size, chunk_size, **options):
+        if shards.enabled():
+            raise CommandError(SHARDS_UNSUPPORTED)
+        if users < 1 and (posts or comments):
+            raise CommandError('Для постов и комментариев нужен хотя бы '
+                               'один пользователь.')
+        if not 0 <= image_share <= 1:
+            raise CommandError('--image-share должен быть от 0 до 1.')
+        if comments and not posts:
+            raise CommandError('Комментарии нельзя создать без постов.')
+        started = time.monotonic()
+        seeder = Seeder(seed)
+        new_users = seeder.users(users, batch_size)
+        new_groups = seeder.groups(groups, batch_size)
+        images = seeder.images(default_storage) if image_share else []
+        importer = Importer(batch_size)
+        records = chain(
+            seeder.posts(posts, users, groups, image_share, images),
+            seeder.comments(comments, users, posts),
+            seeder.follows(users, follows),
+        )
+        with search.deferred_index():
+            while True:
+                chunk = list(islice(records, chunk_size))
+                if not chunk:
+                    break
+                importer.load(chunk)
+                self.stdout.write(
+                    f'… постов: {importer.counts["posts"]}, комментариев: '
+                    f'{importer.counts["comments"]}, подписок: '
+                    f'{importer.counts["follows"]}')
+        loaded = time.monotonic() - started
+        importer.rebuild()
+        elapsed = time.monotonic() - started
+        counts = importer.counts
+        rows = (new_users + new_groups + counts['posts']
+                + counts['comments'] + counts['follows'])
+        self.stdout.write(
+            f'Пользователей: {new_users}, групп: {new_groups}, постов: '
+            f'{counts["posts"]}, комментариев: {counts["comments"]}, '
+            f'подписок: {counts["follows"]}.')
+        self.stdout.write(
+            f'Загрузка: {loaded:.1f} с ({rows / max(loaded, 1e-6):.0f} '
+            f'строк/с), с пересборкой: {elapsed:.1f} с.')
+        if images:
+            self.stdout.write('Миниатюры для постов с картинками строит '
+                              'команда generate_thumbnails.')
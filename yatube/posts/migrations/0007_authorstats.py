@@ -0,0 +1,63 @@
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, migrations, models
+from django.db.models import Count
+import django.db.models.deletion
+
+
+def fill_author_stats(apps, schema_editor):
+    alias = schema_editor.connection.alias
+    # Статистика, как и пользователи, лежит только в основной базе:
+    # в шарде (migrate --database shard_1) заполнять нечего
+    if alias != DEFAULT_DB_ALIAS:
+        return
+    User = apps.get_model(*settings.AUTH_USER_MODEL.split('.'))
+    AuthorStats = apps.get_model('posts', 'AuthorStats')
+    Post = apps.get_model('posts', 'Post')
+    Comment = apps.get_model('posts', 'Comment')
+    Follow = apps.get_model('posts', 'Follow')
+    counters = {
+        'posts_count': Post.objects.using(alias).values_list('author_id'),
+        'comments_count': (Comment.objects.using(alias)
+                           .values_list('author_id')),
+        'followers_count': (Follow.objects.using(alias)
+                            .values_list('author_id')),
+        'following_count': Follow.objects.using(alias).values_list('user_id'),
+    }
+    counters = {
+        field: dict(rows.annotate(total=Count('id')).order_by())
+        for field, rows in counters.items()
+    }
+    AuthorStats.objects.using(alias).bulk_create(
+        (AuthorStats(user_id=user_id, **{
+            field: totals.get(user_id, 0)
+            for field, totals in counters.items()
+        }) for user_id in (User.objects.using(alias)
+                           .values_list('pk', flat=True))),
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('posts', '0006_inbox'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AuthorStats',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+                ('posts_count', models.PositiveIntegerField(default=0, verbose_name='Постов')),
+                ('comments_count', models.PositiveIntegerField(default=0, verbose_name='Комментариев')),
+                ('followers_count', models.PositiveIntegerField(default=0, verbose_name='Подписчиков')),
+                ('following_count', models.PositiveIntegerField(default=0, verbose_name='Подписок')),
+            ],
+            options={
+                'verbose_name': 'статистика автора',
+                'verbose_name_plural': 'статистика авторов',
+            },
+        ),
+        migrations.RunPython(fill_author_stats, migrations.RunPython.noop),
+    ]
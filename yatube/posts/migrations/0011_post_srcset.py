@@ -0,0 +1,21 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0010_post_thumbnail'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='srcset',
+            field=models.TextField(blank=True, editable=False, help_text='Готовые ширины картинки в исходном формате для srcset', verbose_name='Размеры картинки'),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='srcset_webp',
+            field=models.TextField(blank=True, editable=False, help_text='Готовые ширины картинки в WebP для srcset', verbose_name='Размеры картинки в WebP'),
+        ),
+    ]
@@ -0,0 +1,107 @@
+from django.db import DEFAULT_DB_ALIAS, migrations
+
+# SQLite меняет поле, пересоздавая таблицу, а триггеры индекса из 0015
+# удаляются вместе со старой posts_post: ставим их заново
+TRIGGERS_SQL = [
+    'DROP TRIGGER IF EXISTS posts_post_search_insert',
+    'DROP TRIGGER IF EXISTS posts_post_search_delete',
+    'DROP TRIGGER IF EXISTS posts_post_search_update',
+    '''CREATE TRIGGER posts_post_search_insert AFTER INSERT ON posts_post
+    BEGIN
+        INSERT INTO posts_post_search(rowid, text)
+        VALUES (new.id, new.text);
+    END''',
+    '''CREATE TRIGGER posts_post_search_delete AFTER DELETE ON posts_post
+    BEGIN
+        INSERT INTO posts_post_search(posts_post_search, rowid, text)
+        VALUES ('delete', old.id, old.text);
+    END''',
+    '''CREATE TRIGGER posts_post_search_update
+    AFTER UPDATE OF text ON posts_post
+    BEGIN
+        INSERT INTO posts_post_search(posts_post_search, rowid, text)
+        VALUES ('delete', old.id, old.text);
+        INSERT INTO posts_post_search(rowid, text)
+        VALUES (new.id, new.text);
+    END''',
+]
+
+
+class DropShardForeignKeys(migrations.operations.base.Operation):
+    """Снимает ограничения внешних ключей `names` модели в шардах.
+
+    Пользователи и группы лежат в основной базе: там ключи на них верны
+    и остаются, а в шарде ссылаться не на что. Модель не меняется —
+    ключи остаются в ORM, поэтому состояние миграций то же. SQLite
+    пересоздаёт таблицу по модели, поэтому поля меняются по очереди, и
+    каждое следующее изменение видит уже снятые ключи.
+    """
+    reduces_to_sql = False
+    reversible = True
+
+    def __init__(self, model_name, names):
+        self.model_name = model_name
+        self.names = names
+
+    def deconstruct(self):
+        return self.__class__.__name__, [], {
+            'model_name': self.model_name, 'names': self.names}
+
+    def state_forwards(self, app_label, state):
+        pass
+
+    def _steps(self, app_label, state):
+        """AlterField для каждого поля и состояния до и после него."""
+        steps = []
+        for name in self.names:
+            field = (state.models[app_label, self.model_name]
+                     .get_field_by_name(name).clone())
+            field.db_constraint = False
+            operation = migrations.AlterField(self.model_name, name, field)
+            loose = state.clone()
+            operation.state_forwards(app_label, loose)
+            steps.append((operation, state, loose))
+            state = loose
+        return steps
+
+    def database_forwards(self, app_label, schema_editor, from_state,
+                          to_state):
+        if schema_editor.connection.alias == DEFAULT_DB_ALIAS:
+            return
+        for operation, before, after in self._steps(app_label, from_state):
+            operation.database_forwards(app_label, schema_editor, before,
+                                        after)
+        restore_triggers(schema_editor, self.model_name)
+
+    def database_backwards(self, app_label, schema_editor, from_state,
+                           to_state):
+        if schema_editor.connection.alias == DEFAULT_DB_ALIAS:
+            return
+        for operation, before, after in reversed(
+                self._steps(app_label, to_state)):
+            operation.database_backwards(app_label, schema_editor, after,
+                                         before)
+        restore_triggers(schema_editor, self.model_name)
+
+    def describe(self):
+        return (f'Drop foreign key constraints of {self.model_name} '
+                f'outside the default database')
+
+
+def restore_triggers(schema_editor, model_name):
+    if schema_editor.connection.vendor != 'sqlite' or model_name != 'post':
+        return
+    for sql in TRIGGERS_SQL:
+        schema_editor.execute(sql)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0015_post_search'),
+    ]
+
+    operations = [
+        DropShardForeignKeys(model_name='comment', names=['author']),
+        DropShardForeignKeys(model_name='post', names=['author', 'group']),
+    ]
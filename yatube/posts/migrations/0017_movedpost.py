@@ -0,0 +1,22 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0016_shard_foreign_keys'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MovedPost',
+            fields=[
+                ('old_id', models.PositiveIntegerField(primary_key=True, serialize=False, verbose_name='Старый id')),
+                ('new_id', models.PositiveIntegerField(db_index=True, verbose_name='Новый id')),
+            ],
+            options={
+                'verbose_name': 'переехавший пост',
+                'verbose_name_plural': 'переехавшие посты',
+            },
+        ),
+    ]
@@ -6,6 +6,18 @@ from django.db.models.constraints import CheckConstraint, UniqueConstraint
 User = get_user_model()
 
 
+class RoutedQuerySet(models.QuerySet):
+    """create() отдаёт выбор базы роутеру вместе с самим объектом:
+    без подсказки `instance` новый пост или комментарий не попал бы в
+    шард автора поста (posts.shards)."""
+
+    def create(self, **kwargs):
+        obj = self.model(**kwargs)
+        self._for_write = True
+        obj.save(force_insert=True, using=self._db)
+        return obj
+
+
 class Group(models.Model):
     title = models.CharField(max_length=200,
                              verbose_name='Название группы',
@@ -23,6 +35,9 @@ class Group(models.Model):
         verbose_name = 'Жанр'
         verbose_name_plural = 'Жанры'
         ordering = ('title',)
+        indexes = [
+            models.Index(fields=['title'], name='group_title_idx'),
+        ]
 
     def __str__(self) -> str:
         return self.title
@@ -30,10 +45,15 @@ class Group(models.Model):
 
 class Post(models.Model):
     POST_TEXT_LEN = 15
+    objects = RoutedQuerySet.as_manager()
+
     text = models.TextField(
         'Текст поста',
         help_text='Введите текст поста'
     )
+    # Пост может лежать в шарде (posts.shards), а пользователи и группы —
+    # в основной базе: внешний ключ в базе есть только в основной
+    # (миграция 0016), удаление в шардах ведут сигналы
     author = models.ForeignKey(
         User,
         on_delete=models.CASCADE,
@@ -52,23 +72,83 @@ class Post(models.Model):
         upload_to='posts/',
         blank=True
     )
+    image_width = models.PositiveIntegerField(
+        'Ширина картинки',
+        null=True,
+        blank=True,
+        editable=False
+    )
+    image_height = models.PositiveIntegerField(
+        'Высота картинки',
+        null=True,
+        blank=True,
+        editable=False
+    )
+    thumbnail = models.CharField(
+        'Миниатюра',
+        max_length=255,
+        blank=True,
+        editable=False,
+        help_text='Адрес готовой миниатюры картинки'
+    )
+    srcset = models.TextField(
+        'Размеры картинки',
+        blank=True,
+        editable=False,
+        help_text='Готовые ширины картинки в исходном формате для srcset'
+    )
+    srcset_webp = models.TextField(
+        'Размеры картинки в WebP',
+        blank=True,
+        editable=False,
+        help_text='Готовые ширины картинки в WebP для srcset'
+    )
     pub_date = models.DateTimeField(
         'Дата публикации',
         auto_now_add=True
     )
+    updated = models.DateTimeField(
+        'Дата изменения',
+        auto_now=True
+    )
+    # Ведут сигналы комментариев: ленте не нужен подсчёт на каждую строку
+    comment_count = models.PositiveIntegerField(
+        'Комментариев',
+        default=0,
+        editable=False
+    )
 
     class Meta:
         verbose_name = 'Пост'
         verbose_name_plural = 'Посты'
         ordering = ['-pub_date']
         default_related_name = 'posts'
+        indexes = [
+            models.Index(fields=['author', '-pub_date', '-id'],
+                         name='post_author_pub_date_idx'),
+            models.Index(fields=['group', '-pub_date', '-id'],
+                         name='post_group_pub_date_idx'),
+            models.Index(fields=['-pub_date', '-id'],
+                         name='post_pub_date_id_idx'),
+        ]
 
     def __str__(self) -> str:
         return self.text[:Post.POST_TEXT_LEN]
 
+    def save(self, *args, **kwargs):
+        """Правка поста не переписывает comment_count: его сдвигают
+        сигналы одним UPDATE, и значение в объекте могло устареть."""
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name != 'comment_count']
+        super().save(*args, **kwargs)
+
 
 class Comment(models.Model):
     COMMENT_TEXT_LEN = 15
+    objects = RoutedQuerySet.as_manager()
+
     post = models.ForeignKey(
         Post,
         related_name='comments',
@@ -96,6 +176,10 @@ class Comment(models.Model):
 
     class Meta:
         ordering = ['-pub_date']
+        indexes = [
+            models.Index(fields=['post', '-pub_date', '-id'],
+                         name='comment_post_pub_date_idx'),
+        ]
         verbose_name = 'Комментарий'
         verbose_name_plural = 'Комментарии'
 
@@ -121,5 +205,86 @@ class Follow(models.Model):
                             name='could_not_follow_itself'),
             UniqueConstraint(fields=['user', 'author'], name='unique_follower')
         ]
+        indexes = [
+            models.Index(fields=['author', 'user'],
+                         name='follow_author_user_idx'),
+        ]
         verbose_name = 'подписка'
         verbose_name_plural = 'подписки'
+
+
+class AuthorStats(models.Model):
+    """Счётчики пользователя, которые показываются на его страницах.
+
+    Обновляются вместе с созданием и удалением постов, комментариев и
+    подписок; расхождения чинит команда `recount_author_stats`.
+    """
+    user = models.OneToOneField(
+        User,
+        primary_key=True,
+        related_name='stats',
+        on_delete=models.CASCADE,
+        verbose_name='Пользователь',
+    )
+    posts_count = models.PositiveIntegerField('Постов', default=0)
+    comments_count = models.PositiveIntegerField('Комментариев', default=0)
+    followers_count = models.PositiveIntegerField('Подписчиков', default=0)
+    following_count = models.PositiveIntegerField('Подписок', default=0)
+
+    class Meta:
+        verbose_name = 'статистика автора'
+        verbose_name_plural = 'статистика авторов'
+
+    def __str__(self) -> str:
+        return str(self.user_id)
+
+
+class Inbox(models.Model):
+    """Материализованная лента подписок: копия поста для каждого подписчика.
+
+    Строки добавляются при публикации поста и при подписке, удаляются
+    при отписке, поэтому страница `follow_index` читается одним
+    диапазоном по индексу (user, pub_date).
+    """
+    user = models.ForeignKey(
+        User,
+        related_name='inbox',
+        on_delete=models.CASCADE,
+        verbose_name='Подписчик',
+    )
+    post = models.ForeignKey(
+        Post,
+        related_name='inbox_entries',
+        on_delete=models.CASCADE,
+        verbose_name='Пост',
+    )
+    pub_date = models.DateTimeField('Дата публикации')
+
+    class Meta:
+        constraints = [
+            UniqueConstraint(fields=['user', 'post'], name='unique_inbox_post')
+        ]
+        indexes = [
+            models.Index(fields=['user', 'pub_date'],
+                         name='inbox_user_pub_date_idx'),
+        ]
+        ordering = ['-pub_date']
+        verbose_name = 'запись ленты подписок'
+        verbose_name_plural = 'лента подписок'
+
+
+class MovedPost(models.Model):
+    """Пост, получивший новый id при раскладке по шардам (reshard_posts).
+
+    Лежит в основной базе: по старому id адреса поста ведут на новый
+    (`shards.redirect_moved`), а новые посты старых id не получают.
+    """
+    old_id = models.PositiveIntegerField('Старый id', primary_key=True)
+    new_id = models.PositiveIntegerField('Новый id', db_index=True)
+
+    class Meta:
+        verbose_name = 'переехавший пост'
+        verbose_name_plural = 'переехавшие посты'
+
+    def __str__(self) -> str:
+        return f'{self.old_id} → {self.new_id}'
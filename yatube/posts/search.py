@@ -0,0 +1,99 @@
+import re
+from contextlib import contextmanager
+
+from django.db import connection
+from django.db.models import FloatField, Value
+from django.db.models.expressions import RawSQL
+
+from .models import Post
+
+TABLE = 'posts_post_search'
+MAX_TERMS = 10
+
+# RawSQL внутри pk__in обернулся бы в лишние скобки и стал скалярным
+# подзапросом, поэтому условие подставляется через extra()
+MATCHING_SQL = (f'{Post._meta.db_table}.id IN '
+                f'(SELECT rowid FROM {TABLE} WHERE {TABLE} MATCH %s)')
+# Для ранжирования индекс присоединяется к постам один раз: bm25
+# считается по строке соединения, а не коррелированным подзапросом
+# на каждую строку и каждое упоминание оценки в запросе
+JOIN_SQL = [f'{TABLE}.rowid = {Post._meta.db_table}.id', f'{TABLE} MATCH %s']
+# bm25 тем меньше, чем лучше совпадение; знак меняем, чтобы лучшие
+# результаты шли первыми при обычной сортировке ленты по убыванию
+SCORE_SQL = f'-bm25({TABLE})'
+
+# Триггер из миграции 0015, который индексирует каждый новый пост
+INSERT_TRIGGER = f'{TABLE}_insert'
+INSERT_TRIGGER_SQL = f'''
+    CREATE TRIGGER {INSERT_TRIGGER} AFTER INSERT ON {Post._meta.db_table}
+    BEGIN
+        INSERT INTO {TABLE}(rowid, text) VALUES (new.id, new.text);
+    END
+'''
+REBUILD_SQL = f"INSERT INTO {TABLE}({TABLE}) VALUES ('rebuild')"
+
+
+def available():
+    """Индекс FTS5 есть только в SQLite; в других базах ищем через LIKE."""
+    return connection.vendor == 'sqlite'
+
+
+def match_query(text):
+    """Превращает ввод пользователя в запрос FTS5.
+
+    Слова берутся в кавычки, чтобы операторы FTS5 в тексте не ломали
+    запрос, и ищутся по префиксу; все слова обязательны.
+    """
+    terms = re.findall(r'\w+', text.lower())[:MAX_TERMS]
+    return ' '.join(f'"{term}"*' for term in terms)
+
+
+def matching(queryset, text):
+    """Посты из `queryset`, в тексте которых есть все слова запроса."""
+    query = match_query(text)
+    if not query:
+        return queryset.none()
+    if not available():
+        for term in re.findall(r'\w+', text)[:MAX_TERMS]:
+            queryset = queryset.filter(text__icontains=term)
+        return queryset
+    return queryset.extra(where=[MATCHING_SQL], params=[query])
+
+
+def ranked(queryset, text):
+    """Найденные посты с оценкой `score`: чем выше, тем точнее.
+
+    Оценка выбирается колонкой, и сортировка идёт по её псевдониму.
+    """
+    query = match_query(text)
+    if not query or not available():
+        return matching(queryset, text).annotate(
+            score=Value(0.0, output_field=FloatField()))
+    return queryset.extra(tables=[TABLE], where=JOIN_SQL,
+                          params=[query]).annotate(
+        score=RawSQL(SCORE_SQL, [], output_field=FloatField()))
+
+
+@contextmanager
+def deferred_index():
+    """Массовая вставка постов без построчной индексации.
+
+    Триггер на вставку в разы замедляет bulk-загрузку, поэтому на время
+    блока он снимается, а после индекс перестраивается целиком из
+    таблицы постов. Догонять только новые id нельзя: пост, созданный
+    на сайте, пока триггера нет, и затем исправленный или удалённый,
+    отправит в индекс удаление строки, которой там нет, и испортит
+    его. Перестройка занимает время, пропорциональное числу всех
+    постов, зато исправляет и такие строки.
+    """
+    if not available():
+        yield
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f'DROP TRIGGER IF EXISTS {INSERT_TRIGGER}')
+    try:
+        yield
+    finally:
+        with connection.cursor() as cursor:
+            cursor.execute(INSERT_TRIGGER_SQL)
+            cursor.execute(REBUILD_SQL)
@@ -0,0 +1,158 @@
+import random
+from array import array
+from datetime import datetime, timedelta, timezone as dt_timezone
+from io import BytesIO
+from itertools import accumulate
+
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from faker import Faker
+from PIL import Image
+
+from .importer import bulk_insert
+from .models import Group, User
+
+# Даты постов отсчитываются от фиксированного дня, а не от «сейчас»:
+# при одном и том же зерне получается один и тот же набор данных
+ANCHOR = datetime(2023, 1, 1, tzinfo=dt_timezone.utc)
+PERIOD = timedelta(days=365)
+SENTENCES = 2000
+IMAGES = 16
+IMAGE_SIZES = ((960, 339), (1920, 1080), (640, 480), (1080, 1350))
+
+
+class Seeder:
+    """Детерминированный генератор данных yatube по зерну `seed`.
+
+    Тексты собираются из заранее созданного набора фраз Faker: вызывать
+    Faker на каждый из миллиона постов слишком долго. Подписки образуют
+    степенной граф: число подписок пользователя и популярность авторов
+    распределены по закону Ципфа.
+    """
+
+    def __init__(self, seed, zipf=1.1):
+        self.random = random.Random(seed)
+        self.fake = Faker('ru_RU')
+        self.fake.seed_instance(seed)
+        self.zipf = zipf
+        self.sentences = [self.fake.sentence(nb_words=10)
+                          for _ in range(SENTENCES)]
+        # Давность каждого поста в долях PERIOD: комментарий не может
+        # быть старше своего поста
+        self.post_ages = array('d')
+
+    def username(self, number):
+        return f'user{number}'
+
+    def users(self, count, batch_size):
+        """Создаёт пользователей user0…user{count-1} без пароля."""
+        password = make_password(None)
+        existing = set(User.objects.filter(
+            username__startswith='user').values_list('username', flat=True))
+        users = []
+        for number in range(count):
+            first_name = self.fake.first_name()
+            last_name = self.fake.last_name()
+            username = self.username(number)
+            if username not in existing:
+                users.append(User(username=username, password=password,
+                                  first_name=first_name,
+                                  last_name=last_name))
+        bulk_insert(User, users, batch_size)
+        return len(users)
+
+    def groups(self, count, batch_size):
+        existing = set(Group.objects.values_list('slug', flat=True))
+        groups = []
+        for number in range(count):
+            title = self.fake.catch_phrase()[:200]
+            slug = f'group-{number}'
+            if slug not in existing:
+                groups.append(Group(title=title, slug=slug,
+                                    description=self.text(2)))
+        bulk_insert(Group, groups, batch_size)
+        return len(groups)
+
+    def images(self, storage):
+        """Небольшой набор картинок, общий для всех постов с картинкой."""
+        images = []
+        for number in range(IMAGES):
+            width, height = IMAGE_SIZES[number % len(IMAGE_SIZES)]
+            name = f'posts/seed/seed-{number}.jpg'
+            color = tuple(self.random.randrange(256) for _ in range(3))
+            if not storage.exists(name):
+                buffer = BytesIO()
+                Image.new('RGB', (width, height), color).save(
+                    buffer, 'JPEG', quality=70)
+                name = storage.save(name, ContentFile(buffer.getvalue()))
+            images.append((name, width, height))
+        return images
+
+    def text(self, sentences):
+        return ' '.join(self.random.choices(self.sentences, k=sentences))
+
+    def date(self, oldest=1.0):
+        """Дата в пределах PERIOD до ANCHOR, не раньше `oldest` (доля
+        PERIOD)."""
+        return ANCHOR - PERIOD * (self.random.random() * oldest)
+
+    def weights(self, count):
+        """Накопленные веса Ципфа для выбора популярных пользователей."""
+        return list(accumulate(1 / (rank + 1) ** self.zipf
+                               for rank in range(count)))
+
+    def posts(self, count, users, groups, image_share, images):
+        weights = self.weights(users)
+        authors = range(users)
+        for number in range(count):
+            author = self.random.choices(authors, cum_weights=weights)[0]
+            text = self.text(self.random.randint(1, 6))
+            age = self.random.random()
+            self.post_ages.append(age)
+            record = {
+                'type': 'post',
+                'id': number,
+                'author': self.username(author),
+                'text': text,
+                'pub_date': ANCHOR - PERIOD * age,
+            }
+            if groups and self.random.random() < 0.7:
+                record['group'] = f'group-{self.random.randrange(groups)}'
+            if images and self.random.random() < image_share:
+                name, width, height = self.random.choice(images)
+                record.update(image=name, image_width=width,
+                              image_height=height)
+            yield record
+
+    def comments(self, count, users, posts):
+        """Комментарии к постам из `posts()`: их нужно выбрать раньше,
+        чтобы комментарий датировался не раньше поста."""
+        for _ in range(count):
+            post = self.random.randrange(posts)
+            yield {
+                'type': 'comment',
+                'post': post,
+                'author': self.username(self.random.randrange(users)),
+                'text': self.text(self.random.randint(1, 2)),
+                'pub_date': self.date(oldest=self.post_ages[post]),
+            }
+
+    def follows(self, users, average):
+        """Подписки: у немногих пользователей их много, у большинства —
+        единицы; подписываются чаще на популярных авторов."""
+        if users < 2 or not average:
+            return
+        weights = self.weights(users)
+        authors = range(users)
+        limit = users - 1
+        for user in range(users):
+            wanted = min(limit, int(self.random.paretovariate(1.5)
+                                    * average / 3))
+            chosen = set()
+            while len(chosen) < wanted:
+                author = self.random.choices(authors, cum_weights=weights)[0]
+                if author != user:
+                    chosen.add(author)
+            for author in sorted(chosen):
+                yield {'type': 'follow', 'user': self.username(user),
+                       'author': self.username(author)}
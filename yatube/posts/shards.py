@@ -0,0 +1,285 @@
+import heapq
+from collections import defaultdict
+from contextlib import contextmanager
+from functools import wraps
+from itertools import islice
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.db.models import Max
+from django.http import Http404, HttpResponsePermanentRedirect
+from django.urls import reverse
+
+from core.db import lock_for_write
+
+from .models import Comment, MovedPost, Post, User
+
+SHARDED = (Post, Comment)
+
+
+def enabled():
+    return bool(settings.POST_SHARDS)
+
+
+def aliases():
+    """Базы, в которых лежат посты: шарды или одна основная база."""
+    return list(dict.fromkeys(settings.POST_SHARDS)) or [DEFAULT_DB_ALIAS]
+
+
+def bucket(key):
+    """Бакет автора по его id или поста и комментария — по id поста.
+
+    Id постов и комментариев выдаёт `allocate`: в младших разрядах у
+    них бакет автора поста, поэтому шард поста виден по одному id.
+    """
+    return int(key) % settings.SHARD_BUCKETS
+
+
+def _alias(key):
+    if not enabled() or key is None:
+        return None
+    shards = settings.POST_SHARDS
+    return shards[bucket(key) % len(shards)]
+
+
+def for_author(author_id):
+    """Шард постов автора; None, пока шардов нет."""
+    return _alias(author_id)
+
+
+def for_post(post_id):
+    """Шард поста и его комментариев; None, пока шардов нет."""
+    return _alias(post_id)
+
+
+def share(alias):
+    """Какая доля бакетов лежит в шарде `alias`; без шардов — все."""
+    if not enabled():
+        return 1
+    return (sum(_alias(key) == alias for key in range(settings.SHARD_BUCKETS))
+            / settings.SHARD_BUCKETS)
+
+
+def in_bucket(pk, key):
+    """Лежит ли id `pk` в бакете `key` (без шардов — любой id годится)."""
+    return not enabled() or bucket(pk) == bucket(key)
+
+
+def allocate(model, alias, buckets, above=0):
+    """Новые id строк `model` в базе `alias` по одному на бакет из
+    `buckets`: номер больше всех id в базе и `above`, в младших
+    разрядах — бакет.
+
+    Разные бакеты одной базы не пересекаются, а каждый бакет живёт
+    только в одном шарде, поэтому id уникальны во всех шардах сразу.
+    """
+    top = (model._base_manager.using(alias)
+           .aggregate(top=Max('pk'))['top'] or 0)
+    start = max(top, above) // settings.SHARD_BUCKETS + 1
+    return [(start + number) * settings.SHARD_BUCKETS + key
+            for number, key in enumerate(buckets)]
+
+
+def assign_id(instance, using):
+    """Выдаёт id новому посту или комментарию, если шарды включены."""
+    if not enabled() or instance.pk is not None:
+        return
+    above = 0
+    if isinstance(instance, Post):
+        key = instance.author_id
+        # Старые id переехавших постов заново не выдаются: по ним
+        # адреса ведут на новые (`redirect_moved`)
+        above = moved_above()
+    else:
+        key = instance.post_id
+    instance.pk = allocate(type(instance), using, [bucket(key)],
+                           above)[0]
+
+
+def moved_above():
+    """Наибольший старый id переехавших постов (MovedPost)."""
+    return MovedPost.objects.aggregate(top=Max('old_id'))['top'] or 0
+
+
+def moved(post_id):
+    """Новый id поста, сменившего id при reshard_posts; иначе None."""
+    try:
+        post_id = int(post_id)
+    except ValueError:
+        return None
+    return (MovedPost.objects.filter(old_id=post_id)
+            .values_list('new_id', flat=True).first())
+
+
+def _moved_url(request, post_id):
+    if request.method not in ('GET', 'HEAD'):
+        return None
+    new_id = moved(post_id)
+    if new_id is None:
+        return None
+    match = request.resolver_match
+    url = reverse(match.view_name, args=match.args,
+                  kwargs={**match.kwargs, 'post_id': new_id})
+    query = request.META.get('QUERY_STRING')
+    return f'{url}?{query}' if query else url
+
+
+def redirect_moved(view):
+    """301 со старого id поста на новый, если пост получил его при
+    reshard_posts: старые ссылки на посты продолжают работать.
+
+    Таблица переездов читается, только когда поста не нашлось.
+    """
+    @wraps(view)
+    def wrapper(request, post_id, **kwargs):
+        try:
+            response = view(request, post_id=post_id, **kwargs)
+        except Http404:
+            url = _moved_url(request, post_id)
+            if url is None:
+                raise
+            return HttpResponsePermanentRedirect(url)
+        if response.status_code == 404:
+            url = _moved_url(request, post_id)
+            if url is not None:
+                return HttpResponsePermanentRedirect(url)
+        return response
+    return wrapper
+
+
+@contextmanager
+def atomic(alias):
+    """Транзакция в шарде на время записи.
+
+    Блокировка на запись берётся в начале (`lock_for_write`): чтение
+    максимального id и вставка не разойдутся, и другой процесс подождёт
+    busy_timeout, а не получит «database is locked» посреди транзакции.
+    """
+    if alias is None:
+        yield
+        return
+    with transaction.atomic(using=alias):
+        lock_for_write(Post, using=alias)
+        yield
+
+
+def related(queryset, *fields):
+    """select_related, пока посты в основной базе; с шардами —
+    prefetch_related: пользователи и группы лежат в другой базе, и
+    соединить их с постами одним запросом нельзя."""
+    if enabled():
+        return queryset.prefetch_related(*fields)
+    return queryset.select_related(*fields)
+
+
+def spread(queryset):
+    """Один и тот же queryset в каждом шарде."""
+    return {alias: queryset.using(alias) for alias in aliases()}
+
+
+def by_author(queryset, author_ids):
+    """Queryset только в шардах авторов `author_ids`, в каждом — с
+    отбором по авторам этого шарда."""
+    authors = defaultdict(list)
+    for author_id in author_ids:
+        authors[for_author(author_id) or DEFAULT_DB_ALIAS].append(author_id)
+    return {alias: queryset.using(alias).filter(author_id__in=ids)
+            for alias, ids in authors.items()}
+
+
+class Merged:
+    """Выборка из нескольких шардов, упорядоченная как единая.
+
+    Срез `[start:stop]` берёт из каждого шарда первые `stop` строк в
+    общем порядке сортировки и сливает их k-way merge: в срез попадают
+    ровно те строки, что дал бы один запрос к общей таблице. filter и
+    order_by применяются в каждом шарде, count складывается — этого
+    хватает и обычному, и курсорному паджинатору.
+
+    `attach` получает строки среза: так к ним дописывается то, что
+    лежит в основной базе.
+    """
+    ordered = True
+
+    def __init__(self, querysets, attach=None):
+        self.querysets = querysets
+        self.attach = attach
+
+    def _apply(self, method, *args, **kwargs):
+        return Merged({alias: getattr(queryset, method)(*args, **kwargs)
+                       for alias, queryset in self.querysets.items()},
+                      self.attach)
+
+    def filter(self, *args, **kwargs):
+        return self._apply('filter', *args, **kwargs)
+
+    def order_by(self, *fields):
+        return self._apply('order_by', *fields)
+
+    def count(self):
+        return sum(queryset.count()
+                   for queryset in self.querysets.values())
+
+    def _ordering(self):
+        queryset = next(iter(self.querysets.values()))
+        ordering = (queryset.query.order_by
+                    or queryset.model._meta.ordering)
+        descending = {field.startswith('-') for field in ordering}
+        if len(descending) != 1:
+            raise ValueError('Слить шарды можно только по полям, '
+                             'отсортированным в одну сторону.')
+        names = [field.lstrip('-') for field in ordering]
+
+        def key(row):
+            if isinstance(row, dict):
+                # Строки .values(): pk в них называется id
+                return tuple(row['id' if name == 'pk' else name]
+                             for name in names)
+            return tuple(getattr(row, name) for name in names)
+        return key, descending.pop()
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice) or index.step:
+            raise TypeError('Merged поддерживает только срезы без шага.')
+        if not self.querysets:
+            return []
+        start, stop = index.start or 0, index.stop
+        key, reverse = self._ordering()
+        rows = heapq.merge(
+            *(queryset[:stop] for queryset in self.querysets.values()),
+            key=key, reverse=reverse)
+        rows = list(islice(rows, start, stop))
+        if self.attach is not None:
+            self.attach(rows)
+        return rows
+
+
+class ShardRouter:
+    """Посты и комментарии — в шард автора поста (POST_SHARDS).
+
+    Шард известен, когда запрос идёт от объекта: пост или комментарий
+    сохраняется, читаются посты пользователя (`user.posts`) или
+    комментарии поста (`post.comments`). Остальные выборки роутер не
+    решает: в нужный шард их направляют через `using()` (`for_post`,
+    `spread`, `by_author`). Прочие модели оставлены следующему роутеру.
+    """
+
+    def _shard(self, model, hints):
+        if not enabled() or model not in SHARDED:
+            return None
+        instance = hints.get('instance')
+        if isinstance(instance, Post):
+            if instance.pk is not None:
+                return for_post(instance.pk)
+            return for_author(instance.author_id)
+        if isinstance(instance, Comment):
+            return for_post(instance.post_id)
+        if isinstance(instance, User) and model is Post:
+            return for_author(instance.pk)
+        return None
+
+    def db_for_read(self, model, **hints):
+        return self._shard(model, hints)
+
+    def db_for_write(self, model, **hints):
+        return self._shard(model, hints)
@@ -0,0 +1,102 @@
+from django.db.models.signals import (post_delete, post_save, pre_delete,
+                                      pre_save)
+from django.dispatch import receiver
+from django.utils import timezone
+
+from . import caching, inbox, shards, stats
+from .models import AuthorStats, Comment, Follow, Group, Post, User
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        AuthorStats.objects.get_or_create(user=instance)
+
+
+@receiver(pre_delete, sender=User)
+def user_deleting(sender, instance, using, **kwargs):
+    """Каскад удаления пользователя в шардах: в своей базе посты и
+    комментарии удалит Django, а в остальных шардах внешних ключей нет.
+    """
+    for alias in shards.aliases():
+        if alias != using:
+            Comment.objects.using(alias).filter(author=instance).delete()
+            Post.objects.using(alias).filter(author=instance).delete()
+
+
+@receiver(pre_delete, sender=Group)
+def group_deleting(sender, instance, using, **kwargs):
+    """SET_NULL для постов группы во всех шардах; смена `updated`
+    сбрасывает закэшированные фрагменты постов со ссылкой на группу."""
+    for alias in shards.aliases():
+        Post.objects.using(alias).filter(group=instance).update(
+            group=None, updated=timezone.now())
+
+
+@receiver(pre_save, sender=Post)
+def post_saving(sender, instance, using, raw=False, **kwargs):
+    instance._previous_group_id = None
+    if instance.pk is not None:
+        instance._previous_group_id = (
+            Post.objects.using(using).filter(pk=instance.pk)
+            .values_list('group_id', flat=True).first())
+    elif not raw:
+        shards.assign_id(instance, using)
+
+
+@receiver(post_save, sender=Post)
+def post_saved(sender, instance, created, **kwargs):
+    if created:
+        stats.bump(instance.author_id, 'posts_count', 1)
+        followers = inbox.fan_out(instance)
+    else:
+        followers = inbox.followers(instance.author_id)
+    caching.post_changed(
+        instance,
+        {instance.group_id, getattr(instance, '_previous_group_id', None)},
+        followers)
+
+
+@receiver(post_delete, sender=Post)
+def post_deleted(sender, instance, **kwargs):
+    stats.bump(instance.author_id, 'posts_count', -1)
+    caching.post_changed(instance, {instance.group_id},
+                         inbox.followers(instance.author_id))
+
+
+@receiver(pre_save, sender=Comment)
+def comment_saving(sender, instance, using, raw=False, **kwargs):
+    if not raw:
+        shards.assign_id(instance, using)
+
+
+@receiver(post_save, sender=Comment)
+def comment_saved(sender, instance, created, using, **kwargs):
+    if created:
+        stats.bump(instance.author_id, 'comments_count', 1)
+        stats.bump_comments(instance.post_id, 1, using)
+        caching.comments_changed(instance.post_id)
+
+
+@receiver(post_delete, sender=Comment)
+def comment_deleted(sender, instance, using, **kwargs):
+    stats.bump(instance.author_id, 'comments_count', -1)
+    stats.bump_comments(instance.post_id, -1, using)
+    caching.comments_changed(instance.post_id)
+
+
+@receiver(post_save, sender=Follow)
+def follow_saved(sender, instance, created, **kwargs):
+    if created:
+        stats.bump(instance.author_id, 'followers_count', 1)
+        stats.bump(instance.user_id, 'following_count', 1)
+        inbox.backfill(instance.user_id, instance.author_id)
+        caching.follow_changed(instance)
+
+
+@receiver(post_delete, sender=Follow)
+def follow_deleted(sender, instance, **kwargs):
+    stats.bump(instance.author_id, 'followers_count', -1)
+    stats.bump(instance.user_id, 'following_count', -1)
+    inbox.prune(instance.user_id, instance.author_id)
+    caching.follow_changed(instance)
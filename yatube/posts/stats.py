@@ -0,0 +1,88 @@
+from collections import Counter
+
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce, Greatest
+
+from . import shards
+from .models import AuthorStats, Comment, Follow, Post
+
+COUNTERS = {
+    'posts_count': (Post, 'author_id'),
+    'comments_count': (Comment, 'author_id'),
+    'followers_count': (Follow, 'author_id'),
+    'following_count': (Follow, 'user_id'),
+}
+
+
+def bump(user_id, field, delta):
+    """Сдвигает счётчик пользователя на `delta` одним UPDATE.
+
+    Отсутствующую строку не создаёт: её восстановит `recount`.
+    """
+    if user_id is None:
+        return
+    AuthorStats.objects.filter(user_id=user_id).update(
+        **{field: Greatest(F(field) + delta, 0)})
+
+
+def bump_comments(post_id, delta, using=None):
+    """Сдвигает число комментариев поста одним UPDATE в его базе."""
+    Post.objects.using(using).filter(pk=post_id).update(
+        comment_count=Greatest(F('comment_count') + delta, 0))
+
+
+def recount_comments(post_ids, using=None):
+    """Пересчитывает число комментариев постов по таблице комментариев:
+    после массовой вставки, которая не шлёт сигналов."""
+    comments = (Comment.objects.filter(post=OuterRef('pk')).order_by()
+                .values('post').annotate(count=Count('pk')).values('count'))
+    Post.objects.using(using).filter(pk__in=post_ids).update(
+        comment_count=Coalesce(
+            Subquery(comments, output_field=IntegerField()), 0))
+
+
+def totals(model, column, user_ids):
+    """Число строк `model` у каждого пользователя; посты и комментарии
+    считаются во всех шардах."""
+    databases = shards.aliases() if model in shards.SHARDED else [None]
+    counts = Counter()
+    for alias in databases:
+        counts.update(dict(
+            model.objects.using(alias).filter(**{f'{column}__in': user_ids})
+            .values_list(column).annotate(total=Count('id')).order_by()))
+    return counts
+
+
+def recount(user_ids):
+    """Пересчитывает счётчики пользователей по таблицам.
+
+    Возвращает словарь `{user_id: AuthorStats}` и количество строк,
+    которые пришлось создать или исправить.
+    """
+    user_ids = list(user_ids)
+    counts = {field: totals(model, column, user_ids)
+              for field, (model, column) in COUNTERS.items()}
+    existing = AuthorStats.objects.in_bulk(user_ids)
+    created, changed = [], []
+    for user_id in user_ids:
+        stats = existing.get(user_id)
+        if stats is None:
+            stats = existing[user_id] = AuthorStats(user_id=user_id)
+            created.append(stats)
+        elif any(getattr(stats, field) != total.get(user_id, 0)
+                 for field, total in counts.items()):
+            changed.append(stats)
+        for field, total in counts.items():
+            setattr(stats, field, total.get(user_id, 0))
+    AuthorStats.objects.bulk_create(created)
+    AuthorStats.objects.bulk_update(changed, list(COUNTERS))
+    return existing, len(created) + len(changed)
+
+
+def get_stats(user):
+    """Счётчики пользователя; пропавшую строку пересчитывает на месте."""
+    try:
+        return user.stats
+    except AuthorStats.DoesNotExist:
+        stats, _ = recount([user.pk])
+        return stats[user.pk]
@@ -0,0 +1,28 @@
+from django import template
+from django.templatetags.cache import CacheNode
+
+register = template.Library()
+
+
+class FeedCacheNode(CacheNode):
+    def render(self, context):
+        if self.vary_on[0].resolve(context) is None:
+            return self.nodelist.render(context)
+        return super().render(context)
+
+
+@register.tag
+def feed_cache(parser, token):
+    """{% feed_cache timeout name feed_key %} … {% endfeed_cache %}
+
+    Как {% cache %}, но без ключа ленты (feed_key — None: реплика
+    отстала) фрагмент рендерится каждый раз и не кэшируется.
+    """
+    nodelist = parser.parse(('endfeed_cache',))
+    parser.delete_first_token()
+    bits = token.split_contents()
+    if len(bits) != 4:
+        raise template.TemplateSyntaxError(
+            f'{bits[0]} принимает время, имя фрагмента и ключ ленты.')
+    return FeedCacheNode(nodelist, parser.compile_filter(bits[1]), bits[2],
+                         [parser.compile_filter(bits[3])], None)
@@ -0,0 +1,68 @@
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from ..models import Comment, Follow, Group, Post, User
+
+CHANGELISTS = (
+    'admin:posts_post_changelist',
+    'admin:posts_comment_changelist',
+    'admin:posts_follow_changelist',
+)
+
+
+class AdminChangelistTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser('admin', 'a@a.ru', 'pass')
+        Group.objects.bulk_create(
+            Group(title=f'Группа {i}', slug=f'group-{i}') for i in range(5))
+        cls.group = Group.objects.first()
+        cls.add_rows(5)
+
+    @classmethod
+    def add_rows(cls, count):
+        for _ in range(count):
+            author = User.objects.create_user(
+                username=f'user{User.objects.count()}')
+            post = Post.objects.create(text='Текст', author=author,
+                                       group=cls.group)
+            Comment.objects.create(post=post, author=author, text='Ответ')
+            Follow.objects.create(user=author, author=cls.admin)
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    def changelist_queries(self, name):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse(name))
+        self.assertEqual(response.status_code, 200)
+        return [query['sql'] for query in queries.captured_queries]
+
+    def test_queries_do_not_grow_with_rows(self):
+        """Число запросов списка не зависит от числа строк на странице."""
+        before = {name: len(self.changelist_queries(name))
+                  for name in CHANGELISTS}
+        self.add_rows(10)
+        for name in CHANGELISTS:
+            with self.subTest(name=name):
+                self.assertEqual(len(self.changelist_queries(name)),
+                                 before[name])
+
+    def test_unfiltered_list_is_not_counted(self):
+        """Без фильтров общее количество строк не считается COUNT(*)."""
+        for name in CHANGELISTS:
+            with self.subTest(name=name):
+                for sql in self.changelist_queries(name):
+                    self.assertNotIn('COUNT(*)', sql)
+
+    def test_estimated_count(self):
+        """Оценка количества строк берётся из разброса id."""
+        response = self.client.get(reverse('admin:posts_post_changelist'))
+        self.assertEqual(response.context['cl'].result_count,
+                         Post.objects.count())
+        response = self.client.get(reverse('admin:posts_post_changelist'),
+                                   {'group__id__exact': self.group.pk})
+        self.assertEqual(response.context['cl'].result_count,
+                         Post.objects.count())
@@ -0,0 +1,128 @@
+import csv
+import io
+import json
+import shutil
+import tempfile
+import zipfile
+
+from django.conf import settings
+from django.contrib.auth.models import Permission
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from .. import export
+from ..models import Comment, Follow, Post, User
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+EXPORT_URL = reverse('admin:posts_export')
+SMALL_GIF = (
+    b'\x47\x49\x46\x38\x39\x61\x01\x00'
+    b'\x01\x00\x00\x00\x00\x21\xf9\x04'
+    b'\x01\x0a\x00\x01\x00\x2c\x00\x00'
+    b'\x00\x00\x01\x00\x01\x00\x00\x02'
+    b'\x02\x4c\x01\x00\x3b'
+)
+POSTS_COUNT = 7
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class ExportTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+        cls.reader = User.objects.create_user(username='reader')
+        cls.staff = User.objects.create_user(username='staff',
+                                             is_staff=True)
+        cls.staff.user_permissions.set(Permission.objects.filter(
+            codename__in=['view_post', 'view_comment', 'view_follow']))
+        cls.editor = User.objects.create_user(username='editor',
+                                              is_staff=True)
+        cls.editor.user_permissions.set(
+            Permission.objects.filter(codename='view_post'))
+        for i in range(POSTS_COUNT):
+            Post.objects.create(text=f'Пост, "{i}"', author=cls.author)
+        cls.post = Post.objects.create(
+            text='С картинкой', author=cls.author,
+            image=SimpleUploadedFile('small.gif', SMALL_GIF,
+                                     content_type='image/gif'))
+        Comment.objects.create(post=cls.post, author=cls.author,
+                               text='Свой комментарий')
+        Comment.objects.create(post=cls.post, author=cls.reader,
+                               text='Чужой комментарий')
+        Follow.objects.create(user=cls.author, author=cls.reader)
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def test_rows_are_read_in_keyset_chunks(self):
+        """Строки читаются порциями по id, все и по одному разу."""
+        with CaptureQueriesContext(connection) as queries:
+            ids = [row['id'] for row in export.rows('posts', chunk_size=3)]
+        self.assertEqual(ids, sorted(
+            Post.objects.values_list('id', flat=True)))
+        self.assertEqual(len(queries), 3)
+        for query in queries.captured_queries:
+            self.assertIn('LIMIT 3', query['sql'])
+
+    def test_command_formats(self):
+        """Команда выгружает NDJSON и CSV."""
+        out = io.StringIO()
+        call_command('export_content', 'posts', chunk_size=2, stdout=out)
+        rows = [json.loads(line) for line in out.getvalue().splitlines()]
+        self.assertEqual(len(rows), POSTS_COUNT + 1)
+        self.assertEqual(rows[0]['text'], 'Пост, "0"')
+        out = io.StringIO()
+        call_command('export_content', 'comments', output_format='csv',
+                     stdout=out)
+        table = list(csv.DictReader(io.StringIO(out.getvalue())))
+        self.assertEqual([row['text'] for row in table],
+                         ['Свой комментарий', 'Чужой комментарий'])
+
+    def test_view_is_staff_only(self):
+        """Выгрузка доступна только персоналу."""
+        self.client.force_login(self.reader)
+        response = self.client.get(EXPORT_URL)
+        self.assertEqual(response.status_code, 302)
+        self.client.force_login(self.staff)
+        response = self.client.get(EXPORT_URL, {'table': 'follows',
+                                                'format': 'csv'})
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        content = b''.join(response.streaming_content).decode()
+        self.assertEqual(content.splitlines()[0], 'id,user_id,author_id')
+        response = self.client.get(EXPORT_URL, {'table': 'auth_user'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_view_needs_model_permissions(self):
+        """Персонал выгружает только модели, которые ему можно смотреть."""
+        self.client.force_login(self.editor)
+        response = self.client.get(EXPORT_URL, {'table': 'posts'})
+        self.assertEqual(response.status_code, 200)
+        for params in ({'table': 'comments'}, {'table': 'follows'},
+                       {'user': 'author'}):
+            with self.subTest(params=params):
+                response = self.client.get(EXPORT_URL, params)
+                self.assertEqual(response.status_code, 403)
+
+    def test_user_archive(self):
+        """Архив пользователя содержит только его данные и картинки."""
+        self.client.force_login(self.staff)
+        response = self.client.get(EXPORT_URL, {'user': 'author'})
+        self.assertTrue(response.streaming)
+        archive = zipfile.ZipFile(
+            io.BytesIO(b''.join(response.streaming_content)))
+        self.assertEqual(
+            sorted(archive.namelist()),
+            ['comments.ndjson', 'follows.ndjson',
+             f'images/{self.post.image.name}', 'posts.ndjson'])
+        comments = archive.read('comments.ndjson').decode().splitlines()
+        self.assertEqual(len(comments), 1)
+        self.assertEqual(archive.read(f'images/{self.post.image.name}'),
+                         self.post.image.open('rb').read())
@@ -0,0 +1,156 @@
+import shutil
+import tempfile
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from PIL import Image, PngImagePlugin
+
+from ..models import Post, User
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+ORIENTATION_ROTATE_90 = 6
+
+
+def png(width, height):
+    buffer = BytesIO()
+    Image.new('RGB', (width, height)).save(buffer, 'PNG')
+    return SimpleUploadedFile('picture.png', buffer.getvalue(),
+                              content_type='image/png')
+
+
+def png_with_metadata(width, height):
+    exif = Image.Exif()
+    exif[0x010f] = 'Камера'
+    text = PngImagePlugin.PngInfo()
+    text.add_text('Author', 'Фотограф')
+    buffer = BytesIO()
+    Image.new('RGB', (width, height)).save(
+        buffer, 'PNG', exif=exif.tobytes(), pnginfo=text)
+    return SimpleUploadedFile('picture.png', buffer.getvalue(),
+                              content_type='image/png')
+
+
+def gif(width, height, frames):
+    images = [Image.new('P', (width, height), color=i)
+              for i in range(frames)]
+    buffer = BytesIO()
+    images[0].save(buffer, 'GIF', save_all=True, append_images=images[1:],
+                   duration=50, loop=0, comment=b'Camera')
+    return SimpleUploadedFile('animation.gif', buffer.getvalue(),
+                              content_type='image/gif')
+
+
+def jpeg(width, height, orientation=None):
+    image = Image.new('RGB', (width, height), color=(200, 10, 10))
+    exif = Image.Exif()
+    exif[0x010f] = 'Камера'
+    if orientation:
+        exif[0x0112] = orientation
+    buffer = BytesIO()
+    image.save(buffer, 'JPEG', exif=exif.tobytes())
+    return SimpleUploadedFile('photo.jpg', buffer.getvalue(),
+                              content_type='image/jpeg')
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, THUMBNAIL_WORKERS=0)
+class ImageUploadTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='photographer')
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def create(self, image):
+        return self.client.post(reverse('posts:post_create'),
+                                {'text': 'Фото', 'image': image})
+
+    @override_settings(POST_IMAGE_MAX_SIDE=100)
+    def test_image_is_rotated_downscaled_and_stripped(self):
+        """Картинка повёрнута по EXIF, уменьшена и без метаданных."""
+        self.create(jpeg(400, 200, ORIENTATION_ROTATE_90))
+        post = Post.objects.latest('pk')
+        self.assertEqual((post.image_width, post.image_height), (50, 100))
+        with Image.open(post.image.path) as image:
+            self.assertEqual(image.size, (50, 100))
+            self.assertEqual(image.format, 'JPEG')
+            self.assertEqual(dict(image.getexif()), {})
+
+    def test_png_is_stripped(self):
+        """Из PNG убираются EXIF и текстовые блоки."""
+        self.create(png_with_metadata(30, 20))
+        post = Post.objects.latest('pk')
+        with Image.open(post.image.path) as image:
+            self.assertEqual(image.format, 'PNG')
+            self.assertEqual(dict(image.getexif()), {})
+            self.assertNotIn('Author', image.info)
+
+    @override_settings(POST_IMAGE_MAX_SIDE=100)
+    def test_animation_is_downscaled_and_stripped(self):
+        """Анимация пересжимается по кадрам: кадры и их длительность
+        сохраняются, комментарий — нет."""
+        self.create(gif(400, 200, frames=3))
+        post = Post.objects.latest('pk')
+        self.assertEqual((post.image_width, post.image_height), (100, 50))
+        with Image.open(post.image.path) as image:
+            self.assertEqual(image.size, (100, 50))
+            self.assertEqual(image.n_frames, 3)
+            self.assertEqual(image.info['duration'], 50)
+            self.assertEqual(image.info['loop'], 0)
+            self.assertNotIn('comment', image.info)
+
+    @override_settings(POST_IMAGE_MAX_PIXELS=250)
+    def test_animation_frames_share_pixel_limit(self):
+        """Предел пикселей считается по всем кадрам анимации."""
+        response = self.create(gif(10, 10, frames=3))
+        self.assertIn('Мп.', response.context['form'].errors['image'][0])
+        self.assertFalse(Post.objects.exists())
+
+    def test_small_image_keeps_size(self):
+        """Картинка меньше предела не растягивается."""
+        self.create(jpeg(30, 20))
+        post = Post.objects.latest('pk')
+        self.assertEqual((post.image_width, post.image_height), (30, 20))
+        self.assertTrue(post.image.name.endswith('.jpg'))
+
+    def test_oversized_images_are_rejected(self):
+        """Слишком большие файл и картинка отклоняются формой."""
+        cases = (
+            ({'POST_IMAGE_MAX_UPLOAD_SIZE': 10}, 'Файл больше'),
+            ({'POST_IMAGE_MAX_PIXELS': 100}, 'Мп.'),
+        )
+        for limits, message in cases:
+            with self.subTest(limits=limits), override_settings(**limits):
+                response = self.create(jpeg(20, 20))
+                self.assertIn(message,
+                              response.context['form'].errors['image'][0])
+                self.assertFalse(Post.objects.exists())
+
+    @override_settings(POST_IMAGE_MAX_DECODED_PIXELS=100)
+    def test_decoded_formats_have_lower_limit(self):
+        """PNG декодируется целиком и проверяется по меньшему пределу, а
+        JPEG того же размера проходит."""
+        response = self.create(png(20, 20))
+        self.assertIn('0.0001 Мп.',
+                      response.context['form'].errors['image'][0])
+        self.create(jpeg(20, 20))
+        self.assertEqual(Post.objects.count(), 1)
+
+    def test_edit_without_new_image_keeps_size(self):
+        """Правка текста не трогает размеры картинки."""
+        self.create(jpeg(30, 20))
+        post = Post.objects.latest('pk')
+        self.client.post(reverse('posts:post_edit', args=[post.pk]),
+                         {'text': 'Новый текст'})
+        post.refresh_from_db()
+        self.assertEqual(post.text, 'Новый текст')
+        self.assertEqual((post.image_width, post.image_height), (30, 20))
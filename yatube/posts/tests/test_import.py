@@ -0,0 +1,109 @@
+import json
+import tempfile
+from io import StringIO
+
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from ..importer import Importer
+from ..models import AuthorStats, Comment, Follow, Group, Inbox, Post, User
+
+RECORDS = [
+    {'type': 'post', 'id': 'p1', 'author': 'leo', 'group': 'cats',
+     'text': 'Первый пост', 'pub_date': '2020-01-01T10:00:00+00:00'},
+    {'type': 'post', 'id': 'p2', 'author': 'leo', 'text': 'Второй пост',
+     'pub_date': '2020-01-02T10:00:00+00:00'},
+    {'type': 'comment', 'post': 'p1', 'author': 'ann', 'text': 'Ответ'},
+    {'type': 'comment', 'post': 'нет', 'author': 'ann', 'text': 'Мимо'},
+    {'type': 'follow', 'user': 'ann', 'author': 'leo'},
+    {'type': 'follow', 'user': 'ann', 'author': 'ann'},
+    {'type': 'unknown'},
+]
+
+
+class ImportContentTests(TestCase):
+    def import_records(self, records, **options):
+        with tempfile.NamedTemporaryFile('w', suffix='.ndjson',
+                                         encoding='utf-8') as source:
+            source.writelines(json.dumps(record, ensure_ascii=False) + '\n'
+                              for record in records)
+            source.flush()
+            out = StringIO()
+            call_command('import_content', source.name, stdout=out,
+                         **options)
+        return out.getvalue()
+
+    def test_import(self):
+        """Записи загружаются с датами, ссылками и пропусками битых."""
+        existing = User.objects.create_user(username='leo')
+        output = self.import_records(RECORDS, batch_size=1, chunk_size=3)
+        self.assertIn('Постов: 2, комментариев: 1, подписок: 1', output)
+        self.assertIn('пропущено: 3', output)
+        self.assertIn('строк/с', output)
+        first = Post.objects.get(text='Первый пост')
+        self.assertEqual(first.author, existing)
+        self.assertEqual(first.group, Group.objects.get(slug='cats'))
+        self.assertEqual(first.pub_date.year, 2020)
+        self.assertEqual(Comment.objects.get().post, first)
+        ann = User.objects.get(username='ann')
+        self.assertFalse(ann.has_usable_password())
+        self.assertTrue(Follow.objects.filter(user=ann,
+                                              author=existing).exists())
+
+    def test_rebuild_after_import(self):
+        """После загрузки пересобраны счётчики, ленты и кэш."""
+        author = User.objects.create_user(username='leo')
+        reader = User.objects.create_user(username='old_reader')
+        Follow.objects.create(user=reader, author=author)
+        self.client.force_login(reader)
+        cache.clear()
+        self.client.get(reverse('posts:index'))
+        self.import_records(RECORDS)
+        self.assertEqual(AuthorStats.objects.get(user=author).posts_count, 2)
+        stats = AuthorStats.objects.get(user__username='ann')
+        self.assertEqual(stats.comments_count, 1)
+        self.assertEqual(stats.following_count, 1)
+        self.assertEqual(Comment.objects.get().post.comment_count, 1)
+        for user in (reader, User.objects.get(username='ann')):
+            self.assertEqual(Inbox.objects.filter(user=user).count(), 2)
+        self.assertContains(self.client.get(reverse('posts:index')),
+                            'Второй пост')
+        found = self.client.get(reverse('posts:search'), {'q': 'второй'})
+        self.assertEqual([post.text for post in found.context['page_obj']],
+                         ['Второй пост'])
+
+    def test_new_posts_after_import(self):
+        """Обычные посты после загрузки получают свободные id."""
+        self.import_records(RECORDS)
+        post = Post.objects.create(text='Новый',
+                                   author=User.objects.get(username='leo'))
+        self.assertEqual(post.pk, Post.objects.count())
+
+    def test_posts_created_during_import(self):
+        """Посты с сайта между порциями загрузки не мешают выдаче id."""
+        importer = Importer(batch_size=10)
+        importer.load(RECORDS[:1])
+        post = Post.objects.create(text='С сайта',
+                                   author=User.objects.get(username='leo'))
+        importer.load(RECORDS[1:2])
+        self.assertEqual(Post.objects.count(), 3)
+        self.assertGreater(Post.objects.get(text='Второй пост').pk, post.pk)
+
+    def test_images_need_thumbnails(self):
+        """Команда напоминает построить миниатюры загруженных картинок."""
+        records = [dict(RECORDS[0], image='posts/cat.jpg'), RECORDS[1]]
+        output = self.import_records(records)
+        self.assertIn('Постов с картинками: 1', output)
+        self.assertIn('generate_thumbnails', output)
+
+    @override_settings(POST_SHARDS=['default', 'shard_1'])
+    def test_refuses_with_shards(self):
+        """С шардами загрузка и генерация данных отказываются работать:
+        посты легли бы в основную базу с id без бакета автора."""
+        with self.assertRaisesMessage(CommandError, 'reshard_posts'):
+            self.import_records(RECORDS)
+        with self.assertRaisesMessage(CommandError, 'reshard_posts'):
+            call_command('seed_yatube', stdout=StringIO())
+        self.assertFalse(Post.objects.exists())
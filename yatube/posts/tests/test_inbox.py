@@ -0,0 +1,85 @@
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase
+from django.urls import reverse
+
+from .. import inbox
+from ..models import Follow, Inbox, Post, User
+
+FOLLOW_INDEX_URL = reverse('posts:follow_index')
+
+
+class InboxTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.reader = User.objects.create_user(username='reader')
+        cls.author = User.objects.create_user(username='writer')
+        cls.stranger = User.objects.create_user(username='stranger')
+        cls.old_post = Post.objects.create(author=cls.author,
+                                           text='Старый пост')
+
+    def setUp(self):
+        self.client.force_login(self.reader)
+
+    def inbox_posts(self, user):
+        return list(Inbox.objects.filter(user=user)
+                    .values_list('post_id', flat=True))
+
+    def test_follow_backfills_inbox(self):
+        """Подписка добавляет в ленту уже опубликованные посты автора."""
+        Follow.objects.create(user=self.reader, author=self.author)
+        self.assertEqual(self.inbox_posts(self.reader), [self.old_post.id])
+
+    def test_new_post_fans_out_to_followers(self):
+        """Новый пост попадает только в ленты подписчиков."""
+        Follow.objects.create(user=self.reader, author=self.author)
+        post = Post.objects.create(author=self.author, text='Новый пост')
+        self.assertIn(post.id, self.inbox_posts(self.reader))
+        self.assertEqual(self.inbox_posts(self.stranger), [])
+        entry = Inbox.objects.get(user=self.reader, post=post)
+        self.assertEqual(entry.pub_date, post.pub_date)
+
+    def test_unfollow_prunes_inbox(self):
+        """Отписка убирает посты автора из ленты."""
+        follow = Follow.objects.create(user=self.reader, author=self.author)
+        follow.delete()
+        self.assertEqual(self.inbox_posts(self.reader), [])
+
+    def test_inbox_is_capped(self):
+        """В ленте остаются только самые новые записи."""
+        Follow.objects.create(user=self.reader, author=self.author)
+        posts = [Post.objects.create(author=self.author, text=str(i))
+                 for i in range(3)]
+        inbox.trim([self.reader.id], size=2)
+        self.assertEqual(
+            sorted(self.inbox_posts(self.reader)),
+            [posts[1].id, posts[2].id])
+
+    def test_trim_deletes_only_overflow(self):
+        """Обрезаются только переполненные ленты; из записей с одной
+        датой остаются более новые по id."""
+        posts = [Post.objects.create(author=self.author, text=str(i))
+                 for i in range(3)]
+        date = posts[0].pub_date
+        Inbox.objects.bulk_create(
+            [Inbox(user=self.reader, post=post, pub_date=date)
+             for post in posts]
+            + [Inbox(user=self.stranger, post=posts[0], pub_date=date)])
+        with self.assertNumQueries(2):
+            inbox.trim([self.reader.id, self.stranger.id], size=2)
+        self.assertEqual(sorted(self.inbox_posts(self.reader)),
+                         [posts[1].id, posts[2].id])
+        self.assertEqual(self.inbox_posts(self.stranger), [posts[0].id])
+        with self.assertNumQueries(1):
+            inbox.trim([self.reader.id, self.stranger.id], size=2)
+
+    def test_follow_index_reads_inbox(self):
+        """Страница подписок строится по ленте без JOIN по подпискам."""
+        Follow.objects.create(user=self.reader, author=self.author)
+        Inbox.objects.filter(user=self.reader).delete()
+        response = self.client.get(FOLLOW_INDEX_URL)
+        self.assertEqual(len(response.context['page_obj']), 0)
+        call_command('rebuild_inbox', usernames=['reader'], stdout=StringIO())
+        response = self.client.get(FOLLOW_INDEX_URL)
+        self.assertEqual(list(response.context['page_obj']), [self.old_post])
@@ -0,0 +1,140 @@
+import re
+
+from django.core.cache import cache
+from django.db import connection
+from django.test import Client, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from ..models import Comment, Follow, Group, Post, User
+
+POSTS_COUNT = 25
+# Любой SCAN таблицы, в том числе по индексу целиком
+FULL_SCAN = re.compile(r'\bSCAN (?!CONSTANT ROW|\()')
+# Обход индекса в порядке ORDER BY: допустим, если его обрывает LIMIT
+INDEX_WALK = re.compile(r'\bSCAN \w+ USING (COVERING )?INDEX\b')
+# Поиск по индексу FTS5: idxStr с M — ограничение MATCH
+FTS_MATCH = re.compile(r'\bSCAN \w+ VIRTUAL TABLE INDEX \d+:M')
+# Таблицы, которые читаются целиком намеренно: группы — это варианты
+# выпадающего списка в формах поста и поиска
+WHOLE_TABLES = ('posts_group',)
+TEMP_SORT = 'USE TEMP B-TREE'
+
+
+def full_scan(line, sql):
+    if not FULL_SCAN.search(line) or FTS_MATCH.search(line):
+        return False
+    if INDEX_WALK.search(line) and ' LIMIT ' in sql:
+        return False
+    return not any(f'SCAN {table} ' in line for table in WHOLE_TABLES)
+
+
+def query_plan(sql):
+    with connection.cursor() as cursor:
+        cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+        return [row[-1] for row in cursor.fetchall()]
+
+
+class QueryPlanTests(TestCase):
+    """Запросы представлений posts идут по индексам.
+
+    Каждый SQL-запрос, выполненный при открытии страницы, прогоняется
+    через EXPLAIN QUERY PLAN; полный просмотр таблицы или индекса без
+    LIMIT и сортировка во временном B-дереве считаются регрессией.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(username='author')
+        cls.reader = User.objects.create_user(username='reader')
+        cls.group = Group.objects.create(title='Группа', slug='group',
+                                         description='Описание')
+        Follow.objects.create(user=cls.reader, author=cls.author)
+        for i in range(POSTS_COUNT):
+            cls.post = Post.objects.create(
+                author=cls.author if i % 2 else cls.reader,
+                group=cls.group if i % 3 else None,
+                text=f'Пост {i}',
+            )
+            Comment.objects.create(post=cls.post, author=cls.reader,
+                                   text=f'Комментарий {i}')
+
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.client.force_login(self.reader)
+
+    def feed_urls(self):
+        return (
+            reverse('posts:index'),
+            reverse('posts:group_list', args=[self.group.slug]),
+            reverse('posts:profile', args=[self.author.username]),
+            reverse('posts:follow_index'),
+        )
+
+    def assert_indexed(self, method, url, data=None, temp_sort=False):
+        """`temp_sort` разрешает сортировку во временном B-дереве."""
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            response = getattr(self.client, method)(url, data)
+        for query in queries.captured_queries:
+            sql = query['sql']
+            if sql.startswith(('SAVEPOINT', 'RELEASE', 'ROLLBACK')):
+                continue
+            for line in query_plan(sql):
+                with self.subTest(url=url, sql=sql, plan=line):
+                    self.assertFalse(full_scan(line, sql))
+                    if not temp_sort:
+                        self.assertNotIn(TEMP_SORT, line)
+        return response
+
+    def test_feed_pages(self):
+        """Первая и следующая страницы лент читаются по индексу."""
+        for url in self.feed_urls():
+            response = self.assert_indexed('get', url)
+            cursor = response.context['page_obj'].paginator.next_cursor
+            self.assertIsNotNone(cursor)
+            self.assert_indexed('get', url, {'after': cursor})
+            self.assert_indexed('get', url, {'before': cursor})
+
+    def test_search(self):
+        """Поиск читает только совпадения из индекса FTS5.
+
+        Оценки bm25 в индексе нет, поэтому найденные строки сортируются
+        во временном B-дереве; их число ограничено совпадениями, а не
+        размером таблицы.
+        """
+        url = reverse('posts:search')
+        response = self.assert_indexed('get', url, {'q': 'пост'},
+                                       temp_sort=True)
+        cursor = response.context['page_obj'].paginator.next_cursor
+        self.assertIsNotNone(cursor)
+        self.assert_indexed('get', url, {'q': 'пост', 'after': cursor},
+                            temp_sort=True)
+        self.assert_indexed('get', url, {'q': 'пост',
+                                         'group': self.group.slug,
+                                         'author': self.author.username},
+                            temp_sort=True)
+
+    def test_post_pages(self):
+        """Страница поста и формы читаются по индексу."""
+        urls = (
+            reverse('posts:post_detail', args=[self.post.id]),
+            reverse('posts:post_comments', args=[self.post.id]),
+            reverse('posts:post_create'),
+            reverse('posts:post_edit', args=[self.post.id]),
+        )
+        for url in urls:
+            self.assert_indexed('get', url)
+
+    def test_write_views(self):
+        """Запись поста, комментария и подписки не сканирует таблицы."""
+        self.assert_indexed('post', reverse('posts:post_create'),
+                            {'text': 'Новый пост'})
+        self.assert_indexed('post',
+                            reverse('posts:add_comment', args=[self.post.id]),
+                            {'text': 'Новый комментарий'})
+        self.assert_indexed('get', reverse('posts:profile_unfollow',
+                                           args=[self.author.username]))
+        self.assert_indexed('get', reverse('posts:profile_follow',
+                                           args=[self.author.username]))
@@ -0,0 +1,118 @@
+from django.db import connection
+from django.test import Client, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from .. import search
+from ..models import Group, Post, User
+
+SEARCH_URL = reverse('posts:search')
+
+
+class SearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(username='author')
+        cls.other = User.objects.create_user(username='other')
+        cls.group = Group.objects.create(title='Группа', slug='group')
+        cls.best = Post.objects.create(
+            text='Ёжик, ежик и снова ежик', author=cls.author,
+            group=cls.group)
+        cls.good = Post.objects.create(
+            text='Про ежика в тумане и про лошадку', author=cls.other)
+        cls.unrelated = Post.objects.create(text='Совсем о другом',
+                                            author=cls.author)
+
+    def found(self, **params):
+        response = self.client.get(SEARCH_URL, params)
+        return [post.id for post in response.context['page_obj']]
+
+    def test_results_are_ranked(self):
+        """Более точное совпадение идёт первым, лишних постов нет."""
+        self.assertEqual(self.found(q='ежик'),
+                         [self.best.id, self.good.id])
+
+    def test_score_computed_once(self):
+        """Индекс присоединяется один раз, сортировка идёт по псевдониму
+        оценки, а не по повторённому подзапросу."""
+        with CaptureQueriesContext(connection) as queries:
+            self.found(q='ежик')
+        sql = next(query['sql'] for query in queries.captured_queries
+                   if search.TABLE in query['sql'])
+        self.assertEqual(sql.count('bm25('), 1)
+        self.assertNotIn('SELECT -bm25', sql)
+        self.assertIn('ORDER BY "score" DESC', sql)
+
+    def test_filters(self):
+        """Результаты фильтруются по группе и автору."""
+        self.assertEqual(self.found(q='ежик', group=self.group.slug),
+                         [self.best.id])
+        self.assertEqual(self.found(q='ежик', author=self.other.username),
+                         [self.good.id])
+
+    def test_index_follows_writes(self):
+        """Индекс следит за правкой и удалением постов."""
+        Post.objects.filter(pk=self.unrelated.pk).update(text='Ежик тоже')
+        self.assertIn(self.unrelated.id, self.found(q='ежик'))
+        Post.objects.get(pk=self.best.pk).delete()
+        self.assertNotIn(self.best.id, self.found(q='ежик'))
+
+    def test_deferred_index(self):
+        """Посты, вставленные без построчной индексации, находятся после
+        выхода из блока, а триггер вставки возвращается на место."""
+        with search.deferred_index():
+            Post.objects.bulk_create(
+                Post(text=f'Ежик номер {i}', author=self.other)
+                for i in range(3))
+        self.assertEqual(len(self.found(q='номер')), 3)
+        Post.objects.create(text='Новый ежик', author=self.other)
+        self.assertEqual(len(self.found(q='новый')), 1)
+
+    def test_deferred_index_survives_edits(self):
+        """Пост, созданный и исправленный без триггера вставки, не портит
+        индекс: после блока он перестроен по таблице постов."""
+        with search.deferred_index():
+            post = Post.objects.create(text='Ежик с сайта',
+                                       author=self.other)
+            post.text = 'Исправленный ежик'
+            post.save()
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"INSERT INTO {search.TABLE}({search.TABLE}, rank) "
+                f"VALUES ('integrity-check', 1)")
+        self.assertEqual(self.found(q='исправленный'), [post.id])
+        self.assertEqual(self.found(q='сайта'), [])
+
+    def test_query_syntax_is_escaped(self):
+        """Операторы FTS5 в запросе не ломают поиск."""
+        for query in ('ежик OR', '"ежик', 'NEAR(ежик', '*'):
+            with self.subTest(query=query):
+                response = self.client.get(SEARCH_URL, {'q': query})
+                self.assertEqual(response.status_code, 200)
+
+    def test_cursor_pages_keep_query(self):
+        """Ссылки на следующую страницу сохраняют запрос."""
+        Post.objects.bulk_create(
+            Post(text=f'ежик номер {i}', author=self.author)
+            for i in range(12))
+        response = self.client.get(SEARCH_URL, {'q': 'ежик'})
+        cursor = response.context['page_obj'].paginator.next_cursor
+        self.assertContains(
+            response, f'?q=%D0%B5%D0%B6%D0%B8%D0%BA&after={cursor}')
+        first = [post.id for post in response.context['page_obj']]
+        second = self.found(q='ежик', after=cursor)
+        self.assertEqual(len(first) + len(second), 14)
+        self.assertFalse(set(first) & set(second))
+
+    def test_admin_uses_index(self):
+        """Поиск в админке идёт по индексу, а не через LIKE."""
+        admin = User.objects.create_superuser('admin', 'a@a.ru', 'pass')
+        client = Client()
+        client.force_login(admin)
+        with CaptureQueriesContext(connection) as queries:
+            response = client.get(
+                reverse('admin:posts_post_changelist'), {'q': 'ежик'})
+        self.assertEqual(response.context['cl'].result_count, 2)
+        sql = ' '.join(query['sql'] for query in queries.captured_queries)
+        self.assertIn('MATCH', sql)
+        self.assertNotIn('LIKE', sql)
@@ -0,0 +1,82 @@
+import shutil
+import tempfile
+from io import StringIO
+
+from django.conf import settings
+from django.core.management import call_command
+from django.db.models import F
+from django.test import TestCase, override_settings
+
+from ..models import Comment, Follow, Group, Post, User
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+OPTIONS = {'users': 30, 'groups': 3, 'posts': 200, 'comments': 100,
+           'follows': 5, 'image_share': 0.25, 'chunk_size': 70,
+           'batch_size': 50}
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class SeedTests(TestCase):
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def seed(self, **options):
+        call_command('seed_yatube', stdout=StringIO(),
+                     **{**OPTIONS, **options})
+
+    def snapshot(self):
+        return (
+            list(Post.objects.order_by('pk').values_list(
+                'author__username', 'group__slug', 'text', 'pub_date',
+                'image')),
+            list(Comment.objects.order_by('pk').values_list(
+                'post_id', 'author__username', 'text')),
+            sorted(Follow.objects.values_list(
+                'user__username', 'author__username')),
+        )
+
+    def test_counts(self):
+        """Создаётся запрошенное число строк, без подписок на себя."""
+        self.seed()
+        self.assertEqual(User.objects.count(), 30)
+        self.assertEqual(Group.objects.count(), 3)
+        self.assertEqual(Post.objects.count(), 200)
+        self.assertEqual(Comment.objects.count(), 100)
+        self.assertFalse(Comment.objects.filter(
+            pub_date__lt=F('post__pub_date')).exists())
+        self.assertTrue(Follow.objects.exists())
+        self.assertFalse(Follow.objects.filter(
+            user=F('author')).exists())
+        with_images = Post.objects.exclude(image='')
+        self.assertTrue(20 < with_images.count() < 80)
+        self.assertFalse(with_images.filter(image_width=None).exists())
+
+    def test_follow_graph_is_skewed(self):
+        """Популярные авторы собирают заметно больше подписчиков."""
+        self.seed(users=200, posts=0, comments=0, image_share=0)
+        followers = Follow.objects.filter(author__username='user0').count()
+        median = sorted(
+            Follow.objects.filter(author__username=f'user{number}')
+            .count() for number in range(200))[100]
+        self.assertGreater(followers, median * 5)
+
+    def test_deterministic(self):
+        """Одно и то же зерно даёт те же данные, другое — другие."""
+        self.seed(seed=7)
+        first = self.snapshot()
+        Post.objects.all().delete()
+        Follow.objects.all().delete()
+        User.objects.all().delete()
+        Group.objects.all().delete()
+        self.seed(seed=7)
+        self.assertEqual(self.snapshot()[0], first[0])
+        self.assertEqual(self.snapshot()[2], first[2])
+        self.assertEqual(
+            [row[1:] for row in self.snapshot()[1]],
+            [row[1:] for row in first[1]])
+        Post.objects.all().delete()
+        User.objects.all().delete()
+        self.seed(seed=8)
+        self.assertNotEqual(self.snapshot()[0], first[0])
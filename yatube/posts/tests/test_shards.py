@@ -0,0 +1,307 @@
+from datetime import timedelta
+from io import StringIO
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connections
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from .. import export, shards
+from ..management.commands.reshard_posts import record_moves
+from ..models import AuthorStats, Comment, Follow, Group, Post, User
+
+SHARDS = ['default', 'shard_1', 'shard_2']
+INDEX_URL = reverse('posts:index')
+FOLLOW_INDEX_URL = reverse('posts:follow_index')
+
+
+@override_settings(POST_SHARDS=SHARDS, SHARD_BUCKETS=64)
+class ShardTests(TestCase):
+    databases = set(SHARDS)
+
+    @classmethod
+    def setUpTestData(cls):
+        # Бакет автора — id % 64, шард — бакет % 3
+        cls.authors = {
+            alias: User.objects.create_user(id=3 + number,
+                                            username=f'author{number}')
+            for number, alias in enumerate(SHARDS)
+        }
+        cls.reader = User.objects.create_user(id=9, username='reader')
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.reader)
+
+    def publish(self, alias, minutes, text='Пост'):
+        post = Post.objects.create(author=self.authors[alias], text=text)
+        Post.objects.using(alias).filter(pk=post.pk).update(
+            pub_date=timezone.now() - timedelta(minutes=minutes))
+        return post
+
+    def queries(self, url, data=None):
+        """Ответ и число запросов к каждой базе."""
+        contexts = {alias: CaptureQueriesContext(connections[alias])
+                    for alias in SHARDS}
+        for context in contexts.values():
+            context.__enter__()
+        try:
+            response = self.client.get(url, data)
+        finally:
+            for context in contexts.values():
+                context.__exit__(None, None, None)
+        return response, {alias: len(context)
+                          for alias, context in contexts.items()}
+
+    def test_post_stored_in_author_shard(self):
+        """Пост и комментарий к нему лежат в шарде автора поста, а id
+        несут его бакет."""
+        post = self.publish('shard_2', 0)
+        comment = Comment.objects.create(post=post, author=self.reader,
+                                         text='Ответ')
+        for alias in SHARDS:
+            with self.subTest(alias=alias):
+                self.assertEqual(
+                    Post.objects.using(alias).filter(pk=post.pk).exists(),
+                    alias == 'shard_2')
+        self.assertTrue(Comment.objects.using('shard_2')
+                        .filter(pk=comment.pk, post=post).exists())
+        self.assertEqual(shards.for_post(post.pk), 'shard_2')
+        self.assertEqual(shards.bucket(comment.pk), shards.bucket(post.pk))
+
+    def test_index_merges_shards(self):
+        """Главная сливает шарды в общем порядке дат, и курсор ведёт на
+        продолжение."""
+        posts = [self.publish(SHARDS[minutes % 3], minutes, str(minutes))
+                 for minutes in range(12)]
+        response = self.client.get(INDEX_URL)
+        page = list(response.context['page_obj'])
+        self.assertEqual([post.pk for post in page],
+                         [post.pk for post in posts[:10]])
+        self.assertEqual(page[1].author.username, 'author1')
+        after = response.context['page_obj'].paginator.next_cursor
+        response = self.client.get(INDEX_URL, {'after': after})
+        self.assertEqual([post.pk for post in response.context['page_obj']],
+                         [post.pk for post in posts[10:]])
+        response = self.client.get(INDEX_URL, {'page': 2})
+        self.assertEqual([post.pk for post in response.context['page_obj']],
+                         [post.pk for post in posts[10:]])
+
+    def test_profile_and_post_detail_hit_one_shard(self):
+        post = self.publish('shard_1', 0)
+        Comment.objects.create(post=post, author=self.reader, text='Ответ')
+        for url in (reverse('posts:profile', args=['author1']),
+                    reverse('posts:post_detail', args=[post.pk])):
+            with self.subTest(url=url):
+                response, counts = self.queries(url)
+                self.assertContains(response, 'Пост')
+                self.assertGreater(counts['shard_1'], 0)
+                self.assertEqual(counts['shard_2'], 0)
+
+    def test_follow_index_reads_followed_shards(self):
+        first = self.publish('default', 2)
+        second = self.publish('shard_1', 1)
+        self.publish('shard_2', 0)
+        for alias in ('default', 'shard_1'):
+            Follow.objects.create(user=self.reader,
+                                  author=self.authors[alias])
+        response, counts = self.queries(FOLLOW_INDEX_URL)
+        page = response.context['page_obj']
+        self.assertEqual([post.pk for post in page], [second.pk, first.pk])
+        self.assertTrue(all(post.is_following for post in page))
+        self.assertEqual(counts['shard_2'], 0)
+
+    def test_add_comment(self):
+        post = self.publish('shard_2', 0)
+        self.client.post(reverse('posts:add_comment', args=[post.pk]),
+                         {'text': 'Ответ'})
+        self.assertTrue(Comment.objects.using('shard_2')
+                        .filter(post=post, text='Ответ').exists())
+        response = self.client.get(
+            reverse('posts:post_detail', args=[post.pk]))
+        self.assertContains(response, 'Ответ')
+
+    def test_search_merges_shards(self):
+        """Поиск идёт по индексу каждого шарда, фильтр по автору — только
+        в его шарде."""
+        first = self.publish('shard_1', 1, 'Ежик в тумане')
+        second = self.publish('shard_2', 0, 'Ежик и лошадка')
+        self.publish('default', 0, 'Лошадка')
+        url = reverse('posts:search')
+        response = self.client.get(url, {'q': 'ежик'})
+        self.assertEqual(
+            {post.pk for post in response.context['page_obj']},
+            {first.pk, second.pk})
+        response, counts = self.queries(url, {'q': 'ежик',
+                                              'author': 'author1'})
+        self.assertEqual([post.pk for post in response.context['page_obj']],
+                         [first.pk])
+        self.assertEqual(counts['shard_2'], 0)
+
+    def test_api_merges_shards(self):
+        """API сливает шарды, а авторов, группы и подписки берёт из
+        основной базы."""
+        group = Group.objects.create(title='Группа', slug='group')
+        posts = [self.publish(alias, minutes)
+                 for minutes, alias in enumerate(SHARDS)]
+        Post.objects.using('shard_1').filter(pk=posts[1].pk).update(
+            group=group)
+        Comment.objects.create(post=posts[2], author=self.reader,
+                               text='Ответ')
+        Follow.objects.create(user=self.reader, author=self.authors['shard_1'])
+        fields = {'fields': 'id,author,group,is_following'}
+        response = self.client.get(reverse('api:index'), fields)
+        self.assertEqual(response.json()['results'], [
+            {'id': posts[0].pk, 'author': 'author0', 'group': None,
+             'is_following': False},
+            {'id': posts[1].pk, 'author': 'author1', 'group': 'group',
+             'is_following': True},
+            {'id': posts[2].pk, 'author': 'author2', 'group': None,
+             'is_following': False},
+        ])
+        response = self.client.get(
+            reverse('api:index'),
+            {'ids': f'{posts[2].pk},{posts[0].pk}', 'fields': 'id'})
+        self.assertEqual(response.json()['results'],
+                         [{'id': posts[2].pk}, {'id': posts[0].pk}])
+        for url, expected in (
+                (reverse('api:follow_index'), [posts[1].pk]),
+                (reverse('api:group_posts', args=['group']), [posts[1].pk]),
+                (reverse('api:profile', args=['author2']), [posts[2].pk])):
+            with self.subTest(url=url):
+                response, counts = self.queries(url)
+                self.assertEqual(
+                    [row['id'] for row in response.json()['results']],
+                    expected)
+                if 'group' not in url:
+                    self.assertEqual(
+                        sum(count > 0 for count in counts.values()), 2)
+        response = self.client.get(
+            reverse('api:post_detail', args=[posts[1].pk]))
+        self.assertEqual(response.json()['author'], 'author1')
+        response = self.client.get(
+            reverse('api:post_comments', args=[posts[2].pk]))
+        self.assertEqual([(row['author'], row['text'])
+                          for row in response.json()['results']],
+                         [('reader', 'Ответ')])
+
+    def test_export_reads_every_shard(self):
+        posts = [self.publish(alias, 0) for alias in SHARDS]
+        Comment.objects.create(post=posts[2], author=self.reader,
+                               text='Ответ')
+        self.assertEqual({row['id'] for row in export.rows('posts')},
+                         {post.pk for post in posts})
+        self.assertEqual(
+            [row['post_id'] for row in export.rows('comments',
+                                                   author=self.reader)],
+            [posts[2].pk])
+
+    def test_admin_reads_shards(self):
+        """Список в админке — по одному шарду, пост и комментарий
+        открываются из своего шарда."""
+        admin = User.objects.create_superuser('admin', 'a@a.ru', 'pass')
+        self.client.force_login(admin)
+        post = self.publish('shard_2', 0, 'Пост в шарде')
+        comment = Comment.objects.create(post=post, author=self.reader,
+                                         text='Ответ')
+        changelist = reverse('admin:posts_post_changelist')
+        for alias, expected in (('shard_2', [post.pk]), ('shard_1', [])):
+            with self.subTest(alias=alias):
+                response = self.client.get(changelist, {'shard': alias})
+                self.assertEqual(
+                    [row.pk for row in response.context['cl'].result_list],
+                    expected)
+        for name, obj in (('admin:posts_post_change', post),
+                          ('admin:posts_comment_change', comment)):
+            with self.subTest(name=name):
+                response = self.client.get(reverse(name, args=[obj.pk]))
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response.context['original'], obj)
+        response = self.client.get(
+            reverse('admin:posts_comment_changelist'), {'shard': 'shard_2'})
+        self.assertContains(response, 'reader')
+        self.client.post(reverse('admin:posts_post_change', args=[post.pk]),
+                         {'text': 'Исправлен', 'author': post.author_id,
+                          'group': ''})
+        self.assertEqual(Post.objects.using('shard_2').get(pk=post.pk).text,
+                         'Исправлен')
+
+    def test_deletes_reach_every_shard(self):
+        """Удаление пользователя удаляет его посты и комментарии во всех
+        шардах, удаление группы убирает её у постов всех шардов."""
+        author = User.objects.get(pk=self.authors['shard_1'].pk)
+        post = self.publish('shard_1', 1)
+        other = self.publish('shard_2', 0)
+        group = Group.objects.create(title='Группа', slug='group')
+        Post.objects.using('shard_2').filter(pk=other.pk).update(group=group)
+        Comment.objects.create(post=post, author=self.reader, text='Ответ')
+        Comment.objects.create(post=other, author=author, text='Ответ')
+        author.delete()
+        self.assertFalse(Post.objects.using('shard_1').exists())
+        self.assertFalse(Comment.objects.using('shard_1').exists())
+        self.assertFalse(Comment.objects.using('shard_2').exists())
+        response = self.client.get(
+            reverse('posts:post_detail', args=[post.pk]))
+        self.assertEqual(response.status_code, 404)
+        group.delete()
+        self.assertIsNone(
+            Post.objects.using('shard_2').get(pk=other.pk).group_id)
+
+    def test_reshard(self):
+        """Посты, созданные без шардов, переезжают в шарды авторов с
+        новыми id, комментарии — вместе с ними."""
+        with self.settings(POST_SHARDS=[]):
+            posts = {alias: Post.objects.create(author=author, text=alias)
+                     for alias, author in self.authors.items()}
+            comment = Comment.objects.create(post=posts['shard_1'],
+                                             author=self.reader, text='Ответ')
+        out = StringIO()
+        call_command('reshard_posts', stdout=out)
+        self.assertIn('default: перенесено постов: 3, комментариев: 1',
+                      out.getvalue())
+        for alias, author in self.authors.items():
+            with self.subTest(alias=alias):
+                post = Post.objects.using(alias).get(author=author)
+                self.assertEqual(post.text, alias)
+                self.assertEqual(post.pub_date, posts[alias].pub_date)
+                self.assertEqual(shards.for_post(post.pk), alias)
+        moved = Comment.objects.using('shard_1').get()
+        self.assertEqual(moved.text, comment.text)
+        self.assertEqual(moved.post.author, self.authors['shard_1'])
+        self.assertEqual(AuthorStats.objects.get(
+            user=self.authors['shard_1']).posts_count, 1)
+        out = StringIO()
+        call_command('reshard_posts', stdout=out)
+        self.assertNotIn('перенесено постов: 1', out.getvalue())
+
+    def test_reshard_keeps_old_urls(self):
+        """Адреса поста по старому id ведут на новый, а новые посты
+        старых id не получают."""
+        with self.settings(POST_SHARDS=[]):
+            old = Post.objects.create(author=self.authors['shard_1'],
+                                      text='Старый')
+        call_command('reshard_posts', stdout=StringIO())
+        new = Post.objects.using('shard_1').get(text='Старый')
+        self.assertNotEqual(new.pk, old.pk)
+        for name in ('posts:post_detail', 'posts:post_comments',
+                     'posts:post_edit', 'api:post_detail',
+                     'api:post_comments'):
+            with self.subTest(name=name):
+                response = self.client.get(reverse(name, args=[old.pk]),
+                                           {'after': 'x'})
+                self.assertRedirects(
+                    response, reverse(name, args=[new.pk]) + '?after=x',
+                    status_code=301, fetch_redirect_response=False)
+        response = self.client.get(reverse('posts:post_detail',
+                                           args=[new.pk + 1]))
+        self.assertEqual(response.status_code, 404)
+        later = Post.objects.create(author=self.authors['default'],
+                                    text='Новый')
+        self.assertGreater(later.pk, old.pk)
+        # Повторный переезд сокращает цепочку: старый id ведёт сразу
+        # на последний
+        record_moves({new.pk: new.pk + 64})
+        self.assertEqual(shards.moved(old.pk), new.pk + 64)
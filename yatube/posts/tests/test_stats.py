@@ -0,0 +1,75 @@
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase
+from django.urls import reverse
+
+from ..models import AuthorStats, Comment, Follow, Post, User
+
+
+class AuthorStatsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(username='author')
+        cls.reader = User.objects.create_user(username='reader')
+        cls.PROFILE_URL = reverse('posts:profile',
+                                  args=[cls.author.username])
+
+    def stats(self, user):
+        return AuthorStats.objects.get(user=user)
+
+    def test_counters_follow_writes(self):
+        """Счётчики меняются при создании и удалении записей."""
+        post = Post.objects.create(author=self.author, text='Пост')
+        comment = Comment.objects.create(post=post, author=self.reader,
+                                         text='Комментарий')
+        follow = Follow.objects.create(user=self.reader, author=self.author)
+        expected = {
+            (self.author, 'posts_count'): 1,
+            (self.author, 'followers_count'): 1,
+            (self.reader, 'comments_count'): 1,
+            (self.reader, 'following_count'): 1,
+        }
+        for (user, field), value in expected.items():
+            with self.subTest(user=user, field=field):
+                self.assertEqual(getattr(self.stats(user), field), value)
+        post.refresh_from_db()
+        self.assertEqual(post.comment_count, 1)
+        follow.delete()
+        comment.delete()
+        post.refresh_from_db()
+        self.assertEqual(post.comment_count, 0)
+        post.delete()
+        for (user, field), value in expected.items():
+            with self.subTest(user=user, field=field):
+                self.assertEqual(getattr(self.stats(user), field), 0)
+
+    def test_edit_keeps_comment_count(self):
+        """Сохранение поста, прочитанного до нового комментария, не
+        теряет этот комментарий в счётчике."""
+        post = Post.objects.create(author=self.author, text='Пост')
+        Comment.objects.create(post=post, author=self.reader,
+                               text='Комментарий')
+        post.text = 'Исправленный пост'
+        post.save()
+        post.refresh_from_db()
+        self.assertEqual(post.comment_count, 1)
+        self.assertEqual(post.text, 'Исправленный пост')
+
+    def test_recount_repairs_drift(self):
+        """Команда recount_author_stats исправляет расхождения."""
+        Post.objects.create(author=self.author, text='Пост')
+        AuthorStats.objects.filter(user=self.author).update(posts_count=7)
+        AuthorStats.objects.filter(user=self.reader).delete()
+        out = StringIO()
+        call_command('recount_author_stats', batch_size=1, stdout=out)
+        self.assertEqual(self.stats(self.author).posts_count, 1)
+        self.assertEqual(self.stats(self.reader).posts_count, 0)
+        self.assertIn('исправлено: 2', out.getvalue())
+
+    def test_profile_reads_one_stats_row(self):
+        """Профиль не считает посты, комментарии и подписки через COUNT."""
+        Post.objects.create(author=self.author, text='Пост')
+        response = self.client.get(self.PROFILE_URL)
+        self.assertEqual(response.context['stats'].posts_count, 1)
+        self.assertContains(response, 'Всего постов: 1')
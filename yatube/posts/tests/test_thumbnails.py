@@ -0,0 +1,184 @@
+import shutil
+import tempfile
+from io import BytesIO, StringIO
+from unittest import mock
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from PIL import Image
+
+from .. import thumbnails
+from ..models import Post, User
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+SMALL_GIF = (
+    b'\x47\x49\x46\x38\x39\x61\x01\x00'
+    b'\x01\x00\x00\x00\x00\x21\xf9\x04'
+    b'\x01\x0a\x00\x01\x00\x2c\x00\x00'
+    b'\x00\x00\x01\x00\x01\x00\x00\x02'
+    b'\x02\x4c\x01\x00\x3b'
+)
+PLACEHOLDER = 'aspect-ratio: 960 / 339'
+
+
+def uploaded(name='small.gif', content=SMALL_GIF):
+    return SimpleUploadedFile(name=name, content=content,
+                              content_type='image/gif')
+
+
+def gif(width, height):
+    buffer = BytesIO()
+    Image.new('RGB', (width, height)).save(buffer, 'GIF')
+    return buffer.getvalue()
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class ThumbnailTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='photographer')
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.user)
+
+    def test_generated_thumbnail_is_shown(self):
+        """Готовая миниатюра попадает в пост и на страницы."""
+        post = Post.objects.create(author=self.user, text='Текст',
+                                   image=uploaded())
+        url = thumbnails.generate(post.pk)
+        post.refresh_from_db()
+        self.assertEqual(post.thumbnail, url)
+        self.assertTrue(url.startswith(settings.MEDIA_URL))
+        for page in (reverse('posts:index'),
+                     reverse('posts:post_detail', args=[post.pk])):
+            with self.subTest(page=page):
+                response = self.client.get(page)
+                self.assertContains(response, f'src="{url}"')
+                self.assertNotContains(response, PLACEHOLDER)
+
+    def test_new_image_resets_thumbnail(self):
+        """Смена картинки сбрасывает старую миниатюру."""
+        post = Post.objects.create(author=self.user, text='Текст',
+                                   image=uploaded())
+        thumbnails.generate(post.pk)
+        self.client.post(reverse('posts:post_edit', args=[post.pk]),
+                         {'text': 'Текст', 'image': uploaded('new.gif')})
+        post.refresh_from_db()
+        self.assertEqual(post.thumbnail, '')
+        self.assertEqual(post.srcset, '')
+
+    def test_srcset_widths(self):
+        """Набор ширин не шире исходника, самая узкая строится всегда."""
+        cases = ((SMALL_GIF, ['320w']), (gif(700, 300), ['320w', '640w']))
+        for content, expected in cases:
+            with self.subTest(expected=expected):
+                post = Post.objects.create(author=self.user, text='Текст',
+                                           image=uploaded(content=content))
+                thumbnails.generate(post.pk)
+                post.refresh_from_db()
+                self.assertEqual(
+                    [item.split()[1] for item in post.srcset.split(', ')],
+                    expected)
+
+    def test_picture_markup(self):
+        """Картинка выводится через picture с размерами и lazy-загрузкой."""
+        post = Post.objects.create(author=self.user, text='Текст',
+                                   image=uploaded())
+        with mock.patch.object(thumbnails, 'WEBP', False):
+            thumbnails.generate(post.pk)
+        post.refresh_from_db()
+        self.assertEqual(post.srcset_webp, '')
+        response = self.client.get(
+            reverse('posts:post_detail', args=[post.pk]))
+        self.assertContains(response, f'srcset="{post.srcset}"')
+        self.assertContains(response, 'loading="lazy"')
+        self.assertContains(response, 'width="960" height="339"')
+        self.assertNotContains(response, 'image/webp')
+        Post.objects.filter(pk=post.pk).update(srcset_webp='/m/a.webp 320w')
+        response = self.client.get(
+            reverse('posts:post_detail', args=[post.pk]))
+        self.assertContains(response, 'srcset="/m/a.webp 320w"')
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, THUMBNAIL_WORKERS=2)
+class ThumbnailScheduleTests(TransactionTestCase):
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='photographer')
+        self.client.force_login(self.user)
+
+    def test_create_does_not_render_thumbnail(self):
+        """Создание поста не строит миниатюру в запросе: задача уходит в
+        пул только после фиксации транзакции."""
+        pool = mock.Mock()
+        pool.submit.side_effect = lambda task, post_id: self.assertFalse(
+            connection.in_atomic_block)
+        with mock.patch.object(thumbnails, 'executor', return_value=pool), \
+                mock.patch.object(thumbnails, 'render') as render:
+            self.client.post(reverse('posts:post_create'),
+                             {'text': 'С картинкой', 'image': uploaded()})
+        post = Post.objects.latest('pk')
+        render.assert_not_called()
+        pool.submit.assert_called_once_with(thumbnails.run, post.pk)
+        self.assertEqual(post.thumbnail, '')
+        response = self.client.get(
+            reverse('posts:post_detail', args=[post.pk]))
+        self.assertContains(response, PLACEHOLDER)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class GenerateThumbnailsCommandTests(TransactionTestCase):
+    databases = {'default', 'shard_1', 'shard_2'}
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def test_command_fills_missing_thumbnails(self):
+        """Команда строит миниатюры для постов без них."""
+        user = User.objects.create_user(username='photographer')
+        posts = [Post.objects.create(author=user, text=str(i),
+                                     image=uploaded(f'{i}.gif'))
+                 for i in range(3)]
+        Post.objects.create(author=user, text='Без картинки')
+        out = StringIO()
+        call_command('generate_thumbnails', workers=2, stdout=out)
+        self.assertIn('Построено миниатюр: 3', out.getvalue())
+        for post in posts:
+            post.refresh_from_db()
+            self.assertNotEqual(post.thumbnail, '')
+
+    @override_settings(POST_SHARDS=['default', 'shard_1', 'shard_2'])
+    def test_command_reads_every_shard(self):
+        """С шардами команда обходит посты каждого шарда."""
+        posts = [
+            Post.objects.create(
+                author=User.objects.create_user(id=3 + i, username=str(i)),
+                text=str(i), image=uploaded(f'{i}.gif'))
+            for i in range(3)
+        ]
+        out = StringIO()
+        call_command('generate_thumbnails', workers=2, stdout=out)
+        self.assertIn('Построено миниатюр: 3', out.getvalue())
+        for alias, post in zip(['default', 'shard_1', 'shard_2'], posts):
+            with self.subTest(alias=alias):
+                self.assertNotEqual(
+                    Post.objects.using(alias).get(pk=post.pk).thumbnail, '')
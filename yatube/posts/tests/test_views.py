@@ -1,15 +1,25 @@
+import base64
 import shutil
 import tempfile
+import time
+from http import HTTPStatus
+from unittest import mock
 
 from django import forms
 from django.conf import settings
 from django.core.cache import cache
 from django.core.files.uploadedfile import SimpleUploadedFile
-from django.test import Client, TestCase, override_settings
+from django.db import connection
+from django.template import Context, Template
+from django.test import Client, SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from yatube.settings import POST_COUNT
 
-from ..models import Follow, Group, Post, User
+from core import routers
+
+from .. import caching
+from ..models import Comment, Follow, Group, Post, User
 
 INDEX_URL = reverse('posts:index')
 POST_CREATE_POST = reverse('posts:post_create')
@@ -136,13 +146,65 @@ class TaskURLTests(TestCase):
     def test_cache(self):
         """Проверка кеша"""
         start_content = self.authorized_client.get(INDEX_URL).content
-        Post.objects.all().delete()
-        after_delete_content = self.authorized_client.get(INDEX_URL).content
-        self.assertEqual(start_content, after_delete_content)
+        Post.objects.filter(pk=self.post1.pk).update(text='Тайком')
+        after_update_content = self.authorized_client.get(INDEX_URL).content
+        self.assertEqual(start_content, after_update_content)
         cache.clear()
         after_clear_content = self.authorized_client.get(INDEX_URL).content
         self.assertNotEqual(start_content, after_clear_content)
 
+    def test_cache_invalidated_by_writes(self):
+        """Сохранение и удаление поста сбрасывают закэшированные ленты."""
+        pages = (INDEX_URL, self.GROUP_LIST_URL, self.PROFILE_URL)
+        for page in pages:
+            self.authorized_client.get(page)
+        post = Post.objects.get(pk=self.post1.pk)
+        post.text = 'Отредактированный текст'
+        post.save()
+        for page in pages:
+            with self.subTest(page=page):
+                self.assertContains(self.authorized_client.get(page),
+                                    'Отредактированный текст')
+        Post.objects.all().delete()
+        for page in pages:
+            with self.subTest(page=page):
+                self.assertNotContains(self.authorized_client.get(page),
+                                       'Отредактированный текст')
+
+    def test_post_edit_rerenders_only_its_fragment(self):
+        """Правка поста перерисовывает только его фрагмент в ленте."""
+        cache.clear()
+        self.authorized_client.get(INDEX_URL)
+        Post.objects.filter(pk=self.post1.pk).update(text='Тайком')
+        self.authorized_client.post(
+            self.POST_EDIT_URL,
+            data={'text': 'Правка через форму', 'group': self.group.id})
+        content = self.authorized_client.get(INDEX_URL).content.decode()
+        self.assertIn('Правка через форму', content)
+        self.assertIn(self.post1.text, content)
+        self.assertNotIn('Тайком', content)
+
+    def test_post_fragment_follows_author_name(self):
+        """Смена имени автора перерисовывает фрагменты его постов."""
+        template = Template("{% include 'includes/single_post.html' %}")
+        self.user.first_name = 'Старое'
+        self.user.save()
+        post = Post.objects.select_related('author').get(pk=self.post1.pk)
+        self.assertIn('Старое', template.render(Context({'post': post})))
+        self.user.first_name = 'Новое'
+        self.user.save()
+        post = Post.objects.select_related('author').get(pk=self.post1.pk)
+        content = template.render(Context({'post': post}))
+        self.assertIn('Новое', content)
+        self.assertNotIn('Старое', content)
+
+    def test_cache_varies_by_audience(self):
+        """Гость и пользователь получают разные варианты ленты."""
+        guest_content = Client().get(INDEX_URL).content.decode()
+        user_content = self.authorized_client.get(INDEX_URL).content.decode()
+        self.assertNotIn('Избранные авторы', guest_content)
+        self.assertIn('Избранные авторы', user_content)
+
 
 class PaginatorViewsTest(TestCase):
     @classmethod
@@ -181,6 +243,297 @@ class PaginatorViewsTest(TestCase):
             self.assertEqual(count_posts1, POST_COUNT)
             self.assertEqual(count_posts2, TEST_OF_POST - POST_COUNT)
 
+    def test_cursor_pages(self):
+        """Курсорные страницы идут подряд, без пропусков и повторов."""
+        pages: tuple = (INDEX_URL,
+                        self.PROFILE_URL,
+                        self.GROUP_LIST_URL)
+        for page in pages:
+            with self.subTest(page=page):
+                first = self.client.get(page).context['page_obj']
+                first_ids = [post.id for post in first]
+                second = self.client.get(
+                    page, {'after': first.paginator.next_cursor}
+                ).context['page_obj']
+                second_ids = [post.id for post in second]
+                self.assertEqual(len(first_ids), POST_COUNT)
+                self.assertEqual(len(second_ids), TEST_OF_POST - POST_COUNT)
+                self.assertEqual(
+                    sorted(first_ids + second_ids, reverse=True),
+                    first_ids + second_ids)
+                self.assertIsNone(second.paginator.next_cursor)
+                back = self.client.get(
+                    page, {'before': second.paginator.previous_cursor}
+                ).context['page_obj']
+                self.assertEqual([post.id for post in back], first_ids)
+                self.assertIsNone(back.paginator.previous_cursor)
+
+    def test_cursor_page_does_not_count(self):
+        """Курсорная страница не выполняет COUNT."""
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(INDEX_URL)
+            self.assertEqual(len(response.context['page_obj']), POST_COUNT)
+        for query in queries.captured_queries:
+            self.assertNotIn('COUNT(', query['sql'])
+
+    def test_broken_cursor_falls_back_to_first_page(self):
+        """Битый токен курсора отдаёт первую страницу, в том числе
+        правильно упакованный, но с подменённым ключом."""
+        tokens = ['!!!'] + [
+            base64.urlsafe_b64encode(payload.encode()).decode()
+            for payload in (
+                '[null,1]', '["2020-13-45T00:00:00",1]', '["zzz",1]',
+                '[5,1]', '[[1],1]', '[{"a":1},1]',
+                '["2020-01-01T00:00:00",99999999999999999999]')]
+        urls = (INDEX_URL, reverse('posts:search'),
+                reverse('api:index'))
+        for url in urls:
+            for token in tokens:
+                for direction in ('after', 'before'):
+                    with self.subTest(url=url, token=token,
+                                      direction=direction):
+                        response = self.client.get(
+                            url, {direction: token, 'q': 'Тестовый'})
+                        self.assertEqual(response.status_code,
+                                         HTTPStatus.OK)
+        response = self.client.get(INDEX_URL, {'after': tokens[2]})
+        self.assertEqual(len(response.context['page_obj']), POST_COUNT)
+        self.assertIsNone(response.context['page_obj'].paginator.
+                          previous_cursor)
+
+
+class ConditionalGetTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(username='author')
+        cls.reader = User.objects.create_user(username='reader')
+        cls.group = Group.objects.create(title='Группа', slug='group')
+        cls.post = Post.objects.create(text='Пост', author=cls.author,
+                                       group=cls.group)
+        cls.URLS = (
+            INDEX_URL,
+            reverse('posts:group_list', args=[cls.group.slug]),
+            reverse('posts:profile', args=[cls.author.username]),
+            reverse('posts:post_detail', args=[cls.post.id]),
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.reader)
+
+    def revalidate(self, url):
+        etag = self.client.get(url)['ETag']
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        return response, queries
+
+    def test_unchanged_page_is_not_modified(self):
+        """Неизменная страница отдаёт 304 без выборки постов."""
+        for url in self.URLS:
+            with self.subTest(url=url):
+                response, queries = self.revalidate(url)
+                self.assertEqual(response.status_code,
+                                 HTTPStatus.NOT_MODIFIED)
+                self.assertLessEqual(len(queries), 3)
+
+    def test_changes_invalidate_etag(self):
+        """Новый комментарий меняет ETag страницы поста, подписка и другой
+        зритель — ETag всех страниц."""
+        etags = {url: self.client.get(url)['ETag'] for url in self.URLS}
+        self.client.post(reverse('posts:add_comment', args=[self.post.id]),
+                         {'text': 'Новый комментарий'})
+        detail_url = reverse('posts:post_detail', args=[self.post.id])
+        for url in self.URLS:
+            with self.subTest(url=url):
+                response = self.client.get(url,
+                                           HTTP_IF_NONE_MATCH=etags[url])
+                self.assertEqual(
+                    response.status_code,
+                    HTTPStatus.OK if url == detail_url
+                    else HTTPStatus.NOT_MODIFIED)
+                etags[url] = response['ETag']
+        self.client.get(reverse('posts:profile_follow',
+                                args=[self.author.username]))
+        for url in self.URLS:
+            with self.subTest(url=url):
+                self.assertNotEqual(self.client.get(url)['ETag'], etags[url])
+        guest = Client().get(INDEX_URL, HTTP_IF_NONE_MATCH=etags[INDEX_URL])
+        self.assertEqual(guest.status_code, HTTPStatus.OK)
+
+    def test_pages_have_own_etags(self):
+        """У разных страниц ленты разные ETag."""
+        first = self.client.get(INDEX_URL)['ETag']
+        second = self.client.get(INDEX_URL, {'page': 2})['ETag']
+        self.assertNotEqual(first, second)
+
+
+@override_settings(DATABASE_REPLICAS=['replica'])
+class ReplicaFreshnessTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_stale_replica_bypasses_cache(self):
+        """Пока реплика не скопирована после записи, страницы областей
+        этой записи не кэшируются и идут без ETag."""
+        with routers.replica('replica'):
+            self.assertFalse(caching.replica_fresh('index'))
+            routers.mark_synced('replica', time.time() - 1)
+            self.assertTrue(caching.replica_fresh('index'))
+            caching.bump('index')
+            self.assertFalse(caching.replica_fresh('index'))
+            self.assertTrue(caching.replica_fresh('group:1'))
+            with routers.pinned():
+                self.assertTrue(caching.replica_fresh('index'))
+            routers.mark_synced('replica', time.time() + 1)
+            self.assertTrue(caching.replica_fresh('index'))
+        self.assertIsNone(caching.etag(None, 'часть'))
+
+    def test_feed_cache_without_key(self):
+        """Без ключа ленты фрагмент рендерится заново, с ключом —
+        берётся из кэша."""
+        template = Template('{% load feed_cache %}'
+                            '{% feed_cache 300 feed key %}{{ value }}'
+                            '{% endfeed_cache %}')
+        for key, expected in ((None, 'второй'), ('key', 'первый')):
+            with self.subTest(key=key):
+                template.render(Context({'key': key, 'value': 'первый'}))
+                self.assertEqual(
+                    template.render(Context({'key': key,
+                                             'value': 'второй'})),
+                    expected)
+
+
+class FeedQueriesTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(username='author')
+        cls.reader = User.objects.create_user(username='reader')
+        cls.group = Group.objects.create(title='Группа', slug='group')
+        Follow.objects.create(user=cls.reader, author=cls.author)
+        cls.post = Post.objects.create(text='Пост', author=cls.author,
+                                       group=cls.group)
+        Comment.objects.create(post=cls.post, author=cls.reader,
+                               text='Комментарий')
+        cls.FEED_URLS = (
+            INDEX_URL,
+            reverse('posts:group_list', args=[cls.group.slug]),
+            reverse('posts:profile', args=[cls.author.username]),
+            reverse('posts:follow_index'),
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.reader)
+
+    def feed_queries(self):
+        counts = []
+        for url in self.FEED_URLS:
+            cache.clear()
+            with CaptureQueriesContext(connection) as queries:
+                self.client.get(url)
+            counts.append(len(queries))
+        return counts
+
+    def test_feed_queries_do_not_grow(self):
+        """Число запросов ленты не зависит от числа постов на странице."""
+        before = self.feed_queries()
+        for i in range(POST_COUNT):
+            post = Post.objects.create(text=f'Ещё {i}', author=self.author,
+                                       group=self.group)
+            Comment.objects.create(post=post, author=self.reader,
+                                   text='Комментарий')
+        self.assertEqual(self.feed_queries(), before)
+
+    def test_feed_annotations(self):
+        """В ленте видны число комментариев и подписка на автора."""
+        for url in self.FEED_URLS:
+            with self.subTest(url=url):
+                post = self.client.get(url).context['page_obj'][0]
+                self.assertEqual(post.comment_count, 1)
+                self.assertTrue(post.is_following)
+        guest_post = Client().get(INDEX_URL).context['page_obj'][0]
+        self.assertFalse(guest_post.is_following)
+
+    def test_new_comment_refreshes_feed(self):
+        """Комментарий не сбрасывает ленты: новое число комментариев
+        появляется со сменой ключа ленты, а на странице поста — сразу."""
+        self.assertContains(self.client.get(INDEX_URL), 'Комментариев: 1')
+        generations = {scope: caching.generations(scope)[0]
+                       for scope in ('index', f'post:{self.post.id}')}
+        self.client.post(reverse('posts:add_comment', args=[self.post.id]),
+                         {'text': 'Второй'})
+        self.assertEqual(caching.generations('index')[0],
+                         generations['index'])
+        self.assertNotEqual(caching.generations(f'post:{self.post.id}')[0],
+                            generations[f'post:{self.post.id}'])
+        self.assertContains(self.client.get(INDEX_URL), 'Комментариев: 1')
+        later = time.time() + caching.FEED_REFRESH
+        with mock.patch.object(caching.time, 'time', return_value=later):
+            self.assertContains(self.client.get(INDEX_URL),
+                                'Комментариев: 2')
+
+    def test_unfollow_refreshes_feed(self):
+        """Отписка убирает отметку о подписке из закэшированной ленты."""
+        self.assertContains(self.client.get(INDEX_URL), 'вы подписаны')
+        self.client.get(reverse('posts:profile_unfollow',
+                                args=[self.author.username]))
+        self.assertNotContains(self.client.get(INDEX_URL), 'вы подписаны')
+
+
+@override_settings(COMMENTS_PER_PAGE=5)
+class CommentPaginationTests(TestCase):
+    COMMENTS_COUNT = 12
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.post = Post.objects.create(
+            text='Обсуждаемый пост',
+            author=User.objects.create_user(username='author'))
+        Comment.objects.bulk_create(
+            Comment(post=cls.post, text=f'Комментарий {i}',
+                    author=User.objects.create_user(username=f'user{i}'))
+            for i in range(cls.COMMENTS_COUNT))
+        cls.POST_DETAIL_URL = reverse('posts:post_detail',
+                                      args=[cls.post.id])
+        cls.POST_COMMENTS_URL = reverse('posts:post_comments',
+                                        args=[cls.post.id])
+
+    def test_comment_queries_do_not_grow(self):
+        """Число запросов страницы поста не зависит от числа комментариев."""
+        with CaptureQueriesContext(connection) as before:
+            self.client.get(self.POST_DETAIL_URL)
+        Comment.objects.bulk_create(
+            Comment(post=self.post, text='Ещё', author=self.post.author)
+            for _ in range(self.COMMENTS_COUNT))
+        with CaptureQueriesContext(connection) as after:
+            response = self.client.get(self.POST_DETAIL_URL)
+        self.assertEqual(len(after), len(before))
+        self.assertEqual(len(response.context['comments']), 5)
+
+    def test_comment_fragments(self):
+        """Фрагменты комментариев идут подряд до последнего."""
+        comments = self.client.get(self.POST_DETAIL_URL).context['comments']
+        seen = [comment.id for comment in comments]
+        cursor = comments.paginator.next_cursor
+        while cursor:
+            response = self.client.get(self.POST_COMMENTS_URL,
+                                       {'after': cursor})
+            self.assertTemplateUsed(response, 'includes/comments_page.html')
+            self.assertNotContains(response, '<html')
+            comments = response.context['comments']
+            seen += [comment.id for comment in comments]
+            cursor = comments.paginator.next_cursor
+        self.assertEqual(seen, list(
+            self.post.comments.order_by('-pub_date', '-id')
+            .values_list('id', flat=True)))
+        self.assertNotContains(response, 'Показать ещё')
+
+    def test_missing_post_comments(self):
+        """Фрагмент комментариев несуществующего поста — 404."""
+        response = self.client.get(
+            reverse('posts:post_comments', args=[self.post.id + 1]))
+        self.assertEqual(response.status_code, HTTPStatus.NOT_FOUND)
+
 
 class FollowTests(TestCase):
     @classmethod
@@ -255,6 +608,15 @@ class FollowTests(TestCase):
         posts_follow = response_follow.context['page_obj']
         self.assertIn(self.test_post, posts_follow)
 
+    def test_follow_feed_is_cached_per_user(self):
+        """Лента подписок одного пользователя не отдаётся другому."""
+        Follow.objects.create(user=self.user, author=self.author)
+        follow_url = reverse('posts:follow_index')
+        self.assertContains(self.authorized_client.get(follow_url),
+                            self.test_post.text)
+        self.assertNotContains(self.authorized_client2.get(follow_url),
+                               self.test_post.text)
+
     def test_follower_not_see_new_post(self):
         """У не подписчика не появляется новый пост автора."""
         Follow.objects.create(user=self.user,
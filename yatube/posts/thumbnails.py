@@ -0,0 +1,124 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections, connections, transaction
+from django.utils import timezone
+from PIL import features
+from sorl.thumbnail import get_thumbnail
+
+from core import timing
+from core.db import retry_on_lock
+
+from . import caching, inbox, shards
+from .models import Post
+
+logger = logging.getLogger(__name__)
+
+WIDTH, HEIGHT = 960, 339
+GEOMETRY = f'{WIDTH}x{HEIGHT}'
+OPTIONS = {'crop': 'center', 'upscale': True}
+# Pillow может быть собран без libwebp: тогда отдаём только исходный формат
+WEBP = features.check('webp')
+
+_executor = None
+
+
+def executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=settings.THUMBNAIL_WORKERS,
+            thread_name_prefix='thumbnails')
+    return _executor
+
+
+def render(image, geometry=GEOMETRY, **options):
+    """Строит миниатюру и возвращает её адрес или пустую строку."""
+    with timing.measure('thumbnails'):
+        thumbnail = get_thumbnail(image, geometry, **OPTIONS, **options)
+        return thumbnail.url if thumbnail.exists() else ''
+
+
+def widths(source_width):
+    """Ширины из POST_IMAGE_WIDTHS, не превышающие ширину исходника.
+
+    Растягивать картинку ради широких экранов бессмысленно; самая узкая
+    ширина строится всегда.
+    """
+    allowed = sorted(settings.POST_IMAGE_WIDTHS)
+    return [width for width in allowed if width <= source_width] or allowed[:1]
+
+
+def render_srcset(image, source_width, **options):
+    """Строит картинку нужных ширин и возвращает значение srcset."""
+    candidates = []
+    for width in widths(source_width):
+        url = render(image, f'{width}x{round(width * HEIGHT / WIDTH)}',
+                     **options)
+        if url:
+            candidates.append(f'{url} {width}w')
+    return ', '.join(candidates)
+
+
+def reset(post):
+    """Забывает построенные картинки: исходник сменился."""
+    post.thumbnail = post.srcset = post.srcset_webp = ''
+
+
+def generate(post_id):
+    """Строит миниатюру и набор ширин картинки поста и сохраняет их
+    адреса в посте.
+
+    Адреса записываются, только если картинка не сменилась, пока
+    миниатюры строились.
+    """
+    posts = Post.objects.using(shards.for_post(post_id))
+    post = (posts.filter(pk=post_id)
+            .only('pk', 'image', 'image_width', 'author', 'group').first())
+    if post is None or not post.image:
+        return ''
+    url = render(post.image)
+    if url:
+        # Размер известен с загрузки; открываем файл только у старых постов
+        source_width = post.image_width or post.image.width
+        srcset = render_srcset(post.image, source_width)
+        srcset_webp = (render_srcset(post.image, source_width, format='WEBP')
+                       if WEBP else '')
+        updated = posts.filter(
+            pk=post_id, image=post.image.name,
+        ).update(thumbnail=url, srcset=srcset, srcset_webp=srcset_webp,
+                 updated=timezone.now())
+        if updated:
+            caching.post_changed(post, {post.group_id},
+                                 inbox.followers(post.author_id))
+    return url
+
+
+def run(post_id):
+    """Задача для пула потоков: своё соединение с базой, ошибки в лог.
+
+    Занятую базу задача пережидает, как представления с записью: иначе
+    миниатюра пропала бы до следующего запуска generate_thumbnails.
+    """
+    close_old_connections()
+    try:
+        return retry_on_lock(generate)(post_id)
+    except Exception:
+        logger.exception('Не удалось построить миниатюру поста %s', post_id)
+    finally:
+        connections.close_all()
+
+
+def schedule(post):
+    """Ставит построение миниатюры в очередь после фиксации транзакции.
+
+    При `THUMBNAIL_WORKERS = 0` миниатюра строится сразу, в том же
+    потоке.
+    """
+    if not post.image:
+        return
+    if settings.THUMBNAIL_WORKERS:
+        transaction.on_commit(lambda: executor().submit(run, post.pk))
+    else:
+        transaction.on_commit(lambda: generate(post.pk))
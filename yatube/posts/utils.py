@@ -1,9 +1,249 @@
+import base64
+import binascii
+import json
+import math
+from collections.abc import Sequence
+
 from django.conf import settings
-from django.core.paginator import Paginator
+from django.core.paginator import Page, Paginator
+from django.db.models import Max, Min, Q
+from django.utils.dateparse import parse_datetime
+from django.utils.functional import cached_property
+
+from . import shards
+
+AFTER = 'after'
+BEFORE = 'before'
+# id в SQLite — 64-битное целое со знаком
+ID = range(1, 2 ** 63)
+
+
+def encode_cursor(value, pk):
+    """Упаковывает ключ (значение, id) в токен для адресной строки."""
+    if hasattr(value, 'isoformat'):
+        value = value.isoformat()
+    raw = json.dumps([value, pk], separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def parse_cursor_value(value, field):
+    """Значение ключа из токена: дата для `pub_date`, иначе число.
+
+    Токен приходит из адресной строки, поэтому значение другого типа
+    или нераспознанная дата — ValueError, а не ошибка в запросе к базе.
+    """
+    if field.endswith('pub_date'):
+        if not isinstance(value, str):
+            raise ValueError('Дата курсора должна быть строкой.')
+        value = parse_datetime(value)
+        if value is None:
+            raise ValueError('Дата курсора не распознана.')
+        return value
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        raise ValueError('Ключ курсора должен быть числом.')
+    value = float(value)
+    if not math.isfinite(value):
+        raise ValueError('Ключ курсора должен быть конечным.')
+    return value
+
+
+def decode_cursor(token, field='pub_date'):
+    """Распаковывает токен курсора по полю `field`; для битого токена
+    возвращает None."""
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        value, pk = json.loads(raw.decode())
+        if isinstance(pk, bool) or not isinstance(pk, int) or pk not in ID:
+            raise ValueError('id курсора вне диапазона.')
+        return parse_cursor_value(value, field), pk
+    except (binascii.Error, UnicodeDecodeError, ValueError, TypeError):
+        return None
+
+
+class CursorPaginator(Paginator):
+    """Паджинатор по ключу (поле, id) без COUNT и OFFSET.
+
+    Страница выбирается условием `(field, id) < курсор` по индексу,
+    поэтому глубокие страницы стоят столько же, сколько первая.
+    Номера страниц и общее количество неизвестны: `number` равен 1
+    только для первой страницы, а `num_pages` лишь показывает, есть ли
+    следующая.
+    """
+    is_cursor = True
+
+    def __init__(self, object_list, per_page, field='pub_date',
+                 direction=None, cursor=None):
+        super().__init__(object_list, per_page)
+        self.field = field
+        self.direction = direction if cursor else None
+        self.cursor = cursor
+
+    def _key(self, obj):
+        if isinstance(obj, dict):
+            return obj[self.field], obj['id']
+        return getattr(obj, self.field), obj.pk
+
+    def _seek(self, queryset):
+        field, pk = self.field, 'pk'
+        if self.direction is None:
+            return queryset.order_by(f'-{field}', f'-{pk}')
+        value, cursor_pk = self.cursor
+        if self.direction == AFTER:
+            condition = Q(**{f'{field}__lte': value}) & (
+                Q(**{f'{field}__lt': value}) | Q(**{f'{pk}__lt': cursor_pk}))
+            return queryset.filter(condition).order_by(f'-{field}',
+                                                       f'-{pk}')
+        condition = Q(**{f'{field}__gte': value}) & (
+            Q(**{f'{field}__gt': value}) | Q(**{f'{pk}__gt': cursor_pk}))
+        return queryset.filter(condition).order_by(field, pk)
+
+    @cached_property
+    def _window(self):
+        """Строки страницы и признак того, что за ней есть ещё строки."""
+        rows = list(self._seek(self.object_list)[:self.per_page + 1])
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if self.direction == BEFORE:
+            rows.reverse()
+        return rows, has_more
+
+    @property
+    def rows(self):
+        return self._window[0]
+
+    @property
+    def has_next(self):
+        if self.direction == BEFORE:
+            return True
+        return self._window[1]
+
+    @property
+    def has_previous(self):
+        if self.direction == BEFORE:
+            return self._window[1]
+        return self.direction == AFTER
+
+    @property
+    def next_cursor(self):
+        if not self.has_next or not self.rows:
+            return None
+        return encode_cursor(*self._key(self.rows[-1]))
+
+    @property
+    def previous_cursor(self):
+        if not self.has_previous or not self.rows:
+            return None
+        return encode_cursor(*self._key(self.rows[0]))
+
+    @property
+    def count(self):
+        return len(self.rows)
+
+    @property
+    def number(self):
+        return 1 if self.direction is None else 2
+
+    @property
+    def num_pages(self):
+        return self.number + 1 if self.has_next else self.number
+
+    @property
+    def page_range(self):
+        return range(1, self.num_pages + 1)
+
+    def get_page(self, number=None):
+        """Обычная `Page`; строки выбираются при первом обращении."""
+        return Page(LazyRows(self), self.number, self)
+
+
+def estimated_count(queryset):
+    """Количество строк queryset; для таблицы без фильтров — оценка.
+
+    Без условий количество оценивается по разбросу первичного ключа:
+    два поиска по индексу вместо COUNT(*) по всей таблице. Удалённые
+    строки оценка не учитывает, поэтому она бывает завышена. В шарде
+    заняты только id его бакетов, и разброс умножается на их долю.
+    """
+    if queryset.query.has_filters() or queryset.query.distinct:
+        return queryset.count()
+    bounds = queryset.order_by().aggregate(low=Min('pk'), high=Max('pk'))
+    if bounds['high'] is None:
+        return 0
+    span = bounds['high'] - bounds['low'] + 1
+    if queryset.model in shards.SHARDED:
+        span = max(1, round(span * shards.share(queryset.db)))
+    return span
+
+
+class EstimatedCountPaginator(Paginator):
+    """Паджинатор больших списков: общее количество строк оценивается,
+    а не считается (см. `estimated_count`)."""
+
+    @cached_property
+    def count(self):
+        return estimated_count(self.object_list)
+
+
+class LazyRows(Sequence):
+    """Строки курсорной страницы, которые запрашиваются лениво.
+
+    Пока шаблон не обратился к строкам, запрос не выполняется, поэтому
+    страница, отданная из кэша, не обращается к базе вовсе.
+    """
+
+    def __init__(self, paginator):
+        self.paginator = paginator
+
+    def __getitem__(self, index):
+        return self.paginator.rows[index]
+
+    def __len__(self):
+        return len(self.paginator.rows)
+
+
+class MappedRows(Sequence):
+    """Лениво применяет `func` к строкам страницы."""
+
+    def __init__(self, rows, func):
+        self.source = rows
+        self.func = func
+
+    @cached_property
+    def rows(self):
+        return [self.func(row) for row in self.source]
+
+    def __getitem__(self, index):
+        return self.rows[index]
+
+    def __len__(self):
+        return len(self.rows)
+
+
+def cursor_from_request(request, field='pub_date'):
+    """Возвращает направление и ключ курсора из ?after= / ?before=."""
+    for direction in (AFTER, BEFORE):
+        token = request.GET.get(direction)
+        if token:
+            cursor = decode_cursor(token, field)
+            if cursor is not None:
+                return direction, cursor
+    return None, None
+
+
+def cursor_paginate(queryset, request, per_page, field='pub_date'):
+    """Курсорная страница по ?after= / ?before=."""
+    direction, cursor = cursor_from_request(request, field)
+    paginator = CursorPaginator(queryset, per_page, field=field,
+                                direction=direction, cursor=cursor)
+    return paginator.get_page()
 
 
 def paginator_utils(queryset, request,
-                    number_of_posts=settings.NUMBER_OF_POSTS):
-    paginator = Paginator(queryset, number_of_posts)
+                    number_of_posts=settings.NUMBER_OF_POSTS,
+                    field='pub_date'):
+    """Страница ленты: по номеру для ?page=N, иначе по курсору."""
     page_number = request.GET.get('page')
-    return paginator.get_page(page_number)
+    if page_number is not None:
+        paginator = Paginator(queryset, number_of_posts)
+        return paginator.get_page(page_number)
+    return cursor_paginate(queryset, request, number_of_posts, field)
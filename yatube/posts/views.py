@@ -1,51 +1,161 @@
+from django.conf import settings
 from django.contrib.auth.decorators import login_required
+from django.db import transaction
 from django.shortcuts import get_object_or_404, redirect, render
+from django.views.decorators.http import condition
 
-from .forms import CommentForm, PostForm
-from .models import Follow, Group, Post, User
-from .utils import paginator_utils
+from core.db import retry_on_lock
+from core.routers import primary
 
+from . import caching, feeds, shards, thumbnails
+from .forms import CommentForm, PostForm, SearchForm
+from .models import Comment, Follow, Group, Inbox, Post, User
+from .search import ranked
+from .stats import COUNTERS, get_stats
+from .utils import MappedRows, cursor_paginate, paginator_utils
 
+
+def index_etag(request):
+    return caching.etag(caching.feed_key(request, 'index', 'index'))
+
+
+def group_etag(request, slug):
+    group = (Group.objects.filter(slug=slug)
+             .values_list('pk', 'title', 'description').first())
+    if group is None:
+        return None
+    return caching.etag(
+        caching.feed_key(request, 'group_posts', f'group:{group[0]}'),
+        *group)
+
+
+def profile_etag(request, username):
+    author = (User.objects.filter(username=username)
+              .values_list('pk', 'first_name', 'last_name',
+                           *(f'stats__{name}' for name in COUNTERS))
+              .first())
+    if author is None:
+        return None
+    return caching.etag(
+        caching.feed_key(request, 'profile', f'author:{author[0]}'),
+        *author)
+
+
+def post_detail_etag(request, post_id):
+    post = (Post.objects.using(shards.for_post(post_id)).filter(pk=post_id)
+            .values_list('author_id', 'updated').first())
+    if post is None:
+        return None
+    author_id, updated = post
+    return caching.etag(
+        caching.feed_key(request, 'post_detail', f'post:{post_id}',
+                         f'author:{author_id}'),
+        updated.isoformat())
+
+
+@condition(etag_func=index_etag)
 def index(request):
     context = {
         'page_obj': paginator_utils(
-            Post.objects.select_related('author', 'group'), request)
+            feeds.build_posts(Post.objects.all(), request.user), request),
+        'feed_key': caching.feed_key(request, 'index', 'index'),
     }
     return render(request, 'posts/index.html', context)
 
 
+@condition(etag_func=group_etag)
 def group_posts(request, slug):
     group = get_object_or_404(Group, slug=slug)
-    posts = group.posts.select_related('author')
     context = {
         'group': group,
-        'page_obj': paginator_utils(posts, request)
+        'page_obj': paginator_utils(
+            feeds.build_posts(group.posts.all(), request.user), request),
+        'feed_key': caching.feed_key(request, 'group_posts',
+                                     f'group:{group.pk}'),
     }
     return render(request, 'posts/group_list.html', context)
 
 
+@condition(etag_func=profile_etag)
 def profile(request, username):
-    author = get_object_or_404(User, username=username)
+    author = get_object_or_404(User.objects.select_related('stats'),
+                               username=username)
     following = (request.user.is_authenticated
                  and Follow.objects.filter(user=request.user,
                                            author=author).exists())
     context = {
         'author': author,
+        'stats': get_stats(author),
         'page_obj': paginator_utils(
-            author.posts.select_related('author'), request),
+            feeds.build_posts(author.posts.all(), request.user,
+                              authors=[author.pk]), request),
+        'feed_key': caching.feed_key(request, 'profile',
+                                     f'author:{author.pk}'),
         'following': following
     }
     return render(request, 'posts/profile.html', context)
 
 
+def search(request):
+    form = SearchForm(request.GET or None)
+    page_obj = None
+    if form.is_valid() and form.cleaned_data['q']:
+        posts = Post.objects.all()
+        authors = None
+        if form.cleaned_data['group']:
+            posts = posts.filter(group=form.cleaned_data['group'])
+        if form.cleaned_data['author']:
+            # Id автора, а не соединение: пользователи лежат в основной
+            # базе, а посты могут лежать в шардах
+            authors = list(User.objects.filter(
+                username=form.cleaned_data['author'])
+                .values_list('pk', flat=True))
+            posts = posts.filter(author_id__in=authors)
+        posts = feeds.build_posts(ranked(posts, form.cleaned_data['q']),
+                                  request.user, authors=authors)
+        page_obj = cursor_paginate(posts, request, settings.NUMBER_OF_POSTS,
+                                   field='score')
+    query = request.GET.copy()
+    for name in caching.PAGE_PARAMS:
+        query.pop(name, None)
+    context = {'form': form, 'page_obj': page_obj,
+               'query': query.urlencode()}
+    return render(request, 'posts/search.html', context)
+
+
+@shards.redirect_moved
+@condition(etag_func=post_detail_etag)
 def post_detail(request, post_id):
-    post = get_object_or_404(Post, id=post_id)
+    posts = Post.objects.using(shards.for_post(post_id))
+    post = get_object_or_404(
+        shards.related(posts, 'author__stats', 'group'), id=post_id)
     context = {'post': post,
+               'stats': get_stats(post.author),
+               'comments': comments_page(request, post.pk),
                'form': CommentForm()}
     return render(request, 'posts/post_detail.html', context)
 
 
+def comments_page(request, post_id):
+    comments = (Comment.objects.using(shards.for_post(post_id))
+                .filter(post_id=post_id))
+    return cursor_paginate(shards.related(comments, 'author'),
+                           request, settings.COMMENTS_PER_PAGE)
+
+
+@shards.redirect_moved
+def post_comments(request, post_id):
+    """Следующая порция комментариев поста HTML-фрагментом."""
+    post = get_object_or_404(
+        Post.objects.using(shards.for_post(post_id)).only('pk'), pk=post_id)
+    context = {'post': post, 'comments': comments_page(request, post.pk)}
+    return render(request, 'includes/comments_page.html', context)
+
+
 @login_required
+@primary
+@retry_on_lock
+@transaction.atomic
 def post_create(request):
     form = PostForm(
         request.POST,
@@ -55,47 +165,88 @@ def post_create(request):
         return render(request, 'posts/create_post.html', {'form': form})
     post = form.save(commit=False)
     post.author = request.user
-    post.save()
+    with shards.atomic(shards.for_author(post.author_id)):
+        post.save()
+    thumbnails.schedule(post)
     return redirect('posts:profile', request.user)
 
 
+@shards.redirect_moved
 @login_required
+@primary
+@retry_on_lock
+@transaction.atomic
 def post_edit(request, post_id):
-    post = get_object_or_404(Post, pk=post_id)
-    if post.author != request.user:
-        return redirect('posts:post_detail', post.id)
-    form = PostForm(
-        request.POST or None,
-        files=request.FILES or None,
-        instance=post
-    )
-    if not form.is_valid():
-        return render(request, 'posts/create_post.html',
-                      {'form': form, 'post': post})
-    post = form.save()
+    alias = shards.for_post(post_id)
+    # Чтение и запись поста — в одной транзакции шарда: иначе save()
+    # затрёт счётчик комментариев, увеличенный после чтения
+    with shards.atomic(alias):
+        post = get_object_or_404(
+            Post.objects.using(alias).select_for_update(), pk=post_id)
+        if post.author_id != request.user.pk:
+            return redirect('posts:post_detail', post.id)
+        form = PostForm(
+            request.POST or None,
+            files=request.FILES or None,
+            instance=post
+        )
+        if not form.is_valid():
+            return render(request, 'posts/create_post.html',
+                          {'form': form, 'post': post})
+        post = form.save(commit=False)
+        if 'image' in form.changed_data:
+            thumbnails.reset(post)
+        post.save()
+    if 'image' in form.changed_data:
+        thumbnails.schedule(post)
     return redirect('posts:post_detail', post_id)
 
 
 @login_required
+@primary
+@retry_on_lock
+@transaction.atomic
 def add_comment(request, post_id):
-    post = get_object_or_404(Post, pk=post_id)
+    post = get_object_or_404(Post.objects.using(shards.for_post(post_id)),
+                             pk=post_id)
     form = CommentForm(request.POST or None)
     if form.is_valid():
         comment = form.save(commit=False)
         comment.author = request.user
         comment.post = post
-        comment.save()
+        with shards.atomic(shards.for_post(post.pk)):
+            comment.save()
     return redirect('posts:post_detail', post_id=post_id)
 
 
 @login_required
 def follow_index(request):
-    context = {'page_obj': paginator_utils(Post.objects.filter(
-        author__following__user=request.user), request)}
+    if shards.enabled():
+        # Inbox ведётся только без шардов: ленту сливаем из шардов авторов
+        authors = (Follow.objects.filter(user=request.user)
+                   .values_list('author_id', flat=True))
+        page_obj = paginator_utils(
+            feeds.build_posts(Post.objects.all(), request.user,
+                              authors=authors), request)
+    else:
+        entries = feeds.build(Inbox.objects.filter(user=request.user),
+                              request.user, prefix='post__',
+                              fields=('pub_date', 'post'))
+        page_obj = paginator_utils(entries, request)
+        page_obj.object_list = MappedRows(page_obj.object_list,
+                                          feeds.unwrap)
+    context = {
+        'page_obj': page_obj,
+        'feed_key': caching.feed_key(request, 'follow_index',
+                                     f'inbox:{request.user.pk}'),
+    }
     return render(request, 'posts/follow.html', context)
 
 
 @login_required
+@primary
+@retry_on_lock
+@transaction.atomic
 def profile_follow(request, username):
     author = get_object_or_404(User, username=username)
     user = request.user
@@ -105,6 +256,9 @@ def profile_follow(request, username):
 
 
 @login_required
+@primary
+@retry_on_lock
+@transaction.atomic
 def profile_unfollow(request, username):
     get_object_or_404(Follow, user=request.user,
                       author__username=username).delete()
@@ -45,12 +45,16 @@ INSTALLED_APPS = [
     'users.apps.UsersConfig',
     'core.apps.CoreConfig',
     'about.apps.AboutConfig',
+    'api.apps.ApiConfig',
     'sorl.thumbnail',
 ]
 
 STATICFILES_DIRS = (os.path.join(BASE_DIR, 'static'),)
 
 MIDDLEWARE = [
+    'core.middleware.TimingMiddleware',
+    'core.middleware.QueryInspectorMiddleware',
+    'core.middleware.ReplicaMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -89,8 +93,60 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
-    }
+        # Соединение живёт между запросами: PRAGMA не выполняются заново
+        'CONN_MAX_AGE': 600,
+    },
+    # Реплика для чтения; локально это копия основной базы, которую
+    # обновляет `manage.py replicate --interval 5`
+    'replica': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.path.join(BASE_DIR, 'db.replica.sqlite3'),
+        'CONN_MAX_AGE': 600,
+        'TEST': {'MIRROR': 'default'},
+    },
+    # Шарды постов и комментариев; схему в них создаёт
+    # `manage.py migrate --database shard_1`
+    'shard_1': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.path.join(BASE_DIR, 'db.shard_1.sqlite3'),
+        'CONN_MAX_AGE': 600,
+    },
+    'shard_2': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.path.join(BASE_DIR, 'db.shard_2.sqlite3'),
+        'CONN_MAX_AGE': 600,
+    },
+}
+DATABASE_ROUTERS = ['posts.shards.ShardRouter',
+                    'core.routers.PrimaryReplicaRouter']
+# Базы, между которыми посты и комментарии делятся по автору поста:
+# автор попадает в POST_SHARDS[бакет % len(POST_SHARDS)], где бакет —
+# author_id % SHARD_BUCKETS. Пусто — всё хранится в основной базе.
+# После изменения списка нужен `manage.py reshard_posts`.
+POST_SHARDS = []
+# Бакеты зашиты в id постов, поэтому их число менять нельзя
+SHARD_BUCKETS = 64
+# Из каких баз читать; пусто — всё читается из основной
+DATABASE_REPLICAS = []
+# Сколько секунд после записи пользователь читает из основной базы
+REPLICA_PIN_SECONDS = 5
+REPLICA_PIN_COOKIE = 'primary_db'
+
+# Выполняются при каждом новом соединении с SQLite (core.db.configure).
+# WAL: читатели не ждут писателя; NORMAL в WAL не теряет целостность,
+# только последние транзакции при отключении питания; cache_size в КиБ
+# (отрицательное значение), mmap_size в байтах, busy_timeout в мс
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'busy_timeout': 5000,
+    'cache_size': -64000,
+    'mmap_size': 256 * 1024 * 1024,
+    'temp_store': 'MEMORY',
 }
+# Повтор записи при «database is locked»: попыток и первая пауза, с
+DB_RETRY_ATTEMPTS = 5
+DB_RETRY_DELAY = 0.05
 
 # Password validation
 # https://docs.djangoproject.com/en/2.2/ref/settings/#auth-password-validators
@@ -136,15 +192,93 @@ EMAIL_BACKEND = 'django.core.mail.backends.filebased.EmailBackend'
 EMAIL_FILE_PATH = os.path.join(BASE_DIR, 'sent_emails')
 
 NUMBER_OF_POSTS = 10
+COMMENTS_PER_PAGE = 20
 POST_COUNT = 10
 
+# Лента подписок: сколько постов хранится у подписчика
+INBOX_SIZE = 1000
+INBOX_BATCH_SIZE = 500
+
+# Выгрузка: сколько строк читать из базы за один запрос
+EXPORT_CHUNK_SIZE = 2000
+
+# Сколько потоков строят миниатюры; 0 — строить сразу после сохранения
+THUMBNAIL_WORKERS = 2
+# Ширины картинок поста для srcset; миниатюры в формате исходника
+POST_IMAGE_WIDTHS = (320, 640, 960, 1920)
+THUMBNAIL_PRESERVE_FORMAT = True
+
+# Загрузка картинок: предельный размер файла и картинки, до какой
+# стороны ужимать и с каким качеством пересжимать. JPEG декодируется
+# сразу уменьшенным, а PNG, GIF и WebP — целиком (до 4 байт на пиксель),
+# поэтому для них предел пикселей ниже
+POST_IMAGE_MAX_UPLOAD_SIZE = 20 * 1024 * 1024
+POST_IMAGE_MAX_PIXELS = 50_000_000
+POST_IMAGE_MAX_DECODED_PIXELS = 16_000_000
+POST_IMAGE_MAX_SIDE = 1920
+POST_IMAGE_QUALITY = 85
+
+# Доля запросов, для которых считается разбивка времени: заголовок
+# Server-Timing и строка JSON в логе core.timing
+REQUEST_TIMING_SAMPLE_RATE = 0.1
+
+# Поиск N+1 и медленных запросов (всегда работает при DEBUG): с
+# какого числа повторов одного вида запроса и с какой длительности (мс)
+# писать в логи core.queries и core.slow_queries
+QUERY_INSPECTOR = False
+QUERY_REPEAT_THRESHOLD = 3
+SLOW_QUERY_MS = 100
+SLOW_QUERY_LOG = os.path.join(BASE_DIR, 'slow_queries.log')
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+        'slow_queries': {
+            'class': 'logging.handlers.RotatingFileHandler',
+            'filename': SLOW_QUERY_LOG,
+            'maxBytes': 5 * 1024 * 1024,
+            'backupCount': 5,
+            'encoding': 'utf-8',
+            'delay': True,
+        },
+    },
+    'loggers': {
+        'core.timing': {
+            'handlers': ['console'],
+            'level': 'INFO',
+            'propagate': False,
+        },
+        'core.queries': {
+            'handlers': ['console'],
+            'level': 'WARNING',
+            'propagate': False,
+        },
+        'core.slow_queries': {
+            'handlers': ['slow_queries'],
+            'level': 'WARNING',
+            'propagate': False,
+        },
+    },
+}
+
 CSRF_FAILURE_VIEW = 'core.views.csrf_failure'
 
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Один кэш на все процессы-воркеры: файл SQLite в режиме WAL
+# (core/cache.py). Объём ограничен MAX_BYTES, лишнее вытесняется по LRU
 CACHES = {
     'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'BACKEND': 'core.cache.SQLiteCache',
+        'LOCATION': os.path.join(BASE_DIR, 'cache.sqlite3'),
+        'OPTIONS': {'MAX_BYTES': 64 * 1024 * 1024},
     }
 }
+# Тесты получают свой файл кэша, удаляемый при выходе, и не пишут
+# строки замера времени (core/testing.py)
+TEST_RUNNER = 'core.testing.TestRunner'